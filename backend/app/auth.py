@@ -6,9 +6,10 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.bd import get_db, User
-from app.crud import get_user_by_id
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.bd import get_async_db, User
+from app.crud_async import get_user_by_id
+from app.cache import auth_cache
 
 # Настройки JWT
 SECRET_KEY = "your-secret-key-here-change-in-production-123456789"  # В продакшене использовать переменную окружения
@@ -60,16 +61,53 @@ def decode_access_token(token: str) -> Optional[dict]:
         return None
 
 
+async def get_user_from_token(db: AsyncSession, token: str) -> Optional[User]:
+    """
+    Получение пользователя по токену с использованием кеша
+    
+    JWT декодируется и пользователь загружается из БД только при промахе кеша.
+    
+    Args:
+        db: Асинхронная сессия базы данных
+        token: JWT токен
+    
+    Returns:
+        User: Пользователь или None, если токен невалиден или пользователь не найден
+    """
+    user_id = auth_cache.get_token(token)
+    
+    if user_id is None:
+        payload = decode_access_token(token)
+        if payload is None:
+            return None
+        
+        try:
+            user_id = int(payload.get("sub"))
+        except (ValueError, TypeError):
+            return None
+        
+        auth_cache.put_token(token, user_id, payload.get("exp"))
+    
+    user = auth_cache.get_user(user_id)
+    if user is None:
+        user = await get_user_by_id(db, user_id=user_id)
+        if user is None:
+            return None
+        user = auth_cache.put_user(user)
+    
+    return user
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """
     Получение текущего пользователя из токена
     
     Args:
         credentials: HTTP Bearer токен
-        db: Сессия базы данных
+        db: Асинхронная сессия базы данных
     
     Returns:
         User: Текущий пользователь
@@ -83,22 +121,7 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token = credentials.credentials
-    payload = decode_access_token(token)
-    
-    if payload is None:
-        raise credentials_exception
-    
-    user_id_str: str = payload.get("sub")
-    if user_id_str is None:
-        raise credentials_exception
-    
-    try:
-        user_id = int(user_id_str)
-    except (ValueError, TypeError):
-        raise credentials_exception
-    
-    user = get_user_by_id(db, user_id=user_id)
+    user = await get_user_from_token(db, credentials.credentials)
     if user is None:
         raise credentials_exception
     
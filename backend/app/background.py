@@ -0,0 +1,49 @@
+"""
+Фоновые задачи, которые никто не ждет
+
+Таймеры (call_later) запускают корутины через ensure_future, и результат
+некому дождаться. Если не хранить ссылку на задачу, ее может собрать
+сборщик мусора посреди работы, а ошибка появится только как
+"Task exception was never retrieved". BackgroundTasks держит ссылки
+до завершения задач, пишет их ошибки в лог и считает их.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Set
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """
+    Группа фоновых задач
+
+    Args:
+        description: Что делают задачи (для сообщения об ошибке в логе)
+    """
+
+    def __init__(self, description: str):
+        self.description = description
+        self._tasks: Set[asyncio.Future] = set()
+        self.errors = 0
+
+    def spawn(self, coro: Awaitable) -> asyncio.Future:
+        """Запуск корутины в фоне"""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Future):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logger.error("Ошибка фоновой задачи: %s", self.description, exc_info=task.exception())
+
+    async def drain(self):
+        """Дождаться всех запущенных задач (при остановке сервера)"""
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    def __len__(self):
+        return len(self._tasks)
@@ -0,0 +1,516 @@
+"""
+Боевая карта комнаты: клетки, фишки и пространственный индекс
+
+Карта - сетка width x height клеток по 5 футов. Фишка занимает квадрат
+size x size клеток, (x, y) - ее левая верхняя клетка.
+
+Индексы, чтобы запросы не перебирали все фишки:
+    занятые клетки -> фишка            - проверка столкновений за O(size²)
+    SpatialHash: корзина 8x8 клеток -> фишки - поиск в радиусе и по области
+                                         просматривает только корзины рядом
+
+Расстояние считается по правилам 5e: диагональ тоже 5 футов, то есть
+по Чебышеву до ближайшей клетки фишки. Области заклинаний: sphere
+(радиус от центра клетки), cube (квадрат от угловой клетки),
+cone (конус с шириной, равной длине) и line (линия шириной 5 футов).
+
+Для тумана войны на карте есть стены (клетки, закрывающие обзор и проход)
+и у фишек - дальность зрения vision в футах; видимость считает app.visibility.
+"""
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+FEET_PER_CELL = 5
+MAX_MAP_SIZE = 500
+MAX_TOKENS = 5000
+MAX_TOKEN_SIZE = 4  # Громадное существо - 4x4 клетки
+MAX_NAME_LENGTH = 50
+SPATIAL_HASH_CELL = 8
+MAX_VISION_FEET = 120
+MAX_WALL_CELLS = 10_000  # За одну команду
+
+AREA_SHAPES = ("sphere", "cube", "cone", "line")
+# Конус 5e: ширина на конце равна длине
+_CONE_HALF_ANGLE = math.atan(0.5)
+
+
+class MapError(ValueError):
+    """Некорректная команда для боевой карты"""
+
+
+class SpatialHash:
+    """
+    Разбиение плоскости на квадратные корзины
+
+    Args:
+        cell: Размер корзины в клетках карты
+    """
+
+    def __init__(self, cell: int = SPATIAL_HASH_CELL):
+        self.cell = cell
+        self._buckets: Dict[Tuple[int, int], Set[str]] = {}
+        self._where: Dict[str, Tuple[int, int]] = {}
+
+    def _bucket(self, x: int, y: int) -> Tuple[int, int]:
+        return x // self.cell, y // self.cell
+
+    def insert(self, item: str, x: int, y: int):
+        bucket = self._bucket(x, y)
+        self._buckets.setdefault(bucket, set()).add(item)
+        self._where[item] = bucket
+
+    def remove(self, item: str):
+        bucket = self._where.pop(item)
+        items = self._buckets[bucket]
+        items.discard(item)
+        if not items:
+            del self._buckets[bucket]
+
+    def move(self, item: str, x: int, y: int):
+        bucket = self._bucket(x, y)
+        if self._where.get(item) != bucket:
+            self.remove(item)
+            self.insert(item, x, y)
+
+    def query(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[str]:
+        """Элементы из корзин, пересекающих прямоугольник (включительно); точную проверку делает вызывающий"""
+        bx0, by0 = self._bucket(x0, y0)
+        bx1, by1 = self._bucket(x1, y1)
+        for bx in range(bx0, bx1 + 1):
+            for by in range(by0, by1 + 1):
+                yield from self._buckets.get((bx, by), ())
+
+    def __len__(self):
+        return len(self._where)
+
+
+@dataclass
+class Token:
+    """Фишка на карте"""
+    id: str
+    name: str
+    x: int
+    y: int
+    size: int = 1
+    owner_id: Optional[int] = None
+    vision: int = 0
+
+    def cells(self) -> Iterator[Tuple[int, int]]:
+        for dx in range(self.size):
+            for dy in range(self.size):
+                yield self.x + dx, self.y + dy
+
+    def distance(self, x: int, y: int) -> int:
+        """Расстояние в клетках от клетки (x, y) до ближайшей клетки фишки"""
+        dx = max(self.x - x, 0, x - (self.x + self.size - 1))
+        dy = max(self.y - y, 0, y - (self.y + self.size - 1))
+        return max(dx, dy)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "x": self.x,
+            "y": self.y,
+            "size": self.size,
+            "owner_id": self.owner_id,
+            "vision": self.vision,
+        }
+
+
+def _integer(value, name: str) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise MapError(f"{name} должно быть целым числом")
+    return value
+
+
+def _vision(value) -> int:
+    value = _integer(value, "vision")
+    if not 0 <= value <= MAX_VISION_FEET:
+        raise MapError(f"Дальность зрения должна быть от 0 до {MAX_VISION_FEET} футов")
+    return value
+
+
+def _feet_to_cells(feet, limit: int) -> int:
+    """Футы -> клетки; больше limit клеток не бывает (дальше края карты искать нечего)"""
+    if isinstance(feet, bool) or not isinstance(feet, (int, float)) or not math.isfinite(feet) or feet < 0:
+        raise MapError("Расстояние должно быть неотрицательным числом футов")
+    return int(min(feet // FEET_PER_CELL, limit))
+
+
+def _sector_box(x: int, y: int, length: int, angle: float, half_angle: float) -> Tuple[int, int, int, int]:
+    """
+    Прямоугольник, содержащий сектор (конус) или отрезок (линию при half_angle=0)
+
+    Дальние точки конуса лежат на дуге радиуса length / cos(half_angle);
+    крайние точки дуги - ее концы и пересечения с осями координат.
+    Прямоугольник расширен на клетку, чтобы не потерять клетки у границы.
+    """
+    radius = length / math.cos(half_angle)
+    angles = [angle - half_angle, angle + half_angle]
+    for quarter in range(math.ceil((angle - half_angle) / (math.pi / 2)), math.floor((angle + half_angle) / (math.pi / 2)) + 1):
+        angles.append(quarter * math.pi / 2)
+    xs = [x] + [x + radius * math.cos(a) for a in angles]
+    ys = [y] + [y + radius * math.sin(a) for a in angles]
+    return math.floor(min(xs)) - 1, math.floor(min(ys)) - 1, math.ceil(max(xs)) + 1, math.ceil(max(ys)) + 1
+
+
+class BattleMap:
+    """
+    Сетка карты с фишками
+
+    Args:
+        width: Ширина в клетках
+        height: Высота в клетках
+    """
+
+    def __init__(self, width: int, height: int):
+        width, height = _integer(width, "width"), _integer(height, "height")
+        if not (1 <= width <= MAX_MAP_SIZE and 1 <= height <= MAX_MAP_SIZE):
+            raise MapError(f"Размер карты должен быть от 1 до {MAX_MAP_SIZE} клеток")
+        self.width = width
+        self.height = height
+        self._tokens: Dict[str, Token] = {}
+        self._occupied: Dict[Tuple[int, int], str] = {}
+        self._index = SpatialHash()
+        self._counter = 0
+        # Номер последней команды: при синхронизации воркеров побеждает больший
+        self.version = 0
+        # Самая большая фишка: насколько расширять область поиска влево-вверх
+        self._max_size = 1
+        self.walls: Set[Tuple[int, int]] = set()
+        # Растет при каждом изменении стен
+        self.walls_version = 0
+        self.fog = False
+
+    # --- Фишки ---
+
+    def token(self, token_id) -> Token:
+        if not isinstance(token_id, str):
+            raise MapError("ID фишки должен быть строкой")
+        token = self._tokens.get(token_id)
+        if token is None:
+            raise MapError(f"Фишка не найдена: {token_id}")
+        return token
+
+    def is_free(self, x: int, y: int, size: int = 1, ignore: Optional[str] = None) -> bool:
+        """Помещается ли фишка size x size в (x, y): в пределах карты, не на стене и без наложения на другие"""
+        if x < 0 or y < 0 or x + size > self.width or y + size > self.height:
+            return False
+        for dx in range(size):
+            for dy in range(size):
+                occupant = self._occupied.get((x + dx, y + dy))
+                if occupant is not None and occupant != ignore:
+                    return False
+                if (x + dx, y + dy) in self.walls:
+                    return False
+        return True
+
+    def _occupy(self, token: Token):
+        for cell in token.cells():
+            self._occupied[cell] = token.id
+
+    def _vacate(self, token: Token):
+        for cell in token.cells():
+            del self._occupied[cell]
+
+    def place(self, name: str, x, y, size=1, token_id: Optional[str] = None, owner_id: Optional[int] = None, vision=0) -> Token:
+        """
+        Новая фишка
+
+        Raises:
+            MapError: Клетки заняты, вне карты или параметры некорректны
+        """
+        if not isinstance(name, str) or not 0 < len(name.strip()) <= MAX_NAME_LENGTH:
+            raise MapError(f"Имя фишки должно быть от 1 до {MAX_NAME_LENGTH} символов")
+        x, y, size = _integer(x, "x"), _integer(y, "y"), _integer(size, "size")
+        vision = _vision(vision)
+        if not 1 <= size <= MAX_TOKEN_SIZE:
+            raise MapError(f"Размер фишки должен быть от 1 до {MAX_TOKEN_SIZE}")
+        if len(self._tokens) >= MAX_TOKENS:
+            raise MapError(f"Не больше {MAX_TOKENS} фишек на карте")
+
+        self._counter += 1
+        token_id = str(token_id) if token_id is not None else f"t{self._counter}"
+        if token_id in self._tokens:
+            raise MapError(f"Фишка {token_id} уже есть")
+        if not self.is_free(x, y, size):
+            raise MapError("Место занято или вне карты")
+
+        token = Token(token_id, name.strip(), x, y, size, owner_id if isinstance(owner_id, int) else None, vision)
+        self._tokens[token_id] = token
+        self._occupy(token)
+        self._index.insert(token_id, x, y)
+        self._max_size = max(self._max_size, size)
+        return token
+
+    def move(self, token_id, x, y) -> Token:
+        """
+        Перемещение фишки
+
+        Raises:
+            MapError: Клетки заняты другой фишкой или вне карты
+        """
+        token = self.token(token_id)
+        x, y = _integer(x, "x"), _integer(y, "y")
+        if not self.is_free(x, y, token.size, ignore=token.id):
+            raise MapError("Место занято или вне карты")
+        self._vacate(token)
+        token.x, token.y = x, y
+        self._occupy(token)
+        self._index.move(token.id, x, y)
+        return token
+
+    def remove(self, token_id) -> Token:
+        token = self.token(token_id)
+        del self._tokens[token_id]
+        self._vacate(token)
+        self._index.remove(token_id)
+        return token
+
+    def set_vision(self, token_id, vision) -> Token:
+        token = self.token(token_id)
+        token.vision = _vision(vision)
+        return token
+
+    def set_walls(self, cells, blocked: bool = True) -> List[Tuple[int, int]]:
+        """
+        Поставить (blocked=True) или убрать стены в клетках [[x, y], ...]
+
+        Returns:
+            List: Клетки, которые действительно изменились
+
+        Raises:
+            MapError: Клетка вне карты или занята фишкой
+        """
+        if not isinstance(cells, list) or len(cells) > MAX_WALL_CELLS:
+            raise MapError(f"Нужен список клеток (не больше {MAX_WALL_CELLS})")
+        parsed = []
+        for cell in cells:
+            if not isinstance(cell, (list, tuple)) or len(cell) != 2:
+                raise MapError("Клетка задается как [x, y]")
+            x, y = _integer(cell[0], "x"), _integer(cell[1], "y")
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                raise MapError("Клетка вне карты")
+            if blocked and (x, y) in self._occupied:
+                raise MapError("Клетка занята фишкой")
+            parsed.append((x, y))
+
+        changed = [cell for cell in dict.fromkeys(parsed) if (cell in self.walls) != blocked]
+        if blocked:
+            self.walls.update(changed)
+        else:
+            self.walls.difference_update(changed)
+        if changed:
+            self.walls_version += 1
+        return changed
+
+    # --- Запросы ---
+
+    def _candidates(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Token]:
+        """Фишки, которые могут задевать прямоугольник (с учетом размера фишек)"""
+        reach = self._max_size - 1
+        # Корзины за краем карты пусты - их не перебираем
+        x0, y0 = max(x0 - reach, 0), max(y0 - reach, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return
+        for token_id in self._index.query(x0, y0, x1, y1):
+            yield self._tokens[token_id]
+
+    def tokens_within(self, x: int, y: int, feet) -> List[str]:
+        """Фишки не дальше feet футов от клетки (x, y)"""
+        x, y = _integer(x, "x"), _integer(y, "y")
+        radius = _feet_to_cells(feet, self.width + self.height)
+        return [
+            token.id for token in self._candidates(x - radius, y - radius, x + radius, y + radius)
+            if token.distance(x, y) <= radius
+        ]
+
+    def area(self, shape: str, x: int, y: int, feet, direction: float = 0) -> List[str]:
+        """
+        Фишки, задетые областью заклинания
+
+        Args:
+            shape: sphere, cube, cone или line
+            x, y: Клетка начала области (центр сферы, угол куба, вершина конуса и линии)
+            feet: Радиус сферы, сторона куба, длина конуса или линии
+            direction: Направление конуса и линии в градусах (0 - вправо, 90 - вниз)
+        """
+        if shape not in AREA_SHAPES:
+            raise MapError(f"Неизвестная форма области: {shape}")
+        x, y = _integer(x, "x"), _integer(y, "y")
+        length = _feet_to_cells(feet, self.width + self.height)
+
+        if shape == "cube":
+            return [
+                token.id for token in self._candidates(x, y, x + length - 1, y + length - 1)
+                if token.x <= x + length - 1 and token.x + token.size > x
+                and token.y <= y + length - 1 and token.y + token.size > y
+            ]
+
+        if isinstance(direction, bool) or not isinstance(direction, (int, float)) or not math.isfinite(direction):
+            raise MapError("direction должно быть числом")
+        angle = math.radians(direction % 360)
+        ux, uy = math.cos(angle), math.sin(angle)
+
+        def covers(cx: int, cy: int) -> bool:
+            dx, dy = cx - x, cy - y
+            if shape == "sphere":
+                return dx * dx + dy * dy <= length * length
+            along = dx * ux + dy * uy
+            if along < 0 or along > length:
+                return False
+            across = abs(dx * uy - dy * ux)
+            if shape == "line":
+                return across <= 0.5
+            return (dx == 0 and dy == 0) or across <= along * math.tan(_CONE_HALF_ANGLE)
+
+        if shape == "sphere":
+            box = (x - length, y - length, x + length, y + length)
+        else:
+            box = _sector_box(x, y, length, angle, _CONE_HALF_ANGLE if shape == "cone" else 0)
+        return [
+            token.id for token in self._candidates(*box)
+            if any(covers(cx, cy) for cx, cy in token.cells())
+        ]
+
+    # --- Состояние ---
+
+    def tokens(self) -> Iterable[Token]:
+        return self._tokens.values()
+
+    def snapshot(self) -> dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "fog": self.fog,
+            "walls": sorted(self.walls),
+            "tokens": [token.to_dict() for token in self._tokens.values()],
+        }
+
+    def to_state(self) -> dict:
+        return {**self.snapshot(), "counter": self._counter, "version": self.version}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "BattleMap":
+        battle_map = cls(state["width"], state["height"])
+        battle_map.walls = {tuple(cell) for cell in state["walls"]}
+        battle_map.walls_version = 1 if battle_map.walls else 0
+        battle_map.fog = state["fog"]
+        for data in state["tokens"]:
+            battle_map.place(data["name"], data["x"], data["y"], data["size"], data["id"], data["owner_id"], data["vision"])
+        battle_map._counter = state["counter"]
+        battle_map.version = state["version"]
+        return battle_map
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+class BattleMaps:
+    """
+    Карты комнат и команды к ним
+
+    Команда выполняется целиком детерминированно (в том числе проверка прав),
+    поэтому все воркеры, применяя ее в одном порядке, получают одну карту.
+    """
+
+    def __init__(self):
+        self._maps: Dict[str, BattleMap] = {}
+        self.commands = 0
+
+    def get(self, room_id: str) -> Optional[BattleMap]:
+        return self._maps.get(room_id)
+
+    def execute(self, room_id: str, action: str, args: dict) -> Tuple[str, dict]:
+        """
+        Команда к карте комнаты
+
+        Args:
+            room_id: ID комнаты
+            action: create, place, move, remove, vision, walls, fog или clear
+            args: Параметры команды; actor - ID пользователя, dm - владелец ли он комнаты
+
+        Returns:
+            Tuple: имя события для комнаты и его данные
+
+        Raises:
+            MapError: Некорректная команда или нет прав
+        """
+        actor, is_dm = args.get("actor"), bool(args.get("dm"))
+        if action in ("create", "clear", "walls", "fog") and not is_dm:
+            raise MapError("Картой управляет только мастер")
+
+        if action == "create":
+            previous = self._maps.get(room_id)
+            self._maps[room_id] = BattleMap(args.get("width"), args.get("height"))
+            self._maps[room_id].version = previous.version + 1 if previous else 1
+            self.commands += 1
+            return "map_state", {"room_id": room_id, **self._maps[room_id].snapshot()}
+        if action == "clear":
+            self._maps.pop(room_id, None)
+            self.commands += 1
+            return "map_state", {"room_id": room_id, "width": 0, "height": 0, "fog": False, "walls": [], "tokens": []}
+
+        battle_map = self._maps.get(room_id)
+        if battle_map is None:
+            raise MapError("В комнате нет карты")
+
+        if action == "place":
+            owner_id = args.get("owner_id") if is_dm else actor
+            token = battle_map.place(args.get("name"), args.get("x"), args.get("y"), args.get("size", 1), args.get("id"), owner_id, args.get("vision", 0))
+            result = ("token_placed", {"room_id": room_id, "token": token.to_dict()})
+        elif action == "walls":
+            blocked = bool(args.get("blocked", True))
+            changed = battle_map.set_walls(args.get("cells"), blocked)
+            result = ("map_walls", {"room_id": room_id, "cells": changed, "blocked": blocked})
+        elif action == "fog":
+            battle_map.fog = bool(args.get("enabled"))
+            result = ("map_state", {"room_id": room_id, **battle_map.snapshot()})
+        elif action in ("move", "remove", "vision"):
+            token = battle_map.token(args.get("id"))
+            if not is_dm and token.owner_id != actor:
+                raise MapError("Можно двигать только свои фишки")
+            if action == "move":
+                battle_map.move(token.id, args.get("x"), args.get("y"))
+                result = ("token_moved", {"room_id": room_id, "id": token.id, "x": token.x, "y": token.y})
+            elif action == "vision":
+                battle_map.set_vision(token.id, args.get("vision"))
+                result = ("token_updated", {"room_id": room_id, "token": token.to_dict()})
+            else:
+                battle_map.remove(token.id)
+                result = ("token_removed", {"room_id": room_id, "id": token.id})
+        else:
+            raise MapError(f"Неизвестная команда: {action}")
+
+        battle_map.version += 1
+        self.commands += 1
+        return result
+
+    def snapshot(self, room_id: str) -> Optional[dict]:
+        battle_map = self._maps.get(room_id)
+        return {"room_id": room_id, **battle_map.snapshot()} if battle_map else None
+
+    def drop(self, room_id: str):
+        """Забыть карту удаленной комнаты"""
+        self._maps.pop(room_id, None)
+
+    def states(self) -> Dict[str, dict]:
+        return {room_id: battle_map.to_state() for room_id, battle_map in self._maps.items()}
+
+    def load(self, room_id: str, state: dict) -> bool:
+        """Карта с другого воркера (принимается, если она новее)"""
+        battle_map = self._maps.get(room_id)
+        if battle_map is not None and battle_map.version >= state["version"]:
+            return False
+        self._maps[room_id] = BattleMap.from_state(state)
+        return True
+
+    def metrics(self) -> dict:
+        return {
+            "maps": len(self._maps),
+            "tokens": sum(len(battle_map) for battle_map in self._maps.values()),
+            "commands": self.commands,
+        }
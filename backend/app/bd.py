@@ -1,23 +1,91 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime
+import logging
+
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, DateTime
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datetime import datetime
-import os
+from app.config import DatabaseSettings, load_database_settings
+
+# Настройки базы данных (URL, пул, PRAGMA) берутся из окружения, см. app/config.py
+settings = load_database_settings()
+DATABASE_URL = settings.url
+ASYNC_DATABASE_URL = settings.async_url
+
+
+def _engine_kwargs(db_settings: DatabaseSettings) -> dict:
+    """Общие параметры для синхронного и асинхронного движков"""
+    # echo=True добавил бы собственный синхронный вывод в stdout,
+    # поэтому SQL пишется через общие логи (см. _configure_sql_logging)
+    kwargs = {"echo": False}
+    if db_settings.is_sqlite:
+        kwargs["connect_args"] = {"check_same_thread": False}  # Необходимо для SQLite
+    if not db_settings.is_memory:
+        # Для SQLite в памяти используется собственный пул без этих параметров
+        kwargs.update(
+            pool_size=db_settings.pool_size,
+            max_overflow=db_settings.max_overflow,
+            pool_recycle=db_settings.pool_recycle,
+            pool_pre_ping=not db_settings.is_sqlite
+        )
+    return kwargs
+
+
+def _configure_sql_logging(db_settings: DatabaseSettings):
+    """Логирование SQL-запросов через общие обработчики логов (DB_ECHO)"""
+    if db_settings.echo:
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+
+def _install_sqlite_pragmas(sync_engine, db_settings: DatabaseSettings):
+    """Применение PRAGMA к каждому новому соединению SQLite"""
+    pragmas = db_settings.sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def build_engine(db_settings: DatabaseSettings):
+    """Создание синхронного движка по настройкам"""
+    sync_engine = create_engine(db_settings.url, **_engine_kwargs(db_settings))
+    if db_settings.is_sqlite:
+        _install_sqlite_pragmas(sync_engine, db_settings)
+    return sync_engine
+
 
-# Путь к базе данных SQLite
-# Используем абсолютный путь относительно папки backend
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'dnd_app.db')}"
+def build_async_engine(db_settings: DatabaseSettings):
+    """Создание асинхронного движка по настройкам"""
+    engine_async = create_async_engine(db_settings.async_url, **_engine_kwargs(db_settings))
+    if db_settings.is_sqlite:
+        _install_sqlite_pragmas(engine_async.sync_engine, db_settings)
+    return engine_async
+
+
+_configure_sql_logging(settings)
 
 # Создание движка базы данных
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False},  # Необходимо для SQLite
-    echo=True  # Логирование SQL запросов (можно отключить в продакшене)
-)
+engine = build_engine(settings)
 
 # Создание фабрики сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок для endpoints и Socket.IO (не блокирует event loop)
+async_engine = build_async_engine(settings)
+
+# Фабрика асинхронных сессий
+# expire_on_commit=False: после commit объекты остаются читаемыми без повторного SELECT
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Базовый класс для моделей
 Base = declarative_base()
 
@@ -51,6 +119,15 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Генератор для получения асинхронной сессии базы данных.
+    Используется как зависимость в async FastAPI endpoints.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """
     Инициализация базы данных.
@@ -0,0 +1,132 @@
+"""
+Кеш проверенных токенов и пользователей
+
+Каждый запрос с авторизацией и каждое подключение Socket.IO заново декодируют
+JWT и выполняют SELECT пользователя. Кеш хранит результат декодирования по
+токену и снимок пользователя по ID с LRU-вытеснением и ограниченным TTL.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.bd import User
+
+# Настройки кеша (можно переопределить через переменные окружения)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+
+
+class LRUCache:
+    """Простой LRU-кеш с TTL для каждой записи"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max(1, max_size)
+        self._data: "OrderedDict[object, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Получить значение или None, если записи нет или она устарела"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires_at: float):
+        """Сохранить значение до момента expires_at (unix time)"""
+        if expires_at <= time.time():
+            return
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        """Удалить запись"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Очистить кеш"""
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _snapshot_user(user: User) -> User:
+    """
+    Копия пользователя, не привязанная ни к одной сессии
+
+    Объект из сессии нельзя держать в кеше: после commit в этой сессии
+    его атрибуты истекают и чтение из другого запроса упадет.
+    """
+    return User(**{column.name: getattr(user, column.name) for column in User.__table__.columns})
+
+
+class AuthCache:
+    """Кеш токен -> ID пользователя и ID -> пользователь"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.ttl = ttl
+        self._tokens = LRUCache(max_size)
+        self._users = LRUCache(max_size)
+
+    def get_token(self, token: str) -> Optional[int]:
+        """ID пользователя для уже проверенного токена"""
+        return self._tokens.get(token)
+
+    def put_token(self, token: str, user_id: int, exp: Optional[float]):
+        """
+        Запомнить проверенный токен
+
+        Запись живет не дольше TTL и не дольше срока действия токена (exp).
+        """
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        self._tokens.set(token, user_id, expires_at)
+
+    def get_user(self, user_id: int) -> Optional[User]:
+        """Снимок пользователя из кеша"""
+        return self._users.get(user_id)
+
+    def put_user(self, user: User) -> User:
+        """Сохранить снимок пользователя и вернуть его"""
+        snapshot = _snapshot_user(user)
+        self._users.set(user.id, snapshot, time.time() + self.ttl)
+        return snapshot
+
+    def invalidate_user(self, user_id: int):
+        """Сбросить пользователя (после изменения или удаления)"""
+        self._users.pop(user_id)
+
+    def clear(self):
+        """Очистить кеш полностью"""
+        self._tokens.clear()
+        self._users.clear()
+
+    def metrics(self) -> dict:
+        """Статистика кеша"""
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "token_hits": self._tokens.hits,
+            "token_misses": self._tokens.misses,
+            "user_hits": self._users.hits,
+            "user_misses": self._users.misses,
+        }
+
+
+# Общий кеш приложения
+auth_cache = AuthCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
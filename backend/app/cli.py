@@ -0,0 +1,264 @@
+"""
+Административный CLI для пользователей
+
+Запуск из папки backend:
+    python -m app.cli export --format csv --output users.csv
+    python -m app.cli export --with-hashes -o users.ndjson
+    python -m app.cli import users.ndjson --batch-size 5000 --workers 8
+    python -m app.cli reset-password dungeon_master NewPass123
+
+Экспорт читает пользователей серверным курсором и пишет построчно.
+Импорт читает файл потоково, хеширует пароли в пуле процессов и вставляет
+пачками (executemany, одна транзакция на пачку). Пока пачка вставляется,
+пароли следующей уже хешируются.
+"""
+import argparse
+import csv
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Set, TextIO
+
+import orjson
+
+from app.bd import SessionLocal, init_db
+from app.crud import (
+    PUBLIC_COLUMNS,
+    bulk_insert_users,
+    get_user_by_username,
+    get_taken_logins,
+    iter_users,
+    update_password_hash,
+    get_password_hash
+)
+from app.hashing import hash_password, get_rounds, BCRYPT_MIN_ROUNDS
+
+EXPORT_FIELDS = [column.key for column in PUBLIC_COLUMNS]
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def _detect_format(path: Optional[str], fmt: Optional[str]) -> str:
+    """Формат по аргументу или расширению файла"""
+    if fmt:
+        return fmt
+    if path and path.lower().endswith(".csv"):
+        return "csv"
+    return "ndjson"
+
+
+def _read_records(stream: TextIO, fmt: str) -> Iterator[Dict]:
+    """Потоковое чтение записей из CSV или NDJSON"""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield orjson.loads(line)
+
+
+def _to_row(record: Dict) -> Dict:
+    """Запись из файла -> строка для вставки (без хеша пароля)"""
+    is_active = record.get("is_active", True)
+    if isinstance(is_active, str):
+        is_active = is_active.strip().lower() in TRUE_VALUES
+
+    return {
+        "username": record["username"].strip(),
+        "email": record["email"].strip(),
+        "character_name": record.get("character_name") or None,
+        "is_active": bool(is_active),
+        "hashed_password": record.get("hashed_password") or None,
+        "_password": record.get("password"),
+    }
+
+
+def _batches(records: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    """Разбиение потока записей на пачки"""
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def export_users(output: TextIO, fmt: str, batch_size: int, with_hashes: bool = False) -> int:
+    """
+    Экспорт всех пользователей в CSV или NDJSON
+
+    С with_hashes в выгрузку попадает hashed_password, и файл можно
+    загрузить в другую базу командой import без повторного хеширования.
+
+    Returns:
+        int: Количество выгруженных пользователей
+    """
+    count = 0
+    db = SessionLocal()
+    try:
+        rows = iter_users(db, batch_size=batch_size, with_password_hash=with_hashes)
+        if fmt == "csv":
+            writer = csv.writer(output)
+            writer.writerow(EXPORT_FIELDS + (["hashed_password"] if with_hashes else []))
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                output.write(orjson.dumps(dict(row._mapping)).decode())
+                output.write("\n")
+                count += 1
+    finally:
+        db.close()
+    return count
+
+
+def import_users(
+    stream: TextIO,
+    fmt: str,
+    batch_size: int,
+    workers: int,
+    rounds: int,
+    skip_existing: bool
+) -> int:
+    """
+    Импорт пользователей из CSV или NDJSON
+
+    Записи с готовым hashed_password вставляются как есть,
+    для записей с password хеш считается в пуле процессов.
+
+    Returns:
+        int: Количество вставленных пользователей
+    """
+    hasher = functools.partial(hash_password, rounds=max(rounds, BCRYPT_MIN_ROUNDS))
+    batches = _batches((_to_row(record) for record in _read_records(stream, fmt)), batch_size)
+    inserted = 0
+    # Логины пачки, которая хешируется и еще не вставлена: база о них пока не знает
+    pending_logins: Set[str] = set()
+
+    def submit(pool, db, batch):
+        """Запуск хеширования пачки (результаты читаются позже)"""
+        nonlocal pending_logins
+        if skip_existing:
+            # Занятые логины отбрасываются до хеширования, а не после
+            taken = get_taken_logins(db, [row["username"] for row in batch], [row["email"] for row in batch])
+            taken |= pending_logins
+            kept = []
+            for row in batch:
+                if row["username"] in taken or row["email"] in taken:
+                    continue
+                # Повтор логина дальше в этой же пачке тоже пропускается
+                taken.add(row["username"])
+                taken.add(row["email"])
+                kept.append(row)
+            batch = kept
+            pending_logins = {login for row in batch for login in (row["username"], row["email"])}
+        passwords = [row["_password"] for row in batch if not row["hashed_password"]]
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return batch, pool.map(hasher, passwords, chunksize=chunksize)
+
+    def finish(db, batch, hashes) -> int:
+        """Подстановка хешей и вставка пачки"""
+        hashes = iter(hashes)
+        for row in batch:
+            password = row.pop("_password")
+            if not row["hashed_password"]:
+                if not password:
+                    raise ValueError(f"Нет пароля для пользователя {row['username']}")
+                row["hashed_password"] = next(hashes)
+        return bulk_insert_users(db, batch, skip_existing=skip_existing)
+
+    db = SessionLocal()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = None
+            for batch in batches:
+                # Хеширование следующей пачки идет, пока вставляется текущая
+                submitted = submit(pool, db, batch)
+                if pending is not None:
+                    inserted += finish(db, *pending)
+                    print(f"   ... импортировано {inserted}", file=sys.stderr)
+                pending = submitted
+            if pending is not None:
+                inserted += finish(db, *pending)
+    finally:
+        db.close()
+    return inserted
+
+
+def reset_password(username: str, new_password: str) -> bool:
+    """Сброс пароля пользователя"""
+    db = SessionLocal()
+    try:
+        user = get_user_by_username(db, username)
+        if not user:
+            return False
+        update_password_hash(db, user.id, get_password_hash(new_password))
+        return True
+    finally:
+        db.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Управление пользователями D&D Application")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Выгрузить пользователей")
+    export_parser.add_argument("--format", choices=["csv", "ndjson"])
+    export_parser.add_argument("--output", "-o", help="Файл (по умолчанию stdout)")
+    export_parser.add_argument("--batch-size", type=int, default=5000)
+    export_parser.add_argument("--with-hashes", action="store_true", help="Добавить хеши паролей (для миграции)")
+
+    import_parser = commands.add_parser("import", help="Загрузить пользователей")
+    import_parser.add_argument("input", help="Файл CSV/NDJSON или - для stdin")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"])
+    import_parser.add_argument("--batch-size", type=int, default=5000)
+    import_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    import_parser.add_argument(
+        "--rounds", type=int, default=get_rounds(),
+        help=(
+            f"Стоимость bcrypt для импортируемых паролей, не ниже {BCRYPT_MIN_ROUNDS} "
+            "(пересчитается при входе, если ниже целевой)"
+        )
+    )
+    import_parser.add_argument("--skip-existing", action="store_true", help="Пропускать занятые username/email")
+
+    reset_parser = commands.add_parser("reset-password", help="Сбросить пароль пользователя")
+    reset_parser.add_argument("username")
+    reset_parser.add_argument("password")
+
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+
+    if args.command == "export":
+        fmt = _detect_format(args.output, args.format)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as output:
+                count = export_users(output, fmt, args.batch_size, args.with_hashes)
+        else:
+            count = export_users(sys.stdout, fmt, args.batch_size, args.with_hashes)
+        print(f"✅ Выгружено пользователей: {count} за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    elif args.command == "import":
+        init_db()
+        fmt = _detect_format(args.input, args.format)
+        if args.input == "-":
+            count = import_users(sys.stdin, fmt, args.batch_size, args.workers, args.rounds, args.skip_existing)
+        else:
+            with open(args.input, encoding="utf-8", newline="") as stream:
+                count = import_users(stream, fmt, args.batch_size, args.workers, args.rounds, args.skip_existing)
+        print(f"✅ Импортировано пользователей: {count} за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    elif args.command == "reset-password":
+        if not reset_password(args.username, args.password):
+            print(f"❌ Пользователь '{args.username}' не найден", file=sys.stderr)
+            return 1
+        print(f"✅ Пароль пользователя '{args.username}' изменен", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Socket.IO для нескольких воркеров uvicorn на одном хосте
+
+LocalPubSubManager - менеджер клиентов Socket.IO, который пересылает emit,
+enter_room/leave_room и disconnect между процессами через локальный брокер
+на UNIX-сокете. Внешние сервисы (Redis и т.п.) не нужны.
+
+Брокер поднимается внутри одного из воркеров: кто первым захватил
+файловую блокировку, тот и брокер. Если этот воркер умирает, блокировка
+освобождается, остальные переподключаются и выбирают нового брокера.
+
+Кадр протокола: 4 байта длины (big-endian) + JSON.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+from typing import Callable, Dict, Optional, Set
+
+import orjson
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from app.room_registry import RoomRegistry
+
+logger = logging.getLogger(__name__)
+
+# Адрес брокера, например unix:///tmp/dnd_socketio.sock (пусто - один воркер без брокера)
+SOCKETIO_BROKER_URL = os.getenv("SOCKETIO_BROKER_URL", "")
+
+_HEADER = struct.Struct(">I")
+# Начало кадра, который брокер возвращает и отправителю (поле echo идет первым)
+_ECHO_PREFIX = b'{"echo":true'
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Если воркер не успевает читать, брокер отключает его, а не копит память
+MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+
+def encode_frame(message: dict) -> bytes:
+    """Сообщение -> кадр протокола"""
+    payload = orjson.dumps(message)
+    return _HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    """Чтение одного кадра (IncompleteReadError при закрытии соединения)"""
+    header = await reader.readexactly(_HEADER.size)
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Слишком большой кадр: {size} байт")
+    return orjson.loads(await reader.readexactly(size))
+
+
+def _socket_path(url: str) -> str:
+    """unix:///tmp/x.sock -> /tmp/x.sock"""
+    if not url.startswith("unix://"):
+        raise ValueError(f"Поддерживается только unix:// адрес брокера, получено: {url}")
+    return url[len("unix://"):]
+
+
+class LocalBroker:
+    """
+    Брокер сообщений на UNIX-сокете
+
+    Пересылает каждый кадр всем подключенным воркерам, кроме отправителя.
+    Кадр с полем echo (publish(..., echo=True)) возвращается и отправителю:
+    так все воркеры получают такие сообщения в одном и том же порядке.
+    Когда воркер отключается, остальные получают host_down с его host_id.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[asyncio.StreamWriter, Optional[str]] = {}
+
+    async def start(self):
+        if os.path.exists(self.path):
+            # Файл остался от упавшего брокера: блокировка уже у нас
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self.path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._peers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _broadcast(self, frame: bytes, sender: Optional[asyncio.StreamWriter] = None):
+        for writer in list(self._peers):
+            if writer is sender or writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+                logger.warning("Воркер %s не успевает читать, отключаем", self._peers.get(writer))
+                writer.close()
+                continue
+            writer.write(frame)
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers[writer] = None
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                (size,) = _HEADER.unpack(header)
+                payload = await reader.readexactly(size)
+                frame = header + payload
+
+                if self._peers[writer] is None:
+                    message = orjson.loads(payload)
+                    if message.get("method") == "hello":
+                        self._peers[writer] = message.get("host_id")
+                        continue
+
+                self._broadcast(frame, sender=None if payload.startswith(_ECHO_PREFIX) else writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            host_id = self._peers.pop(writer, None)
+            writer.close()
+            if host_id:
+                self._broadcast(encode_frame({"method": "host_down", "host_id": host_id}))
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+    """
+    Менеджер клиентов Socket.IO поверх LocalBroker
+
+    Кроме стандартных сообщений менеджера, по той же шине ходят служебные
+    сообщения приложения (presence, host_down, history). Их получают
+    обработчики, зарегистрированные через subscribe, в _thread менеджера
+    они не попадают.
+    """
+    name = "localpubsub"
+
+    def __init__(self, url: str, channel: str = "socketio", write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = _socket_path(url)
+        self._handlers: Dict[str, Callable] = {}
+        self.on_connect: Optional[Callable] = None
+        self._broker: Optional[LocalBroker] = None
+        self._lock_fd: Optional[int] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connect_lock = asyncio.Lock()
+
+    def _try_become_broker(self) -> bool:
+        """Захват файловой блокировки брокера (освобождается при смерти процесса)"""
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _connect(self):
+        """Подключение к брокеру (при необходимости - запуск своего брокера)"""
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+
+            delay = 0.05
+            while True:
+                if self._broker is None and self._try_become_broker():
+                    self._broker = LocalBroker(self.path)
+                    await self._broker.start()
+                    logger.info("Брокер Socket.IO запущен: %s", self.path)
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+
+            self._writer.write(encode_frame({"method": "hello", "host_id": self.host_id}))
+            await self._writer.drain()
+
+    def subscribe(self, method: str, handler: Callable):
+        """Обработчик служебных сообщений method с других воркеров"""
+        self._handlers[method] = handler
+
+    async def publish(self, message: dict, echo: bool = False):
+        """
+        Отправка служебного сообщения кластера всем остальным воркерам
+
+        Args:
+            message: Сообщение с полем method
+            echo: Доставить сообщение и этому воркеру, в общем для всех порядке
+        """
+        if echo:
+            message = {"echo": True, **message}
+        message.setdefault("host_id", self.host_id)
+        await self._publish(message)
+
+    async def _publish(self, data):
+        try:
+            await self._connect()
+            self._writer.write(encode_frame(data))
+            await self._writer.drain()
+        except (ConnectionError, OSError):
+            logger.error("Брокер Socket.IO недоступен, сообщение не отправлено")
+            self._writer = None
+
+    async def _handle(self, handler: Callable, message: dict):
+        """
+        Служебное сообщение кластера
+
+        Ошибка обработчика не должна выходить из _listen: менеджер перезапустил
+        бы прием и вызвал on_connect, и одно плохое сообщение вызвало бы
+        полную пересинхронизацию всех воркеров. Сообщение пропускается.
+        """
+        try:
+            await handler(message)
+        except Exception:
+            logger.exception("Ошибка обработки сообщения кластера %s", message.get("method"))
+
+    async def _listen(self):
+        while True:
+            try:
+                await self._connect()
+                if self.on_connect is not None:
+                    await self.on_connect()
+
+                while True:
+                    message = await read_frame(self._reader)
+                    handler = self._handlers.get(message.get("method"))
+                    if handler is not None:
+                        await self._handle(handler, message)
+                        continue
+                    yield message
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                # Брокер пропал - переподключаемся (возможно, станем брокером сами)
+                logger.warning("Соединение с брокером Socket.IO потеряно, переподключение")
+                self._writer = None
+                await asyncio.sleep(0.05)
+
+
+class ClusterPresence:
+    """
+    Присутствие пользователей и членство в комнатах на всех воркерах
+
+    Каждый воркер рассылает изменения своих подключений, а изменения чужих
+    подключений применяет к тому же RoomRegistry. Так get_online_users
+    и members_count видят пользователей всех воркеров.
+    """
+
+    def __init__(self, manager: LocalPubSubManager, registry: RoomRegistry):
+        self.manager = manager
+        self.registry = registry
+        # host_id -> sid подключений этого воркера
+        self.remote_sids: Dict[str, Set[str]] = {}
+        self.local_sids: Set[str] = set()
+        manager.subscribe("presence", self.handle)
+        manager.subscribe("host_down", self.handle)
+        manager.on_connect = self.request_sync
+
+    async def _send(self, op: str, **fields):
+        await self.manager.publish({"method": "presence", "op": op, **fields})
+
+    # --- Локальные изменения ---
+
+    async def connected(self, sid: str, user_info: dict):
+        self.local_sids.add(sid)
+        await self._send("connect", sid=sid, user=user_info)
+
+    async def disconnected(self, sid: str):
+        self.local_sids.discard(sid)
+        await self._send("disconnect", sid=sid)
+
+    async def joined(self, sid: str, room_id: str):
+        await self._send("join", sid=sid, room=room_id)
+
+    async def left(self, sid: str, room_id: str):
+        await self._send("leave", sid=sid, room=room_id)
+
+    async def request_sync(self):
+        """Обмен состоянием с остальными воркерами (после старта или переподключения)"""
+        await self._send("sync_request")
+        await self._send_snapshot()
+
+    async def _send_snapshot(self):
+        users, rooms = self.registry.snapshot(self.local_sids)
+        await self._send("sync", users=users, rooms=rooms)
+
+    # --- Изменения с других воркеров ---
+
+    def _drop_host(self, host_id: str):
+        self.registry.drop(self.remote_sids.pop(host_id, ()))
+
+    async def handle(self, message: dict):
+        host_id = message.get("host_id")
+        if host_id == self.manager.host_id:
+            return
+
+        if message["method"] == "host_down":
+            self._drop_host(host_id)
+            return
+
+        op = message.get("op")
+        sids = self.remote_sids.setdefault(host_id, set())
+
+        if op == "connect":
+            sids.add(message["sid"])
+            self.registry.connect(message["sid"], message["user"])
+        elif op == "disconnect":
+            sids.discard(message["sid"])
+            self.registry.disconnect(message["sid"])
+        elif op == "join":
+            self.registry.join(message["sid"], message["room"])
+        elif op == "leave":
+            self.registry.leave(message["sid"], message["room"])
+        elif op == "sync_request":
+            await self._send_snapshot()
+        elif op == "sync":
+            self._drop_host(host_id)
+            sids = self.remote_sids.setdefault(host_id, set())
+            for sid, user_info in message.get("users", {}).items():
+                sids.add(sid)
+                self.registry.connect(sid, user_info)
+            for room_id, members in message.get("rooms", {}).items():
+                for sid in members:
+                    self.registry.join(sid, room_id)
+
+
+def create_client_manager() -> Optional[LocalPubSubManager]:
+    """Менеджер клиентов по настройкам окружения (None - обычный менеджер в памяти)"""
+    if not SOCKETIO_BROKER_URL:
+        return None
+    return LocalPubSubManager(SOCKETIO_BROKER_URL)
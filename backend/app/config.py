@@ -0,0 +1,100 @@
+"""
+Настройки приложения из переменных окружения
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# Папка backend (рядом с ней по умолчанию лежит файл SQLite)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Чтение логического значения из окружения"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    """Чтение целого числа из окружения"""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _to_async_url(url: str) -> str:
+    """Подбор асинхронного драйвера для URL базы данных"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+
+@dataclass(frozen=True)
+class DatabaseSettings:
+    """Параметры подключения и производительности базы данных"""
+    url: str
+    async_url: str
+    echo: bool = False
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_recycle: int = 1800
+    # SQLite PRAGMA, применяются при каждом новом соединении
+    sqlite_journal_mode: Optional[str] = "WAL"
+    sqlite_synchronous: Optional[str] = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # отрицательное значение - размер в КиБ
+    sqlite_busy_timeout: int = 5000  # мс
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.url.startswith("sqlite")
+
+    @property
+    def is_memory(self) -> bool:
+        return self.is_sqlite and (self.url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in self.url)
+
+    def sqlite_pragmas(self) -> list:
+        """Список PRAGMA для нового соединения SQLite"""
+        pragmas = []
+        if self.sqlite_journal_mode:
+            pragmas.append(f"PRAGMA journal_mode={self.sqlite_journal_mode}")
+        if self.sqlite_synchronous:
+            pragmas.append(f"PRAGMA synchronous={self.sqlite_synchronous}")
+        if self.sqlite_mmap_size:
+            pragmas.append(f"PRAGMA mmap_size={self.sqlite_mmap_size}")
+        if self.sqlite_cache_size:
+            pragmas.append(f"PRAGMA cache_size={self.sqlite_cache_size}")
+        if self.sqlite_busy_timeout:
+            pragmas.append(f"PRAGMA busy_timeout={self.sqlite_busy_timeout}")
+        return pragmas
+
+
+def load_database_settings() -> DatabaseSettings:
+    """
+    Чтение настроек базы данных из окружения
+
+    Переменные:
+        DATABASE_URL, ASYNC_DATABASE_URL - строки подключения
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE - параметры пула
+        DB_ECHO - логирование каждого SQL-запроса (по умолчанию выключено)
+        SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE,
+        SQLITE_CACHE_SIZE, SQLITE_BUSY_TIMEOUT - PRAGMA для SQLite
+    """
+    url = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(BASE_DIR, 'dnd_app.db')}")
+
+    return DatabaseSettings(
+        url=url,
+        async_url=os.getenv("ASYNC_DATABASE_URL", _to_async_url(url)),
+        echo=_env_bool("DB_ECHO", False),
+        pool_size=_env_int("DB_POOL_SIZE", 5),
+        max_overflow=_env_int("DB_MAX_OVERFLOW", 10),
+        pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+        sqlite_journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "WAL") or None,
+        sqlite_synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL") or None,
+        sqlite_mmap_size=_env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        sqlite_cache_size=_env_int("SQLITE_CACHE_SIZE", -64000),
+        sqlite_busy_timeout=_env_int("SQLITE_BUSY_TIMEOUT", 5000),
+    )
@@ -1,30 +1,54 @@
+from sqlalchemy import select, insert, update, or_, case
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from app.bd import User
-import bcrypt
-from typing import Optional
+from app.cache import auth_cache
+from app.hashing import hash_password, check_password, dummy_hash, needs_rehash
+from typing import Optional, Iterator, List, Dict, Any
+
+# Публичные колонки пользователя (без хеша пароля) для списков и экспорта
+PUBLIC_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.character_name,
+    User.is_active,
+)
+
+# Колонки, нужные для входа (без полной загрузки ORM-объекта)
+LOGIN_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.hashed_password,
+    User.character_name,
+    User.is_active,
+)
+
+
+def login_lookup_query(login: str):
+    """
+    Запрос пользователя по username или email за одно обращение к БД
+    
+    Оба условия покрыты уникальными индексами. Совпадение по username
+    имеет приоритет, как и раньше.
+    """
+    return (
+        select(*LOGIN_COLUMNS)
+        .where(or_(User.username == login, User.email == login))
+        .order_by(case((User.username == login, 0), else_=1))
+        .limit(1)
+    )
 
 
 def get_password_hash(password: str) -> str:
     """Хеширование пароля"""
-    # Bcrypt имеет ограничение в 72 байта
-    password_bytes = password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = password_bytes[:72]
-    
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode('utf-8')
+    return hash_password(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Проверка пароля"""
-    # Bcrypt имеет ограничение в 72 байта
-    password_bytes = plain_password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = password_bytes[:72]
-    
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
+    return check_password(plain_password, hashed_password)
 
 
 def get_user_by_username(db: Session, username: str) -> Optional[User]:
@@ -46,8 +70,9 @@ def create_user(
     db: Session,
     username: str,
     email: str,
-    password: str,
-    character_name: Optional[str] = None
+    password: Optional[str] = None,
+    character_name: Optional[str] = None,
+    hashed_password: Optional[str] = None
 ) -> User:
     """
     Создать нового пользователя
@@ -58,11 +83,13 @@ def create_user(
         email: Email пользователя
         password: Пароль (будет захеширован)
         character_name: Имя персонажа (опционально)
+        hashed_password: Уже готовый хеш пароля (вместо password)
     
     Returns:
         User: Созданный пользователь
     """
-    hashed_password = get_password_hash(password)
+    if hashed_password is None:
+        hashed_password = get_password_hash(password)
     
     db_user = User(
         username=username,
@@ -79,7 +106,12 @@ def create_user(
     return db_user
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+def get_login_credentials(db: Session, login: str) -> Optional[Row]:
+    """Получить данные для входа по username или email одним запросом"""
+    return db.execute(login_lookup_query(login)).first()
+
+
+def authenticate_user(db: Session, username: str, password: str) -> Optional[Row]:
     """
     Аутентификация пользователя
     
@@ -89,22 +121,41 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         password: Пароль
     
     Returns:
-        User: Пользователь, если аутентификация успешна, иначе None
+        Row: Данные пользователя (id, username, email, character_name, is_active),
+        если аутентификация успешна, иначе None
     """
-    # Попытка найти по username
-    user = get_user_by_username(db, username)
+    user = get_login_credentials(db, username)
     
-    # Если не найден, попытка найти по email
+    # Для неизвестного пользователя проверяем хеш-заглушку,
+    # чтобы время ответа не выдавало существование аккаунта
     if not user:
-        user = get_user_by_email(db, username)
+        verify_password(password, dummy_hash())
+        return None
     
-    # Проверка пароля
-    if not user or not verify_password(password, user.hashed_password):
+    if not verify_password(password, user.hashed_password):
         return None
     
+    # Пароль верный - можно перехешировать под текущую стоимость bcrypt
+    if needs_rehash(user.hashed_password):
+        update_password_hash(db, user.id, get_password_hash(password))
+    
     return user
 
 
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    """
+    Сохранить новый хеш пароля без загрузки ORM-объекта
+    
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+        hashed_password: Новый хеш пароля
+    """
+    db.execute(update(User).where(User.id == user_id).values(hashed_password=hashed_password))
+    db.commit()
+    auth_cache.invalidate_user(user_id)
+
+
 def update_user(
     db: Session,
     user_id: int,
@@ -143,6 +194,7 @@ def update_user(
     
     db.commit()
     db.refresh(user)
+    auth_cache.invalidate_user(user_id)
     
     return user
 
@@ -165,6 +217,7 @@ def delete_user(db: Session, user_id: int) -> bool:
     
     db.delete(user)
     db.commit()
+    auth_cache.invalidate_user(user_id)
     
     return True
 
@@ -181,4 +234,91 @@ def get_all_users(db: Session, skip: int = 0, limit: int = 100):
     Returns:
         List[User]: Список пользователей
     """
-    return db.query(User).offset(skip).limit(limit).all()
\ No newline at end of file
+    return db.query(User).offset(skip).limit(limit).all()
+
+
+def get_users_page(db: Session, after_id: int = 0, limit: int = 100) -> List[Row]:
+    """
+    Получить страницу пользователей (keyset-пагинация по id)
+    
+    В отличие от offset, время запроса не растет с номером страницы:
+    SQLite сразу переходит к нужному id по первичному ключу.
+    
+    Args:
+        db: Сессия базы данных
+        after_id: Последний id с предыдущей страницы (0 - с начала)
+        limit: Максимальное количество возвращаемых записей
+    
+    Returns:
+        List[Row]: Публичные данные пользователей, отсортированные по id
+    """
+    stmt = select(*PUBLIC_COLUMNS).where(User.id > after_id).order_by(User.id).limit(limit)
+    return list(db.execute(stmt))
+
+
+def iter_users(db: Session, batch_size: int = 1000, with_password_hash: bool = False) -> Iterator[Row]:
+    """
+    Потоковый обход всех пользователей через серверный курсор
+    
+    Строки читаются пачками по batch_size, память не зависит от размера таблицы.
+    
+    Args:
+        db: Сессия базы данных
+        batch_size: Размер пачки
+        with_password_hash: Добавить hashed_password (для миграции между базами)
+    
+    Yields:
+        Row: Публичные данные пользователя
+    """
+    columns = PUBLIC_COLUMNS + (User.hashed_password,) if with_password_hash else PUBLIC_COLUMNS
+    stmt = select(*columns).order_by(User.id).execution_options(yield_per=batch_size)
+    yield from db.execute(stmt)
+
+
+def get_taken_logins(db: Session, usernames: List[str], emails: List[str]) -> set:
+    """
+    Множество уже занятых username и email из переданных списков (один запрос)
+    
+    Args:
+        db: Сессия базы данных
+        usernames: Проверяемые имена пользователей
+        emails: Проверяемые email
+    
+    Returns:
+        set: Занятые значения username и email
+    """
+    stmt = select(User.username, User.email).where(
+        or_(User.username.in_(usernames), User.email.in_(emails))
+    )
+    taken = set()
+    for username, email in db.execute(stmt):
+        taken.add(username)
+        taken.add(email)
+    return taken
+
+
+def bulk_insert_users(db: Session, rows: List[Dict[str, Any]], skip_existing: bool = False) -> int:
+    """
+    Массовая вставка пользователей одним executemany в одной транзакции
+    
+    Args:
+        db: Сессия базы данных
+        rows: Словари с полями username, email, hashed_password
+            и необязательными character_name, is_active
+        skip_existing: Пропускать строки с уже занятыми username/email
+    
+    Returns:
+        int: Количество вставленных строк
+    """
+    if not rows:
+        return 0
+    
+    stmt = insert(User)
+    if skip_existing:
+        stmt = stmt.prefix_with("OR IGNORE", dialect="sqlite")
+    
+    # Core-выполнение: один executemany без создания ORM-объектов
+    result = db.connection().execute(stmt, rows)
+    db.commit()
+    
+    return result.rowcount if result.rowcount >= 0 else len(rows)
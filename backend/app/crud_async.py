@@ -0,0 +1,262 @@
+"""
+Асинхронные версии функций crud.py
+
+Используются в FastAPI endpoints и Socket.IO обработчиках, чтобы запросы к БД
+не блокировали event loop. Синхронный crud.py остается для скриптов и CLI.
+"""
+from sqlalchemy import select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.bd import User
+from app.cache import auth_cache
+from app.crud import login_lookup_query, PUBLIC_COLUMNS
+from app.hashing import (
+    HashingQueueFull,
+    hash_password_async,
+    verify_password_async,
+    dummy_hash_async,
+    needs_rehash
+)
+from typing import Optional, List, AsyncIterator
+
+
+async def get_password_hash(password: str) -> str:
+    """Хеширование пароля в пуле процессов"""
+    return await hash_password_async(password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля в пуле процессов"""
+    return await verify_password_async(plain_password, hashed_password)
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    """Получить пользователя по имени пользователя"""
+    result = await db.execute(select(User).where(User.username == username).limit(1))
+    return result.scalars().first()
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    """Получить пользователя по email"""
+    result = await db.execute(select(User).where(User.email == email).limit(1))
+    return result.scalars().first()
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Получить пользователя по ID"""
+    result = await db.execute(select(User).where(User.id == user_id).limit(1))
+    return result.scalars().first()
+
+
+async def create_user(
+    db: AsyncSession,
+    username: str,
+    email: str,
+    password: Optional[str] = None,
+    character_name: Optional[str] = None,
+    hashed_password: Optional[str] = None
+) -> User:
+    """
+    Создать нового пользователя
+
+    Args:
+        db: Асинхронная сессия базы данных
+        username: Имя пользователя
+        email: Email пользователя
+        password: Пароль (будет захеширован)
+        character_name: Имя персонажа (опционально)
+        hashed_password: Уже готовый хеш пароля (вместо password)
+
+    Returns:
+        User: Созданный пользователь
+    """
+    if hashed_password is None:
+        hashed_password = await get_password_hash(password)
+
+    db_user = User(
+        username=username,
+        email=email,
+        hashed_password=hashed_password,
+        character_name=character_name,
+        is_active=True
+    )
+
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+
+    return db_user
+
+
+async def get_login_credentials(db: AsyncSession, login: str) -> Optional[Row]:
+    """Получить данные для входа по username или email одним запросом"""
+    result = await db.execute(login_lookup_query(login))
+    return result.first()
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[Row]:
+    """
+    Аутентификация пользователя
+
+    Args:
+        db: Асинхронная сессия базы данных
+        username: Имя пользователя или email
+        password: Пароль
+
+    Returns:
+        Row: Данные пользователя (id, username, email, character_name, is_active),
+        если аутентификация успешна, иначе None
+
+    Raises:
+        HashingQueueFull: Если очередь хеширования переполнена
+    """
+    user = await get_login_credentials(db, username)
+
+    # Для неизвестного пользователя проверяем хеш-заглушку,
+    # чтобы время ответа не выдавало существование аккаунта
+    if not user:
+        await verify_password(password, await dummy_hash_async())
+        return None
+
+    if not await verify_password(password, user.hashed_password):
+        return None
+
+    # Пароль верный - перехешируем под текущую стоимость bcrypt.
+    # Если пул перегружен, вход не должен из-за этого падать: попробуем в следующий раз.
+    if needs_rehash(user.hashed_password):
+        try:
+            await update_password_hash(db, user.id, await get_password_hash(password))
+        except HashingQueueFull:
+            pass
+
+    return user
+
+
+async def update_password_hash(db: AsyncSession, user_id: int, hashed_password: str):
+    """
+    Сохранить новый хеш пароля без загрузки ORM-объекта
+
+    Args:
+        db: Асинхронная сессия базы данных
+        user_id: ID пользователя
+        hashed_password: Новый хеш пароля
+    """
+    await db.execute(update(User).where(User.id == user_id).values(hashed_password=hashed_password))
+    await db.commit()
+    auth_cache.invalidate_user(user_id)
+
+
+async def update_user(
+    db: AsyncSession,
+    user_id: int,
+    username: Optional[str] = None,
+    email: Optional[str] = None,
+    character_name: Optional[str] = None,
+    is_active: Optional[bool] = None
+) -> Optional[User]:
+    """
+    Обновить данные пользователя
+
+    Args:
+        db: Асинхронная сессия базы данных
+        user_id: ID пользователя
+        username: Новое имя пользователя (опционально)
+        email: Новый email (опционально)
+        character_name: Новое имя персонажа (опционально)
+        is_active: Новый статус активности (опционально)
+
+    Returns:
+        User: Обновленный пользователь или None, если не найден
+    """
+    user = await get_user_by_id(db, user_id)
+
+    if not user:
+        return None
+
+    if username is not None:
+        user.username = username
+    if email is not None:
+        user.email = email
+    if character_name is not None:
+        user.character_name = character_name
+    if is_active is not None:
+        user.is_active = is_active
+
+    await db.commit()
+    await db.refresh(user)
+    auth_cache.invalidate_user(user_id)
+
+    return user
+
+
+async def delete_user(db: AsyncSession, user_id: int) -> bool:
+    """
+    Удалить пользователя
+
+    Args:
+        db: Асинхронная сессия базы данных
+        user_id: ID пользователя
+
+    Returns:
+        bool: True, если пользователь удален, иначе False
+    """
+    user = await get_user_by_id(db, user_id)
+
+    if not user:
+        return False
+
+    await db.delete(user)
+    await db.commit()
+    auth_cache.invalidate_user(user_id)
+
+    return True
+
+
+async def get_all_users(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[User]:
+    """
+    Получить список всех пользователей
+
+    Args:
+        db: Асинхронная сессия базы данных
+        skip: Количество пропускаемых записей
+        limit: Максимальное количество возвращаемых записей
+
+    Returns:
+        List[User]: Список пользователей
+    """
+    result = await db.execute(select(User).offset(skip).limit(limit))
+    return list(result.scalars().all())
+
+
+async def get_users_page(db: AsyncSession, after_id: int = 0, limit: int = 100) -> List[Row]:
+    """
+    Получить страницу пользователей (keyset-пагинация по id)
+
+    Args:
+        db: Асинхронная сессия базы данных
+        after_id: Последний id с предыдущей страницы (0 - с начала)
+        limit: Максимальное количество возвращаемых записей
+
+    Returns:
+        List[Row]: Публичные данные пользователей, отсортированные по id
+    """
+    stmt = select(*PUBLIC_COLUMNS).where(User.id > after_id).order_by(User.id).limit(limit)
+    result = await db.execute(stmt)
+    return list(result)
+
+
+async def stream_users(db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[Row]:
+    """
+    Потоковый обход всех пользователей через серверный курсор
+
+    Args:
+        db: Асинхронная сессия базы данных
+        batch_size: Размер пачки
+
+    Yields:
+        Row: Публичные данные пользователя
+    """
+    stmt = select(*PUBLIC_COLUMNS).order_by(User.id).execution_options(yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for row in result:
+        yield row
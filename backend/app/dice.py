@@ -0,0 +1,236 @@
+"""
+Броски кубиков на сервере
+
+Поддерживаемая запись (регистр и пробелы не важны):
+    d20, 3d8+1d4+5      - кубики и константы через + и -
+    d%                  - то же, что d100
+    4d6kh3, 4d6k3       - оставить 3 наибольших
+    2d20kl1             - оставить наименьший (помеха)
+    4d6dl1, 5d8dh2      - отбросить наименьшие / наибольшие
+    8d6!                - взрывающиеся кубики: максимум бросается еще раз
+                          и прибавляется к значению этого кубика
+
+Разобранное выражение кешируется (LRU по строке выражения),
+кубики одной группы бросаются одним вызовом numpy.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+MAX_DICE = 1000  # кубиков в одной группе
+MAX_SIDES = 1000
+MAX_TERMS = 20
+MAX_EXPRESSION_LENGTH = 100
+MAX_EXPLOSIONS = 100  # повторных бросков одного взрывающегося кубика
+EXPRESSION_CACHE_SIZE = 1024
+
+_TERM_RE = re.compile(r"([+-]?)(?:(\d*)d(\d+|%)((?:k[hl]?\d+|d[hl]\d+|!)*)|(\d+))")
+_MODIFIER_RE = re.compile(r"(kh|kl|k|dh|dl)(\d+)|!")
+_SPACED_OPERANDS_RE = re.compile(r"[\w%!]\s+\w")
+
+_rng = np.random.default_rng()
+
+
+class DiceError(ValueError):
+    """Некорректная запись броска"""
+
+
+@dataclass(frozen=True)
+class DiceTerm:
+    """Группа одинаковых кубиков: NdS с модификаторами"""
+    sign: int
+    count: int
+    sides: int
+    keep: Optional[Tuple[str, int]] = None  # ("h" | "l", сколько оставить)
+    explode: bool = False
+
+    @property
+    def notation(self) -> str:
+        text = f"{self.count}d{self.sides}"
+        if self.keep:
+            text += f"k{self.keep[0]}{self.keep[1]}"
+        if self.explode:
+            text += "!"
+        return text
+
+    def roll(self, rng: np.random.Generator, batch: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Бросок группы batch раз
+
+        Returns:
+            Tuple: значения кубиков (batch x count) и маска оставленных кубиков
+        """
+        rolls = rng.integers(1, self.sides + 1, size=(batch, self.count))
+
+        if self.explode:
+            # Взорвавшиеся кубики добрасываются все сразу, пока есть максимумы
+            exploding = rolls == self.sides
+            for _ in range(MAX_EXPLOSIONS):
+                count = int(exploding.sum())
+                if not count:
+                    break
+                extra = rng.integers(1, self.sides + 1, size=count)
+                rolls[exploding] += extra
+                exploding[exploding] = extra == self.sides
+
+        kept = np.ones(rolls.shape, dtype=bool)
+        if self.keep:
+            mode, number = self.keep
+            order = np.argsort(rolls, axis=1, kind="stable")
+            # Индексы отброшенных кубиков: наименьшие для kh, наибольшие для kl
+            dropped = order[:, :self.count - number] if mode == "h" else order[:, number:]
+            np.put_along_axis(kept, dropped, False, axis=1)
+        return rolls, kept
+
+
+@dataclass(frozen=True)
+class ConstTerm:
+    """Постоянная добавка"""
+    sign: int
+    value: int
+
+    @property
+    def notation(self) -> str:
+        return str(self.value)
+
+
+Term = Union[DiceTerm, ConstTerm]
+
+
+@dataclass(frozen=True)
+class DiceExpression:
+    """Разобранная запись броска"""
+    expression: str
+    terms: Tuple[Term, ...]
+
+    def roll(self, rng: Optional[np.random.Generator] = None) -> dict:
+        """
+        Один бросок с подробностями по каждой группе
+
+        Returns:
+            dict: expression, total и terms (значения кубиков и оставленные)
+        """
+        rng = rng or _rng
+        total = 0
+        details = []
+        for term in self.terms:
+            if isinstance(term, ConstTerm):
+                total += term.sign * term.value
+                details.append({"notation": term.notation, "sign": term.sign, "value": term.value})
+                continue
+
+            rolls, kept = term.roll(rng)
+            rolls, kept = rolls[0], kept[0]
+            subtotal = int(rolls[kept].sum())
+            total += term.sign * subtotal
+            details.append({
+                "notation": term.notation,
+                "sign": term.sign,
+                "rolls": rolls.tolist(),
+                "kept": kept.tolist(),
+                "value": subtotal,
+            })
+        return {"expression": self.expression, "total": total, "terms": details}
+
+    def roll_totals(self, batch: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Итоги batch независимых бросков (без подробностей), одним проходом numpy"""
+        rng = rng or _rng
+        totals = np.zeros(batch, dtype=np.int64)
+        for term in self.terms:
+            if isinstance(term, ConstTerm):
+                totals += term.sign * term.value
+            else:
+                rolls, kept = term.roll(rng, batch)
+                totals += term.sign * np.where(kept, rolls, 0).sum(axis=1)
+        return totals
+
+
+def _normalize(expression: str) -> str:
+    return "".join(expression.split()).lower()
+
+
+def _parse_modifiers(text: str, count: int, sides: int) -> Tuple[Optional[Tuple[str, int]], bool]:
+    keep = None
+    explode = False
+    for match in _MODIFIER_RE.finditer(text):
+        if match.group(0) == "!":
+            if sides < 2:
+                raise DiceError("Взрывающийся кубик должен иметь хотя бы 2 грани")
+            explode = True
+            continue
+        if keep is not None:
+            raise DiceError("Можно указать только один модификатор k/d")
+
+        mode, number = match.group(1), int(match.group(2))
+        if number > count:
+            raise DiceError(f"Нельзя оставить или отбросить {number} из {count} кубиков")
+        if mode in ("k", "kh"):
+            keep = ("h", number)
+        elif mode == "kl":
+            keep = ("l", number)
+        elif mode == "dl":
+            keep = ("h", count - number)
+        else:  # dh
+            keep = ("l", count - number)
+    return keep, explode
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _compile(expression: str) -> DiceExpression:
+    terms: List[Term] = []
+    position = 0
+    while position < len(expression):
+        match = _TERM_RE.match(expression, position)
+        if match is None or (terms and not match.group(1)):
+            raise DiceError(f"Не удалось разобрать бросок '{expression}' с позиции {position + 1}")
+        position = match.end()
+
+        sign = -1 if match.group(1) == "-" else 1
+        if match.group(5) is not None:
+            terms.append(ConstTerm(sign, int(match.group(5))))
+            continue
+
+        count = int(match.group(2) or 1)
+        sides = 100 if match.group(3) == "%" else int(match.group(3))
+        if not 1 <= count <= MAX_DICE:
+            raise DiceError(f"Количество кубиков должно быть от 1 до {MAX_DICE}")
+        if not 1 <= sides <= MAX_SIDES:
+            raise DiceError(f"Количество граней должно быть от 1 до {MAX_SIDES}")
+        keep, explode = _parse_modifiers(match.group(4), count, sides)
+        terms.append(DiceTerm(sign, count, sides, keep, explode))
+
+    if not terms:
+        raise DiceError("Пустая запись броска")
+    if len(terms) > MAX_TERMS:
+        raise DiceError(f"Слишком много слагаемых (не больше {MAX_TERMS})")
+    return DiceExpression(expression, tuple(terms))
+
+
+def parse_dice(expression: str) -> DiceExpression:
+    """
+    Разбор записи броска (с кешированием)
+
+    Raises:
+        DiceError: Если запись некорректна
+    """
+    if not isinstance(expression, str):
+        raise DiceError("Запись броска должна быть строкой")
+    if _SPACED_OPERANDS_RE.search(expression):
+        raise DiceError("Части броска должны соединяться знаками + или -")
+    normalized = _normalize(expression)
+    if len(normalized) > MAX_EXPRESSION_LENGTH:
+        raise DiceError(f"Слишком длинная запись броска (не больше {MAX_EXPRESSION_LENGTH} символов)")
+    return _compile(normalized)
+
+
+def roll_dice(expression: str) -> dict:
+    """Бросок по записи, например '4d6kh3+2'"""
+    return parse_dice(expression).roll()
+
+
+def cache_metrics() -> dict:
+    info = _compile.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
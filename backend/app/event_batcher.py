@@ -0,0 +1,111 @@
+"""
+Пакетная отправка событий в комнаты Socket.IO
+
+Вместо отдельного кадра websocket на каждое событие каждому участнику
+события комнаты копятся в очереди и уходят одним пакетом 'events':
+    [{"event": "chat_message", "data": {...}}, ...]
+
+Очередь комнаты отправляется через interval_ms после первого события
+или сразу, как только в ней накопилось max_events событий.
+
+Включается переменной SOCKETIO_BATCH_INTERVAL_MS (0 - выключено).
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.background import BackgroundTasks
+
+SOCKETIO_BATCH_INTERVAL_MS = float(os.getenv("SOCKETIO_BATCH_INTERVAL_MS", "0"))
+SOCKETIO_BATCH_MAX_EVENTS = int(os.getenv("SOCKETIO_BATCH_MAX_EVENTS", "50"))
+
+# Имя пакетного события для клиента
+BATCH_EVENT = "events"
+
+EmitFunc = Callable[[str, Any, str], Awaitable[None]]
+
+
+class _RoomQueue:
+    """События комнаты, ожидающие отправки"""
+    __slots__ = ("events", "timer")
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EventBatcher:
+    """
+    Очереди исходящих событий по комнатам
+
+    Args:
+        emit: Корутина отправки emit(event, data, room_id)
+        interval_ms: Максимальная задержка события в очереди
+        max_events: Размер очереди, при котором она отправляется сразу
+    """
+
+    def __init__(self, emit: EmitFunc, interval_ms: float, max_events: int = 50):
+        self._emit = emit
+        self.interval = interval_ms / 1000
+        self.max_events = max(1, max_events)
+        self._queues: Dict[str, _RoomQueue] = {}
+        # Отправки по таймеру
+        self._tasks = BackgroundTasks("отправка пакета событий")
+        self.events_in = 0
+        self.packets_out = 0
+
+    async def add(self, room_id: str, event: str, data: Any):
+        """
+        Поставить событие в очередь комнаты
+
+        Args:
+            room_id: Комната-получатель
+            event: Имя события
+            data: Данные события
+        """
+        queue = self._queues.get(room_id)
+        if queue is None:
+            queue = self._queues[room_id] = _RoomQueue()
+        self.events_in += 1
+
+        queue.events.append({"event": event, "data": data})
+
+        if len(queue.events) >= self.max_events:
+            await self.flush(room_id)
+        elif queue.timer is None:
+            loop = asyncio.get_running_loop()
+            queue.timer = loop.call_later(self.interval, self._schedule_flush, room_id)
+
+    def _schedule_flush(self, room_id: str):
+        queue = self._queues.get(room_id)
+        if queue is not None:
+            queue.timer = None
+        self._tasks.spawn(self.flush(room_id))
+
+    async def flush(self, room_id: str):
+        """Немедленная отправка очереди комнаты одним пакетом"""
+        queue = self._queues.pop(room_id, None)
+        if queue is None:
+            return
+        if queue.timer is not None:
+            queue.timer.cancel()
+
+        if queue.events:
+            self.packets_out += 1
+            await self._emit(BATCH_EVENT, queue.events, room_id)
+
+    async def flush_all(self):
+        """Отправка всех очередей (при остановке сервера)"""
+        for room_id in list(self._queues):
+            await self.flush(room_id)
+        await self._tasks.drain()
+
+    def metrics(self) -> dict:
+        return {
+            "interval_ms": self.interval * 1000,
+            "max_events": self.max_events,
+            "events_in": self.events_in,
+            "packets_out": self.packets_out,
+            "flush_errors": self._tasks.errors,
+            "pending_rooms": len(self._queues),
+        }
@@ -0,0 +1,316 @@
+"""
+Общее состояние игровой комнаты
+
+У каждой комнаты есть один JSON-документ состояния (хиты, состояния,
+заметки мастера и т.п.), который хранит сервер. Клиент получает полный
+снимок один раз при входе в комнату, а дальше - только изменения:
+    {"room_id", "seq", "ops": [{"op": "replace", "path": "/players/5/hp", "value": 12}]}
+
+Изменения записываются как JSON Patch (RFC 6902), поддерживаются
+операции add, remove и replace. Каждое изменение получает следующий
+номер seq. Клиент, заметивший пропуск номера (или переподключившийся),
+запрашивает изменения после своего seq; если в журнале их уже нет,
+приходит новый снимок.
+
+Изменение применяется целиком или не применяется вовсе: при ошибке
+в любой операции уже выполненные операции откатываются.
+"""
+import copy
+import os
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, List, Optional, Sequence, Tuple
+
+# Сколько последних изменений хранить на комнату
+STATE_LOG_SIZE = int(os.getenv("STATE_LOG_SIZE", "256"))
+STATE_MAX_ROOMS = int(os.getenv("STATE_MAX_ROOMS", "10000"))
+MAX_PATCH_OPS = 100
+
+# Начальный документ: раздел players/<user_id> игрок может менять сам
+INITIAL_STATE = {"players": {}}
+
+_MISSING = object()
+
+
+class StatePatchError(ValueError):
+    """Некорректное изменение состояния"""
+
+
+def parse_path(path) -> List[str]:
+    """JSON Pointer (RFC 6901) -> список ключей: '/players/5/hp' -> ['players', '5', 'hp']"""
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise StatePatchError(f"Некорректный путь: {path!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    # isdigit() пропускает и другие цифры Unicode ('²'), которые int() не разбирает
+    if not (token.isascii() and token.isdigit()) or (len(token) > 1 and token[0] == "0"):
+        raise StatePatchError(f"Некорректный индекс списка: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise StatePatchError(f"Индекс {index} вне списка")
+    return index
+
+
+def _resolve(document: dict, tokens: List[str]) -> Any:
+    """Контейнер, в котором лежит последний ключ пути"""
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict):
+            if token not in target:
+                raise StatePatchError(f"Путь не найден: /{'/'.join(tokens)}")
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_list_index(target, token, allow_end=False)]
+        else:
+            raise StatePatchError(f"Путь не найден: /{'/'.join(tokens)}")
+    if not isinstance(target, (dict, list)):
+        raise StatePatchError(f"Путь не найден: /{'/'.join(tokens)}")
+    return target
+
+
+def _apply_op(document: dict, op: dict) -> Tuple:
+    """
+    Одна операция JSON Patch
+
+    Returns:
+        Tuple: данные для отката (операция, контейнер, ключ, прежнее значение или _MISSING)
+    """
+    if not isinstance(op, dict):
+        raise StatePatchError("Операция должна быть объектом")
+    kind = op.get("op")
+    tokens = parse_path(op.get("path"))
+    container = _resolve(document, tokens)
+    key = tokens[-1]
+
+    if kind in ("add", "replace"):
+        if "value" not in op:
+            raise StatePatchError(f"Операции {kind} нужно значение")
+        # Копия, чтобы следующие изменения документа не меняли значение в журнале
+        value = copy.deepcopy(op["value"])
+
+    if isinstance(container, dict):
+        previous = container.get(key, _MISSING)
+        if kind == "add":
+            container[key] = value
+        elif kind in ("replace", "remove"):
+            if previous is _MISSING:
+                raise StatePatchError(f"Путь не найден: {op['path']}")
+            if kind == "replace":
+                container[key] = value
+            else:
+                del container[key]
+        else:
+            raise StatePatchError(f"Неподдерживаемая операция: {kind!r}")
+        return kind, container, key, previous
+
+    if kind == "add":
+        index = _list_index(container, key, allow_end=True)
+        container.insert(index, value)
+        return kind, container, index, _MISSING
+    if kind in ("replace", "remove"):
+        index = _list_index(container, key, allow_end=False)
+        previous = container[index]
+        if kind == "replace":
+            container[index] = value
+        else:
+            del container[index]
+        return kind, container, index, previous
+    raise StatePatchError(f"Неподдерживаемая операция: {kind!r}")
+
+
+def _undo(kind: str, container, key, previous):
+    if isinstance(container, dict):
+        if previous is _MISSING:
+            del container[key]
+        else:
+            container[key] = previous
+    elif kind == "add":
+        del container[key]
+    elif kind == "replace":
+        container[key] = previous
+    else:
+        container.insert(key, previous)
+
+
+def apply_patch(document: dict, ops: Sequence[dict]):
+    """
+    Применение списка операций к документу на месте (все или ни одной)
+
+    Документ откатывается при любой ошибке, не только StatePatchError:
+    например, deepcopy слишком глубокого значения дает RecursionError.
+
+    Raises:
+        StatePatchError: Если хотя бы одна операция некорректна
+    """
+    done = []
+    try:
+        for op in ops:
+            done.append(_apply_op(document, op))
+    except Exception as e:
+        for undo in reversed(done):
+            _undo(*undo)
+        if isinstance(e, StatePatchError):
+            raise
+        raise StatePatchError(f"Некорректное изменение: {type(e).__name__}") from e
+
+
+def touches_only(ops: Sequence[dict], prefix: Sequence[str]) -> bool:
+    """
+    Все ли операции меняют документ внутри пути prefix (например, ['players', '5'])
+
+    Raises:
+        StatePatchError: Если ops не список
+    """
+    if not isinstance(ops, list):
+        raise StatePatchError("Нужен непустой список операций")
+    size = len(prefix)
+    for op in ops:
+        tokens = parse_path(op.get("path") if isinstance(op, dict) else None)
+        if tokens[:size] != list(prefix):
+            return False
+    return True
+
+
+class _RoomState:
+    """Документ комнаты и журнал последних изменений"""
+    __slots__ = ("document", "seq", "base", "log")
+
+    def __init__(self, size: int, document: Optional[dict] = None, seq: int = 0):
+        self.document = document if document is not None else copy.deepcopy(INITIAL_STATE)
+        self.seq = seq
+        # Изменения с seq <= base в журнале уже не хранятся
+        self.base = seq
+        self.log: Deque[Tuple[int, list]] = deque(maxlen=size)
+
+
+class GameStateStore:
+    """
+    Состояния комнат (последние STATE_MAX_ROOMS комнат, LRU)
+
+    Состояние появляется с первым изменением: чтение снимка комнаты без
+    изменений возвращает начальный документ и ничего не хранит.
+    Вытесняются только комнаты, для которых pinned(room_id) ложно
+    (например, в которых никого нет).
+
+    Args:
+        log_size: Сколько изменений хранить на комнату
+        max_rooms: Сколько комнат держать в памяти
+        pinned: Нельзя ли вытеснять комнату
+    """
+
+    def __init__(self, log_size: int = STATE_LOG_SIZE, max_rooms: int = STATE_MAX_ROOMS,
+                 pinned: Optional[Callable[[str], bool]] = None):
+        self.log_size = log_size
+        self.max_rooms = max_rooms
+        self.pinned = pinned
+        # Меняется при перезапуске: seq другой эпохи клиенту не подходит
+        self.epoch = uuid.uuid4().hex[:12]
+        self._rooms: "OrderedDict[str, _RoomState]" = OrderedDict()
+        self.patches = 0
+        self.rejected = 0
+
+    def _evict(self, keep: str):
+        """Вытеснение самых давно не менявшихся комнат без участников (кроме keep)"""
+        while len(self._rooms) > self.max_rooms:
+            for room_id in self._rooms:
+                if room_id != keep and (self.pinned is None or not self.pinned(room_id)):
+                    del self._rooms[room_id]
+                    break
+            else:
+                # Все комнаты заняты - лучше превысить лимит, чем потерять их состояние
+                return
+
+    def _room(self, room_id: str) -> _RoomState:
+        state = self._rooms.get(room_id)
+        if state is None:
+            state = self._rooms[room_id] = _RoomState(self.log_size)
+            self._evict(room_id)
+        else:
+            self._rooms.move_to_end(room_id)
+        return state
+
+    def snapshot(self, room_id: str) -> dict:
+        """Полный снимок состояния комнаты (документ изменять нельзя)"""
+        state = self._rooms.get(room_id)
+        if state is None:
+            return {"room_id": room_id, "seq": 0, "epoch": self.epoch, "state": copy.deepcopy(INITIAL_STATE)}
+        self._rooms.move_to_end(room_id)
+        return {"room_id": room_id, "seq": state.seq, "epoch": self.epoch, "state": state.document}
+
+    def apply(self, room_id: str, ops: list) -> dict:
+        """
+        Применение изменения к состоянию комнаты
+
+        Returns:
+            dict: Изменение для клиентов: room_id, seq, ops
+
+        Raises:
+            StatePatchError: Если изменение некорректно (состояние не меняется)
+        """
+        if not isinstance(ops, list) or not ops:
+            raise StatePatchError("Нужен непустой список операций")
+        if len(ops) > MAX_PATCH_OPS:
+            raise StatePatchError(f"Слишком много операций (не больше {MAX_PATCH_OPS})")
+
+        state = self._room(room_id)
+        try:
+            apply_patch(state.document, ops)
+        except StatePatchError:
+            self.rejected += 1
+            raise
+
+        state.seq += 1
+        if len(state.log) == state.log.maxlen:
+            state.base = state.log[0][0]
+        state.log.append((state.seq, ops))
+        self.patches += 1
+        return {"room_id": room_id, "seq": state.seq, "ops": ops}
+
+    def since(self, room_id: str, seq: Optional[int], epoch: Optional[str] = None) -> dict:
+        """
+        Изменения после seq (или снимок, если их уже нет в журнале)
+
+        Returns:
+            dict: snapshot=False и patches [{seq, ops}] - изменения;
+                  snapshot=True и state - полный документ.
+                  Всегда: room_id, seq, epoch.
+        """
+        state = self._rooms.get(room_id)
+        if state is None or seq is None or epoch != self.epoch or seq > state.seq or seq < state.base:
+            return {"snapshot": True, **self.snapshot(room_id)}
+
+        patches = [{"seq": entry_seq, "ops": ops} for entry_seq, ops in state.log if entry_seq > seq]
+        return {"snapshot": False, "room_id": room_id, "seq": state.seq, "epoch": self.epoch, "patches": patches}
+
+    def load(self, room_id: str, document: dict, seq: int) -> bool:
+        """
+        Снимок с другого воркера: заменяет локальное состояние, если он новее
+
+        Returns:
+            bool: True, если снимок принят
+        """
+        state = self._rooms.get(room_id)
+        if state is not None and state.seq >= seq:
+            return False
+        self._rooms[room_id] = _RoomState(self.log_size, document, seq)
+        self._evict(room_id)
+        return True
+
+    def drop(self, room_id: str):
+        """Забыть состояние удаленной комнаты"""
+        self._rooms.pop(room_id, None)
+
+    def states(self):
+        """(room_id, документ, seq) всех комнат в памяти"""
+        return [(room_id, state.document, state.seq) for room_id, state in self._rooms.items()]
+
+    def metrics(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "patches": self.patches,
+            "rejected": self.rejected,
+        }
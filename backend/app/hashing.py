@@ -0,0 +1,240 @@
+"""
+Пул процессов для хеширования паролей bcrypt
+
+bcrypt намеренно медленный (100–300 мс на вызов), поэтому в async-обработчиках
+его нельзя вызывать напрямую: это блокирует event loop и все Socket.IO комнаты
+воркера. Здесь вызовы выполняются в отдельных процессах с ограниченной очередью.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import bcrypt
+
+# Настройки пула (можно переопределить через переменные окружения)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+
+# Целевая стоимость bcrypt (log2 числа раундов). 12 - значение по умолчанию библиотеки.
+# Если задан BCRYPT_TARGET_MS, при запуске стоимость подбирается под это время.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "0"))
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+
+# Bcrypt имеет ограничение в 72 байта
+BCRYPT_MAX_BYTES = 72
+
+# Текущая стоимость для новых хешей
+_rounds = min(max(BCRYPT_ROUNDS, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+
+
+class HashingQueueFull(Exception):
+    """Очередь задач хеширования переполнена"""
+
+
+def _password_bytes(password: str) -> bytes:
+    """Кодирование пароля с учетом ограничения bcrypt"""
+    return password.encode('utf-8')[:BCRYPT_MAX_BYTES]
+
+
+def get_rounds() -> int:
+    """Текущая стоимость bcrypt для новых хешей"""
+    return _rounds
+
+
+def set_rounds(rounds: int):
+    """Изменить стоимость bcrypt для новых хешей"""
+    global _rounds, _dummy_hash
+    _rounds = min(max(rounds, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+    # Заглушка должна проверяться так же долго, как настоящие хеши
+    _dummy_hash = None
+
+
+def hash_rounds(hashed_password: str) -> int:
+    """Стоимость, с которой был создан хеш ($2b$12$... -> 12)"""
+    try:
+        return int(hashed_password.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    Нужно ли перехешировать пароль под текущую стоимость
+
+    Только если хеш дешевле текущей стоимости: при калибровке каждый
+    воркер подбирает стоимость сам, и из-за погрешности замера она может
+    отличаться на единицу. Перехеширование "вниз" заставило бы хеши
+    переключаться между стоимостями воркеров при каждом входе.
+    """
+    return hash_rounds(hashed_password) < _rounds
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    """Хеширование пароля (синхронно, в текущем процессе)"""
+    salt = bcrypt.gensalt(rounds=rounds or _rounds)
+    return bcrypt.hashpw(_password_bytes(password), salt).decode('utf-8')
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля (синхронно, в текущем процессе)"""
+    return bcrypt.checkpw(_password_bytes(plain_password), hashed_password.encode('utf-8'))
+
+
+def calibrate_rounds(target_ms: float, probe_rounds: int = 8, samples: int = 3) -> int:
+    """
+    Подбор стоимости bcrypt под целевое время хеширования
+
+    Каждый дополнительный раунд удваивает время, поэтому достаточно замерить
+    дешевую стоимость и экстраполировать. Возвращается наибольшая стоимость,
+    укладывающаяся в target_ms, но не ниже BCRYPT_MIN_ROUNDS.
+    """
+    salt = bcrypt.gensalt(rounds=probe_rounds)
+    best = float("inf")
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b"calibration-password", salt)
+        best = min(best, time.perf_counter() - started)
+
+    rounds = BCRYPT_MIN_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and best * 1000 * 2 ** (rounds + 1 - probe_rounds) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+def _timed_call(func: Callable, *args):
+    """
+    Выполнение функции в процессе-воркере
+
+    Возвращает момент начала выполнения, чтобы родительский процесс мог
+    посчитать время ожидания в очереди (time.monotonic общий для всех процессов).
+    """
+    return time.monotonic(), func(*args)
+
+
+class HashingExecutor:
+    """
+    Ограниченный пул процессов для bcrypt
+
+    Если задач в работе и в очереди больше max_queue, новые задачи сразу
+    отклоняются с HashingQueueFull, чтобы не копить бесконечную очередь.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+
+        # Метрики
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def start(self):
+        """Запуск пула процессов"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self):
+        """Остановка пула процессов"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество задач, ожидающих свободного воркера"""
+        return max(0, self._in_flight - self.workers)
+
+    async def run(self, func: Callable, *args):
+        """
+        Выполнение функции в пуле
+
+        Raises:
+            HashingQueueFull: Если очередь заполнена
+        """
+        if self._in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HashingQueueFull()
+
+        self.start()
+        self._in_flight += 1
+        self.submitted += 1
+        enqueued_at = time.monotonic()
+
+        try:
+            loop = asyncio.get_running_loop()
+            started_at, result = await loop.run_in_executor(
+                self._pool, _timed_call, func, *args
+            )
+        finally:
+            self._in_flight -= 1
+
+        wait = max(0.0, started_at - enqueued_at)
+        self.completed += 1
+        self.total_wait += wait
+        self.last_wait = wait
+        self.max_wait = max(self.max_wait, wait)
+
+        return result
+
+    def metrics(self) -> dict:
+        """Метрики пула для /health"""
+        avg_wait = self.total_wait / self.completed if self.completed else 0.0
+        return {
+            "bcrypt_rounds": _rounds,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_ms_avg": round(avg_wait * 1000, 3),
+            "wait_ms_max": round(self.max_wait * 1000, 3),
+            "wait_ms_last": round(self.last_wait * 1000, 3),
+        }
+
+
+# Хеш-заглушка: проверка пароля для несуществующего пользователя занимает
+# столько же времени, сколько для существующего
+_DUMMY_PASSWORD = "dummy-password-for-uniform-timing"
+_dummy_hash: Optional[str] = None
+
+
+def dummy_hash() -> str:
+    """Хеш-заглушка (вычисляется один раз)"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(_DUMMY_PASSWORD)
+    return _dummy_hash
+
+
+# Общий пул приложения
+hashing_executor = HashingExecutor(HASH_WORKERS, HASH_QUEUE_SIZE)
+
+
+async def hash_password_async(password: str) -> str:
+    """Хеширование пароля в пуле процессов с текущей стоимостью"""
+    # Стоимость передается явно: у процессов-воркеров свое состояние модуля
+    return await hashing_executor.run(hash_password, password, _rounds)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля в пуле процессов"""
+    return await hashing_executor.run(check_password, plain_password, hashed_password)
+
+
+async def dummy_hash_async() -> str:
+    """Хеш-заглушка, первый раз вычисляется в пуле процессов"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_password_async(_DUMMY_PASSWORD)
+    return _dummy_hash
@@ -0,0 +1,199 @@
+"""
+История событий игровых комнат
+
+Для каждой комнаты в памяти хранятся последние HISTORY_SIZE событий
+чата и бросков (кольцевой буфер), а число комнат в памяти ограничено
+HISTORY_MAX_ROOMS с вытеснением давно неактивных (LRU).
+Игрок, вошедший в комнату, получает историю одним ответом на join_room.
+
+Если задан HISTORY_LOG_DIR, события дописываются в журнал комнаты
+(NDJSON, только добавление). Комната, вытесненная из памяти или
+после перезапуска сервера, восстанавливается из хвоста журнала.
+Запись и чтение журнала идут в отдельном потоке по очереди, чтобы
+диск не блокировал event loop, а чтение видело все записи перед ним.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional
+
+import orjson
+
+HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", "100"))
+HISTORY_MAX_ROOMS = int(os.getenv("HISTORY_MAX_ROOMS", "10000"))
+HISTORY_LOG_DIR = os.getenv("HISTORY_LOG_DIR", "")
+# Сколько файлов журнала держать открытыми одновременно
+HISTORY_OPEN_FILES = 64
+
+_READ_BLOCK = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _read_tail(path: str, count: int) -> List[bytes]:
+    """Последние count строк файла (чтение блоками с конца)"""
+    with open(path, "rb") as log:
+        log.seek(0, os.SEEK_END)
+        position = log.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(_READ_BLOCK, position)
+            position -= step
+            log.seek(position)
+            data = log.read(step) + data
+    return [line for line in data.splitlines() if line][-count:]
+
+
+class RoomLog:
+    """
+    Журналы комнат на диске: по файлу на комнату, только добавление
+
+    Все операции с файлами выполняет один поток, в порядке вызова.
+    """
+
+    def __init__(self, directory: str, open_files: int = HISTORY_OPEN_FILES):
+        self.directory = directory
+        self.open_files = open_files
+        self._files: "OrderedDict[str, object]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-log")
+        self.write_errors = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, room_id: str) -> str:
+        # ID комнаты задает клиент, поэтому в имени файла только хеш
+        digest = hashlib.sha1(room_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.ndjson")
+
+    def append(self, room_id: str, entry: dict):
+        """Поставить запись в очередь на диск (не дожидаясь записи)"""
+        self._executor.submit(self._write, room_id, orjson.dumps(entry) + b"\n").add_done_callback(self._written)
+
+    def _written(self, future: Future):
+        if future.exception() is not None:
+            self.write_errors += 1
+            logger.error("Не удалось записать журнал истории: %s", future.exception())
+
+    def _write(self, room_id: str, line: bytes):
+        log = self._files.get(room_id)
+        if log is None:
+            log = open(self.path(room_id), "ab", buffering=0)
+            self._files[room_id] = log
+            if len(self._files) > self.open_files:
+                _, oldest = self._files.popitem(last=False)
+                oldest.close()
+        else:
+            self._files.move_to_end(room_id)
+        log.write(line)
+
+    async def tail(self, room_id: str, count: int) -> List[dict]:
+        """Последние count записей журнала комнаты (после всех уже поставленных записей)"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._tail, room_id, count)
+
+    def _tail(self, room_id: str, count: int) -> List[dict]:
+        path = self.path(room_id)
+        if not os.path.exists(path):
+            return []
+        return [orjson.loads(line) for line in _read_tail(path, count)]
+
+    def _close_files(self):
+        for log in self._files.values():
+            log.close()
+        self._files.clear()
+
+    def close(self):
+        """Дописать очередь и закрыть файлы"""
+        self._executor.submit(self._close_files)
+        self._executor.shutdown(wait=True)
+
+
+class RoomHistory:
+    """
+    Последние события комнат в памяти (с необязательным журналом на диске)
+
+    Args:
+        size: Сколько событий хранить на комнату
+        max_rooms: Сколько комнат держать в памяти
+        log_dir: Папка журналов (None - только память)
+    """
+
+    def __init__(self, size: int = HISTORY_SIZE, max_rooms: int = HISTORY_MAX_ROOMS, log_dir: Optional[str] = None):
+        self.size = size
+        self.max_rooms = max(1, max_rooms)
+        self.log = RoomLog(log_dir) if log_dir else None
+        self._rooms: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+
+    async def _buffer(self, room_id: str) -> Deque[dict]:
+        buffer = self._rooms.get(room_id)
+        if buffer is not None:
+            self._rooms.move_to_end(room_id)
+            return buffer
+
+        loaded = await self.log.tail(room_id, self.size) if self.log else ()
+        # Пока читался журнал, комнату мог загрузить другой вызов
+        buffer = self._rooms.get(room_id)
+        if buffer is not None:
+            self._rooms.move_to_end(room_id)
+            return buffer
+        buffer = deque(loaded, maxlen=self.size)
+        self._rooms[room_id] = buffer
+        if len(self._rooms) > self.max_rooms:
+            self._rooms.popitem(last=False)
+        return buffer
+
+    async def append(self, room_id: str, event: str, data: dict, persist: bool = True, event_id: Optional[str] = None) -> dict:
+        """
+        Добавить событие в историю комнаты
+
+        Args:
+            room_id: ID комнаты
+            event: Имя события
+            data: Данные события
+            persist: Записать в журнал (False - событие уже записано другим воркером)
+            event_id: ID события (по нему событие с другого воркера не добавляется дважды)
+
+        Returns:
+            dict: Запись истории {id, event, data}
+        """
+        entry = {"id": event_id or uuid.uuid4().hex[:16], "event": event, "data": data}
+        buffer = await self._buffer(room_id)
+        # Комната могла только что загрузиться из журнала, куда событие уже записал другой воркер
+        if not persist and any(known.get("id") == entry["id"] for known in buffer):
+            return entry
+        buffer.append(entry)
+        if persist and self.log is not None:
+            self.log.append(room_id, entry)
+        return entry
+
+    async def recent(self, room_id: str, limit: Optional[int] = None) -> List[dict]:
+        """
+        Последние события комнаты, от старых к новым
+
+        Комнату, которой нет в памяти, читает из журнала, но в память
+        не загружает: запрос истории не должен вытеснять активные комнаты.
+        """
+        buffer = self._rooms.get(room_id)
+        if buffer is not None:
+            events = list(buffer)
+        elif self.log is not None:
+            events = await self.log.tail(room_id, self.size)
+        else:
+            return []
+        if limit is not None:
+            events = events[-limit:] if limit > 0 else []
+        return events
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+    def metrics(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "size": self.size,
+            "log_dir": self.log.directory if self.log else None,
+            "log_write_errors": self.log.write_errors if self.log else 0,
+        }
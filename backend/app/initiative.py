@@ -0,0 +1,498 @@
+"""
+Трекер инициативы и очередности ходов
+
+Порядок ходов: по убыванию инициативы, затем по убыванию tiebreak
+(обычно модификатор Ловкости), затем по времени добавления.
+
+Участники хранятся в двух кучах, разделенных позицией последнего
+начатого хода:
+    pending - еще не ходили в этом раунде (ключ больше позиции)
+    done    - уже ходили (ключ не больше позиции), походят в следующем раунде
+Следующий ход - минимум pending; когда pending пуст, начинается новый
+раунд и кучи меняются местами. Добавление, удаление, задержка хода
+и следующий ход стоят O(log n): удаленные и переставленные записи
+остаются в куче и пропускаются при извлечении (ленивое удаление).
+
+Эффекты (оглушение, благословение и т.п.) привязаны к ходу участника
+anchor и истекают после rounds окончаний (или начал) его хода.
+
+Каждая команда возвращает только изменившиеся записи, а не весь порядок.
+"""
+import heapq
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+MAX_COMBATANTS = 500
+MAX_EFFECTS = 20  # на участника
+MAX_NAME_LENGTH = 50
+
+EFFECT_END = "end"
+EFFECT_START = "start"
+
+Key = Tuple[float, float, int]
+
+
+class InitiativeError(ValueError):
+    """Некорректная команда трекера инициативы"""
+
+
+@dataclass
+class Effect:
+    """Эффект на участнике с длительностью в ходах anchor"""
+    id: str
+    name: str
+    target: str
+    anchor: str
+    remaining: int
+    at: str = EFFECT_END
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "target": self.target,
+            "anchor": self.anchor,
+            "remaining": self.remaining,
+            "at": self.at,
+        }
+
+
+@dataclass
+class Combatant:
+    """Участник боя"""
+    id: str
+    name: str
+    initiative: float
+    tiebreak: float
+    order: int
+    user_id: Optional[int] = None
+    ready: bool = False
+    effects: Dict[str, Effect] = field(default_factory=dict)
+    # Номер актуальной записи в куче (старые записи пропускаются)
+    token: int = 0
+
+    @property
+    def key(self) -> Key:
+        return (-self.initiative, -self.tiebreak, self.order)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "initiative": self.initiative,
+            "tiebreak": self.tiebreak,
+            "order": self.order,
+            "user_id": self.user_id,
+            "ready": self.ready,
+            "effects": [effect.to_dict() for effect in self.effects.values()],
+        }
+
+
+def _number(value, name: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise InitiativeError(f"{name} должно быть числом")
+    return value
+
+
+class InitiativeTracker:
+    """Очередность ходов одной комнаты"""
+
+    def __init__(self):
+        self.round = 0
+        self.current: Optional[str] = None
+        self.version = 0
+        self._combatants: Dict[str, Combatant] = {}
+        self._pending: List[Tuple[Key, int, str]] = []
+        self._done: List[Tuple[Key, int, str]] = []
+        # Ключ последнего начатого хода (None - раунд еще не начался)
+        self._position: Optional[Key] = None
+        # anchor -> эффекты, которые тикают в ход anchor
+        self._anchored: Dict[str, Set[Tuple[str, str]]] = {}
+        self._counter = 0
+        self._effect_counter = 0
+        self._tokens = 0
+
+        self._changed: Set[str] = set()
+        self._removed: List[str] = []
+        self._expired: List[dict] = []
+
+    # --- Кучи ---
+
+    def _push(self, combatant: Combatant):
+        self._tokens += 1
+        combatant.token = self._tokens
+        entry = (combatant.key, combatant.token, combatant.id)
+        if self._position is None or combatant.key > self._position:
+            heapq.heappush(self._pending, entry)
+        else:
+            heapq.heappush(self._done, entry)
+        self._compact()
+
+    def _valid(self, entry) -> bool:
+        combatant = self._combatants.get(entry[2])
+        return combatant is not None and combatant.token == entry[1]
+
+    def _compact(self):
+        """Очистка куч от устаревших записей, если их стало больше живых"""
+        if len(self._pending) + len(self._done) > 2 * len(self._combatants) + 32:
+            self._pending = [entry for entry in self._pending if self._valid(entry)]
+            self._done = [entry for entry in self._done if self._valid(entry)]
+            heapq.heapify(self._pending)
+            heapq.heapify(self._done)
+
+    def _pop_next(self) -> Optional[Combatant]:
+        for _ in range(2):
+            while self._pending:
+                entry = heapq.heappop(self._pending)
+                if self._valid(entry):
+                    heapq.heappush(self._done, entry)
+                    return self._combatants[entry[2]]
+            # Все походили - новый раунд
+            if not self._done:
+                return None
+            self._pending, self._done = self._done, []
+            self._position = None
+            self.round += 1
+        return None
+
+    # --- Участники ---
+
+    def _get(self, combatant_id) -> Combatant:
+        if not isinstance(combatant_id, str):
+            raise InitiativeError("ID участника должен быть строкой")
+        combatant = self._combatants.get(combatant_id)
+        if combatant is None:
+            raise InitiativeError(f"Участник не найден: {combatant_id}")
+        return combatant
+
+    def add(self, name: str, initiative, tiebreak=0, combatant_id: Optional[str] = None, user_id: Optional[int] = None) -> Combatant:
+        """Добавление участника (в бою он походит в этом раунде, если его инициатива еще не прошла)"""
+        if not isinstance(name, str) or not 0 < len(name.strip()) <= MAX_NAME_LENGTH:
+            raise InitiativeError(f"Имя участника должно быть от 1 до {MAX_NAME_LENGTH} символов")
+        if len(self._combatants) >= MAX_COMBATANTS:
+            raise InitiativeError(f"Не больше {MAX_COMBATANTS} участников")
+
+        self._counter += 1
+        combatant_id = str(combatant_id) if combatant_id is not None else f"c{self._counter}"
+        if combatant_id in self._combatants:
+            raise InitiativeError(f"Участник {combatant_id} уже есть")
+
+        combatant = Combatant(
+            combatant_id, name.strip(), _number(initiative, "initiative"), _number(tiebreak, "tiebreak"),
+            self._counter, user_id if isinstance(user_id, int) else None
+        )
+        self._combatants[combatant_id] = combatant
+        self._push(combatant)
+        self._changed.add(combatant_id)
+        return combatant
+
+    def remove(self, combatant_id: str):
+        combatant = self._get(combatant_id)
+        del self._combatants[combatant_id]
+        # Запись в куче станет недействительной и пропустится
+        for effect in list(combatant.effects.values()):
+            self._drop_effect(effect)
+        for target_id, effect_id in list(self._anchored.pop(combatant_id, ())):
+            # Эффекты, которые тикали в ход удаленного участника, снимаются
+            target = self._combatants.get(target_id)
+            if target is not None and effect_id in target.effects:
+                self._expire(target.effects[effect_id])
+        if self.current == combatant_id:
+            self.current = None
+        self._changed.discard(combatant_id)
+        self._removed.append(combatant_id)
+
+    def delay(self, combatant_id: str, initiative, tiebreak=None):
+        """
+        Задержка хода: участник переносится на новую инициативу
+
+        Если новая инициатива еще не прошла в этом раунде, участник
+        походит в этом раунде, иначе - в следующем.
+        """
+        combatant = self._get(combatant_id)
+        initiative = _number(initiative, "initiative")
+        tiebreak = combatant.tiebreak if tiebreak is None else _number(tiebreak, "tiebreak")
+        combatant.initiative = initiative
+        combatant.tiebreak = tiebreak
+        self._counter += 1
+        combatant.order = self._counter
+        if self.current == combatant_id:
+            # Ход не завершен - эффекты конца хода не тикают
+            self.current = None
+        self._push(combatant)
+        self._changed.add(combatant_id)
+
+    def set_ready(self, combatant_id: str, ready: bool = True):
+        """Подготовленное действие (снимается в начале следующего хода участника)"""
+        combatant = self._get(combatant_id)
+        combatant.ready = bool(ready)
+        self._changed.add(combatant_id)
+
+    # --- Эффекты ---
+
+    def add_effect(self, target_id: str, name: str, rounds, anchor_id: Optional[str] = None, at: str = EFFECT_END) -> Effect:
+        """
+        Эффект на участнике
+
+        Args:
+            target_id: На ком эффект
+            name: Название
+            rounds: Сколько раз эффект переживет конец (или начало) хода anchor
+            anchor_id: В чей ход считается длительность (по умолчанию - target)
+            at: end или start - в конце или в начале хода anchor
+        """
+        target = self._get(target_id)
+        anchor_id = target_id if anchor_id is None else anchor_id
+        self._get(anchor_id)
+        if at not in (EFFECT_END, EFFECT_START):
+            raise InitiativeError("at должно быть end или start")
+        if isinstance(rounds, bool) or not isinstance(rounds, int) or rounds < 1:
+            raise InitiativeError("rounds должно быть целым числом больше 0")
+        if not isinstance(name, str) or not 0 < len(name.strip()) <= MAX_NAME_LENGTH:
+            raise InitiativeError(f"Название эффекта должно быть от 1 до {MAX_NAME_LENGTH} символов")
+        if len(target.effects) >= MAX_EFFECTS:
+            raise InitiativeError(f"Не больше {MAX_EFFECTS} эффектов на участнике")
+
+        self._effect_counter += 1
+        effect = Effect(f"e{self._effect_counter}", name.strip(), target_id, anchor_id, rounds, at)
+        target.effects[effect.id] = effect
+        self._anchored.setdefault(anchor_id, set()).add((target_id, effect.id))
+        self._changed.add(target_id)
+        return effect
+
+    def remove_effect(self, effect_id: str):
+        if not isinstance(effect_id, str):
+            raise InitiativeError("ID эффекта должен быть строкой")
+        for combatant in self._combatants.values():
+            effect = combatant.effects.get(effect_id)
+            if effect is not None:
+                self._drop_effect(effect)
+                self._changed.add(combatant.id)
+                return
+        raise InitiativeError(f"Эффект не найден: {effect_id}")
+
+    def _drop_effect(self, effect: Effect):
+        target = self._combatants.get(effect.target)
+        if target is not None:
+            target.effects.pop(effect.id, None)
+        anchored = self._anchored.get(effect.anchor)
+        if anchored is not None:
+            anchored.discard((effect.target, effect.id))
+            if not anchored:
+                del self._anchored[effect.anchor]
+
+    def _expire(self, effect: Effect):
+        self._drop_effect(effect)
+        self._changed.add(effect.target)
+        self._expired.append(effect.to_dict())
+
+    def _tick(self, anchor_id: str, at: str):
+        """Ход anchor начался или закончился: у привязанных эффектов убывает длительность"""
+        for target_id, effect_id in list(self._anchored.get(anchor_id, ())):
+            effect = self._combatants[target_id].effects[effect_id]
+            if effect.at != at:
+                continue
+            effect.remaining -= 1
+            if effect.remaining <= 0:
+                self._expire(effect)
+            else:
+                self._changed.add(target_id)
+
+    # --- Ходы ---
+
+    def next_turn(self) -> Optional[Combatant]:
+        """Конец текущего хода и начало следующего"""
+        if not self._combatants:
+            raise InitiativeError("В бою нет участников")
+        if self.current is not None:
+            self._tick(self.current, EFFECT_END)
+
+        combatant = self._pop_next()
+        if self.round == 0:
+            self.round = 1
+        self.current = combatant.id
+        self._position = combatant.key
+        if combatant.ready:
+            combatant.ready = False
+            self._changed.add(combatant.id)
+        self._tick(combatant.id, EFFECT_START)
+        return combatant
+
+    def clear(self):
+        """Конец боя"""
+        removed = self._removed + list(self._combatants)
+        version = self.version
+        self.__init__()
+        self.version = version
+        self._removed = removed
+
+    # --- Команды и изменения ---
+
+    def execute(self, action: str, args: dict) -> dict:
+        """
+        Выполнение команды клиента
+
+        Returns:
+            dict: Изменения для комнаты (см. flush)
+
+        Raises:
+            InitiativeError: Некорректная команда (трекер не меняется)
+        """
+        if action == "add":
+            self.add(args.get("name"), args.get("initiative"), args.get("tiebreak", 0), args.get("id"), args.get("user_id"))
+        elif action == "remove":
+            self.remove(args.get("id"))
+        elif action == "next":
+            self.next_turn()
+        elif action == "delay":
+            self.delay(args.get("id"), args.get("initiative"), args.get("tiebreak"))
+        elif action == "ready":
+            self.set_ready(args.get("id"), args.get("ready", True))
+        elif action == "effect_add":
+            self.add_effect(args.get("id"), args.get("name"), args.get("rounds"), args.get("anchor"), args.get("at", EFFECT_END))
+        elif action == "effect_remove":
+            self.remove_effect(args.get("effect_id"))
+        elif action == "end":
+            self.clear()
+        else:
+            raise InitiativeError(f"Неизвестная команда: {action}")
+        return self.flush()
+
+    def flush(self) -> dict:
+        """
+        Изменения с прошлого вызова
+
+        Returns:
+            dict: version, round, current, changed (записи участников),
+                  removed (ID), expired (истекшие эффекты)
+        """
+        self.version += 1
+        update = {
+            "version": self.version,
+            "round": self.round,
+            "current": self.current,
+            "changed": [self._combatants[cid].to_dict() for cid in self._changed if cid in self._combatants],
+            "removed": self._removed,
+            "expired": self._expired,
+        }
+        self._changed = set()
+        self._removed = []
+        self._expired = []
+        return update
+
+    def snapshot(self) -> dict:
+        """Полное состояние: участники в порядке ходов"""
+        combatants = sorted(self._combatants.values(), key=lambda c: c.key)
+        return {
+            "version": self.version,
+            "round": self.round,
+            "current": self.current,
+            "combatants": [combatant.to_dict() for combatant in combatants],
+        }
+
+    def to_state(self) -> dict:
+        """Внутреннее состояние для передачи другому воркеру"""
+        return {
+            "round": self.round,
+            "current": self.current,
+            "version": self.version,
+            "position": self._position,
+            "counter": self._counter,
+            "effect_counter": self._effect_counter,
+            "combatants": [combatant.to_dict() for combatant in self._combatants.values()],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "InitiativeTracker":
+        tracker = cls()
+        tracker.round = state["round"]
+        tracker.current = state["current"]
+        tracker.version = state["version"]
+        tracker._position = tuple(state["position"]) if state["position"] is not None else None
+        for data in state["combatants"]:
+            combatant = Combatant(
+                data["id"], data["name"], data["initiative"], data["tiebreak"], data["order"],
+                data["user_id"], data["ready"]
+            )
+            for effect_data in data["effects"]:
+                effect = Effect(**effect_data)
+                combatant.effects[effect.id] = effect
+                tracker._anchored.setdefault(effect.anchor, set()).add((effect.target, effect.id))
+            tracker._combatants[combatant.id] = combatant
+            tracker._push(combatant)
+        tracker._counter = state["counter"]
+        tracker._effect_counter = state["effect_counter"]
+        return tracker
+
+    def __len__(self):
+        return len(self._combatants)
+
+
+class InitiativeStore:
+    """Трекеры инициативы по комнатам (трекер появляется с первым участником)"""
+
+    def __init__(self):
+        self._trackers: Dict[str, InitiativeTracker] = {}
+        # Последний version закончившихся боев: новый бой продолжает нумерацию,
+        # иначе клиенты и load() приняли бы его изменения за устаревшие
+        self._ended: Dict[str, int] = {}
+        self.commands = 0
+
+    def _new_tracker(self, room_id: str) -> InitiativeTracker:
+        tracker = InitiativeTracker()
+        tracker.version = self._ended.get(room_id, 0)
+        return tracker
+
+    def execute(self, room_id: str, action: str, args: dict) -> dict:
+        """
+        Команда трекеру комнаты
+
+        Returns:
+            dict: Изменения с room_id
+        """
+        tracker = self._trackers.get(room_id)
+        if tracker is None:
+            tracker = self._new_tracker(room_id)
+        update = tracker.execute(action, args)
+        if len(tracker):
+            self._trackers[room_id] = tracker
+            self._ended.pop(room_id, None)
+        else:
+            # Бой закончен или участников не осталось
+            self._trackers.pop(room_id, None)
+            self._ended[room_id] = tracker.version
+        self.commands += 1
+        return {"room_id": room_id, **update}
+
+    def snapshot(self, room_id: str) -> dict:
+        tracker = self._trackers.get(room_id) or self._new_tracker(room_id)
+        return {"room_id": room_id, **tracker.snapshot()}
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._trackers
+
+    def drop(self, room_id: str):
+        """Забыть трекер и номер версии удаленной комнаты"""
+        self._trackers.pop(room_id, None)
+        self._ended.pop(room_id, None)
+
+    def states(self) -> Dict[str, dict]:
+        return {room_id: tracker.to_state() for room_id, tracker in self._trackers.items()}
+
+    def load(self, room_id: str, state: dict) -> bool:
+        """Состояние с другого воркера (принимается, если оно новее)"""
+        tracker = self._trackers.get(room_id)
+        known = tracker.version if tracker is not None else self._ended.get(room_id, 0)
+        if known >= state["version"]:
+            return False
+        self._trackers[room_id] = InitiativeTracker.from_state(state)
+        self._ended.pop(room_id, None)
+        return True
+
+    def metrics(self) -> dict:
+        return {
+            "rooms": len(self._trackers),
+            "combatants": sum(len(tracker) for tracker in self._trackers.values()),
+            "commands": self.commands,
+        }
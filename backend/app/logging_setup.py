@@ -0,0 +1,190 @@
+"""
+Настройка логирования приложения
+
+Обработчики логов не пишут в stdout из обработчиков запросов и событий.
+Запись кладется в очередь (QueueHandler), а вывод делает фоновый поток
+(QueueListener). Если очередь переполнена, запись отбрасывается, а не
+блокирует цикл событий.
+
+Частые события Socket.IO можно прореживать и фильтровать по уровню.
+Для этого в запись передается имя события через extra={"event": ...}:
+    LOG_SAMPLING=chat_message=0.01,dice_roll=0.1  - доля сохраняемых записей
+    LOG_EVENT_LEVELS=connect=WARNING              - минимальный уровень события
+
+Переменные окружения:
+    LOG_LEVEL - уровень корневого логгера (по умолчанию INFO)
+    LOG_FORMAT - text или json (одна JSON-строка на запись)
+    LOG_QUEUE_SIZE - размер очереди записей
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+import orjson
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_EVENT_LEVELS = os.getenv("LOG_EVENT_LEVELS", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Стандартные поля LogRecord: все остальные пришли через extra
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    """'a=1,b=2' -> {'a': '1', 'b': '2'}"""
+    pairs = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, _, val = item.partition("=")
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+def _event_levels(value: str) -> Dict[str, int]:
+    """
+    'connect=WARNING' -> {'connect': logging.WARNING}
+
+    Raises:
+        ValueError: Неизвестное имя уровня
+    """
+    levels = {}
+    for event, name in _parse_pairs(value).items():
+        level = logging.getLevelName(name.upper())
+        # Для неизвестного имени getLevelName возвращает строку "Level ..."
+        if not isinstance(level, int):
+            raise ValueError(f"LOG_EVENT_LEVELS: неизвестный уровень '{name}' для события '{event}'")
+        levels[event] = level
+    return levels
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога -> одна строка JSON (поля extra выводятся как есть)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """Обычный текстовый формат, поля extra дописываются как key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extra = _extra_fields(record)
+        if extra:
+            text += " " + " ".join(f"{key}={value}" for key, value in extra.items())
+        return text
+
+
+class EventFilter(logging.Filter):
+    """
+    Прореживание и уровни для записей с полем event
+
+    Args:
+        sampling: event -> доля сохраняемых записей (0..1)
+        levels: event -> минимальный уровень записи
+    """
+
+    def __init__(self, sampling: Dict[str, float], levels: Dict[str, int]):
+        super().__init__()
+        self.sampling = sampling
+        self.levels = levels
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None:
+            return True
+        if record.levelno < self.levels.get(event, 0):
+            return False
+        rate = self.sampling.get(event)
+        # Предупреждения и ошибки не прореживаются
+        return rate is None or record.levelno >= logging.WARNING or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который при переполнении очереди отбрасывает запись"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> QueueListener:
+    """
+    Подключение асинхронного логирования к корневому логгеру (повторный вызов ничего не делает)
+
+    Returns:
+        QueueListener: Фоновый поток вывода
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    if _handler is not None:
+        # Повторная настройка после shutdown_logging
+        root.removeHandler(_handler)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(EventFilter(
+        sampling={event: float(rate) for event, rate in _parse_pairs(LOG_SAMPLING).items()},
+        levels=_event_levels(LOG_EVENT_LEVELS),
+    ))
+
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Вывод оставшихся записей и остановка фонового потока"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def metrics() -> dict:
+    return {"dropped": _handler.dropped if _handler else 0}
@@ -1,14 +1,45 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import os
 
+from app.logging_setup import setup_logging, shutdown_logging, metrics as logging_metrics
+
+# Логи пишутся из фонового потока (до импорта модулей, которые пишут логи)
+setup_logging()
+
 # Импорт роутов и Socket.IO
 from app.routes_users import router as users_router
-from app.socketio_server import socketio_app, sio
-from app.bd import init_db
+from app.socketio_server import (
+    socketio_app,
+    sio,
+    start_cluster,
+    client_manager,
+    registry,
+    batcher,
+    history,
+    presence_notifier,
+    directory,
+    game_state,
+    initiative,
+    battle_maps,
+    movement,
+    visibility,
+    SOCKETIO_SERIALIZER
+)
+from app.bd import init_db, async_engine
+from app.hashing import (
+    hashing_executor,
+    HashingQueueFull,
+    BCRYPT_TARGET_MS,
+    calibrate_rounds,
+    set_rounds,
+    get_rounds
+)
+from app.cache import auth_cache
+from app.responses import FastJSONResponse
+from app.rate_limit import login_throttle
 
 # Создание FastAPI приложения
 app = FastAPI(
@@ -16,7 +47,8 @@ app = FastAPI(
     description="API для приложения Dungeons & Dragons с поддержкой Socket.IO",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
 # Настройка CORS
@@ -44,6 +76,14 @@ async def startup_event():
     print("🚀 Запуск D&D приложения...")
     init_db()
     print("✅ База данных инициализирована")
+    if BCRYPT_TARGET_MS > 0:
+        # Калибровка стоимости bcrypt под целевое время на этом железе
+        set_rounds(calibrate_rounds(BCRYPT_TARGET_MS))
+    hashing_executor.start()
+    print(f"✅ Пул хеширования запущен ({hashing_executor.workers} процессов, bcrypt rounds={get_rounds()})")
+    start_cluster()
+    if client_manager is not None:
+        print(f"✅ Socket.IO подключен к брокеру воркеров: {client_manager.path}")
     print("✅ Socket.IO сервер готов")
 
 
@@ -51,6 +91,23 @@ async def startup_event():
 async def shutdown_event():
     """Очистка при остановке приложения"""
     print("🛑 Остановка D&D приложения...")
+    await presence_notifier.flush_all()
+    if batcher is not None:
+        await batcher.flush_all()
+    history.close()
+    hashing_executor.shutdown()
+    await async_engine.dispose()
+    shutdown_logging()
+
+
+@app.exception_handler(HashingQueueFull)
+async def hashing_queue_full_handler(request, exc: HashingQueueFull):
+    """Очередь хеширования переполнена - просим клиента повторить позже"""
+    return FastJSONResponse(
+        status_code=503,
+        content={"detail": "Сервер перегружен, повторите попытку позже"},
+        headers={"Retry-After": "1"}
+    )
 
 
 @app.get("/", summary="Главная страница", tags=["Основные"])
@@ -61,6 +118,7 @@ def root():
         "version": "1.0.0",
         "docs": "/docs",
         "socketio": "/socket.io",
+        "socketio_serializer": SOCKETIO_SERIALIZER,
         "endpoints": {
             "register": "/api/users/register",
             "login": "/api/users/login",
@@ -76,7 +134,21 @@ def health_check():
     return {
         "status": "healthy",
         "database": "connected",
-        "socketio": "active"
+        "socketio": "active",
+        "realtime": registry.metrics(),
+        "event_batching": batcher.metrics() if batcher is not None else None,
+        "history": history.metrics(),
+        "presence": presence_notifier.metrics(),
+        "rooms": directory.metrics(),
+        "game_state": game_state.metrics(),
+        "initiative": initiative.metrics(),
+        "battle_maps": battle_maps.metrics(),
+        "movement": movement.metrics(),
+        "visibility": visibility.metrics(),
+        "logging": logging_metrics(),
+        "hashing": hashing_executor.metrics(),
+        "auth_cache": auth_cache.metrics(),
+        "login_throttle_rejected": login_throttle.rejected
     }
 
 
@@ -0,0 +1,133 @@
+"""
+Канал перемещения фишек во время перетаскивания
+
+Клиент, пока тащит фишку, шлет ее положение десятки раз в секунду.
+Каждое такое событие не рассылается отдельно: канал хранит только
+последнее положение каждой фишки и раз в такт (MOVEMENT_RATE_HZ, по
+умолчанию 15 раз в секунду) отправляет комнате одно событие со всеми
+фишками, сдвинутыми за такт:
+    {"room_id": "K7Q2ZD", "moves": [{"id": "t1", "x": 4, "y": 7}, ...]}
+
+Первое положение после паузы уходит сразу, следующие - не чаще такта.
+Конечное положение фишки (move_token) не ждет такта: settle() убирает
+еще не отправленное промежуточное положение и дожидается отправки уже
+начатого такта, поэтому промежуточное положение не придет позже конечного.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.background import BackgroundTasks
+
+MOVEMENT_RATE_HZ = float(os.getenv("MOVEMENT_RATE_HZ", "15"))
+
+EmitFunc = Callable[[str, Any, str], Awaitable[None]]
+
+
+class _RoomMoves:
+    """Неотправленные положения фишек комнаты"""
+    __slots__ = ("pending", "last_tick", "timer", "sending")
+
+    def __init__(self):
+        # token_id -> {"id", "x", "y"}
+        self.pending: Dict[str, dict] = {}
+        self.last_tick = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        # Отправка текущего такта (пока она идет)
+        self.sending: Optional[asyncio.Future] = None
+
+
+class MovementChannel:
+    """
+    Рассылка промежуточных положений фишек с фиксированной частотой
+
+    Args:
+        emit: Корутина отправки emit(event, data, room_id)
+        rate_hz: Сколько раз в секунду комната получает положения
+        event: Имя события для клиентов
+    """
+
+    def __init__(self, emit: EmitFunc, rate_hz: float = MOVEMENT_RATE_HZ, event: str = "tokens_moving"):
+        self._emit = emit
+        self.period = 1 / rate_hz
+        self.event = event
+        self._rooms: Dict[str, _RoomMoves] = {}
+        # Такты по таймеру
+        self._tasks = BackgroundTasks("отправка положений фишек")
+        self.updates_in = 0
+        self.updates_coalesced = 0
+        self.ticks_out = 0
+
+    def update(self, room_id: str, token_id: str, x: int, y: int):
+        """Новое промежуточное положение фишки (заменяет неотправленное)"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = _RoomMoves()
+        self.updates_in += 1
+        if token_id in room.pending:
+            self.updates_coalesced += 1
+        room.pending[token_id] = {"id": token_id, "x": x, "y": y}
+
+        if room.timer is None:
+            delay = max(0.0, room.last_tick + self.period - time.monotonic())
+            room.timer = asyncio.get_running_loop().call_later(delay, self._schedule_tick, room_id)
+
+    async def settle(self, room_id: str, token_id: str):
+        """
+        Фишку отпустили: ее неотправленное положение больше не нужно
+
+        Возвращается, когда начатая отправка такта закончена (и ушла
+        в кластер), так что конечное положение можно рассылать следом.
+        """
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        room.pending.pop(token_id, None)
+        if room.sending is not None:
+            await asyncio.wait([room.sending])
+
+    def _schedule_tick(self, room_id: str):
+        room = self._rooms.get(room_id)
+        if room is not None:
+            room.timer = None
+        self._tasks.spawn(self.tick(room_id))
+
+    async def tick(self, room_id: str):
+        """
+        Отправка положений комнаты
+
+        После отправки комната ждет еще один такт: новые положения за это
+        время уйдут по таймеру, а если их нет, комната забывается.
+        """
+        room = self._rooms.get(room_id)
+        if room is None:
+            return
+        if room.timer is not None:
+            room.timer.cancel()
+            room.timer = None
+        if not room.pending:
+            del self._rooms[room_id]
+            return
+
+        moves = list(room.pending.values())
+        room.pending = {}
+        room.last_tick = time.monotonic()
+        room.timer = asyncio.get_running_loop().call_later(self.period, self._schedule_tick, room_id)
+        self.ticks_out += 1
+        sending = room.sending = asyncio.ensure_future(self._emit(self.event, {"room_id": room_id, "moves": moves}, room_id))
+        try:
+            await sending
+        finally:
+            if room.sending is sending:
+                room.sending = None
+
+    def metrics(self) -> dict:
+        return {
+            "rate_hz": 1 / self.period,
+            "updates_in": self.updates_in,
+            "updates_coalesced": self.updates_coalesced,
+            "ticks_out": self.ticks_out,
+            "tick_errors": self._tasks.errors,
+            "active_rooms": len(self._rooms),
+        }
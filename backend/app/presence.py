@@ -0,0 +1,126 @@
+"""
+Уведомления о присутствии в игровых комнатах
+
+Появление и уход пользователей рассылаются только участникам комнат,
+в которых они находятся, и не сразу: изменения комнаты копятся
+PRESENCE_DEBOUNCE_MS миллисекунд и уходят одним событием 'presence':
+    {"room_id", "added": [...], "removed": [id, ...], "count", "version", "epoch"}
+
+Вход и выход одного пользователя внутри интервала взаимно сокращаются,
+поэтому массовое переподключение клиентов (например, при перезапуске
+сервера) дает по одному уведомлению на комнату, а не по одному
+на каждого клиента для каждого клиента.
+
+version и epoch совпадают с get_online_users, так что клиент может
+применять уведомления поверх снимка и позже запросить изменения
+с последней известной версии.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.background import BackgroundTasks
+from app.room_registry import PRESENCE_ADD, PRESENCE_REMOVE, RoomRegistry
+
+PRESENCE_DEBOUNCE_MS = float(os.getenv("PRESENCE_DEBOUNCE_MS", "250"))
+
+# Имя события для клиента
+PRESENCE_EVENT = "presence"
+
+NotifyFunc = Callable[[str, Any], Awaitable[None]]
+
+
+class _PendingRoom:
+    """Изменения комнаты с прошлого уведомления"""
+    __slots__ = ("changes", "timer")
+
+    def __init__(self):
+        # user_id -> (операция, user_info)
+        self.changes: Dict[int, Tuple[str, dict]] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class PresenceNotifier:
+    """
+    Отложенная рассылка изменений присутствия по комнатам
+
+    Args:
+        registry: Реестр, изменения которого рассылаются
+        notify: Корутина отправки notify(room_id, payload) участникам комнаты
+        interval_ms: Интервал сбора изменений
+    """
+
+    def __init__(self, registry: RoomRegistry, notify: NotifyFunc, interval_ms: float = PRESENCE_DEBOUNCE_MS):
+        self.registry = registry
+        self._notify = notify
+        self.interval = interval_ms / 1000
+        self._pending: Dict[str, _PendingRoom] = {}
+        # Рассылки по таймеру
+        self._tasks = BackgroundTasks("рассылка изменений присутствия")
+        self.changes_in = 0
+        self.changes_cancelled = 0
+        self.notifications_out = 0
+        registry.on_presence_change = self.changed
+
+    def changed(self, room_id: Optional[str], op: str, user_info: dict):
+        """Изменение присутствия из реестра (общий список сервера не рассылается)"""
+        if room_id is None:
+            return
+        self.changes_in += 1
+
+        pending = self._pending.get(room_id)
+        if pending is None:
+            pending = self._pending[room_id] = _PendingRoom()
+
+        user_id = user_info["id"]
+        previous = pending.changes.get(user_id)
+        if previous is not None and previous[0] != op:
+            # Вошел и вышел (или наоборот) внутри интервала - для клиентов ничего не изменилось
+            del pending.changes[user_id]
+            self.changes_cancelled += 1
+        else:
+            pending.changes[user_id] = (op, user_info)
+
+        if pending.timer is None:
+            loop = asyncio.get_running_loop()
+            pending.timer = loop.call_later(self.interval, self._schedule_flush, room_id)
+
+    def _schedule_flush(self, room_id: str):
+        self._tasks.spawn(self.flush(room_id))
+
+    async def flush(self, room_id: str):
+        """Немедленная отправка накопленных изменений комнаты"""
+        pending = self._pending.pop(room_id, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        if not pending.changes or not self.registry.has_room(room_id):
+            return
+
+        changes = pending.changes.values()
+        payload = {
+            "room_id": room_id,
+            "added": [user_info for op, user_info in changes if op == PRESENCE_ADD],
+            "removed": [user_info["id"] for op, user_info in changes if op == PRESENCE_REMOVE],
+            "count": len(self.registry.online_users(room_id)),
+            "version": self.registry.presence_version(room_id),
+            "epoch": self.registry.epoch,
+        }
+        self.notifications_out += 1
+        await self._notify(room_id, payload)
+
+    async def flush_all(self):
+        for room_id in list(self._pending):
+            await self.flush(room_id)
+        await self._tasks.drain()
+
+    def metrics(self) -> dict:
+        return {
+            "debounce_ms": self.interval * 1000,
+            "changes_in": self.changes_in,
+            "changes_cancelled": self.changes_cancelled,
+            "notifications_out": self.notifications_out,
+            "notify_errors": self._tasks.errors,
+            "pending_rooms": len(self._pending),
+        }
@@ -0,0 +1,167 @@
+"""
+Ограничение частоты попыток входа
+
+Каждая попытка входа стоит полной проверки bcrypt, поэтому перебор паролей
+может занять все ядра. Лишние попытки отклоняются до authenticate_user
+по двум ключам: имя пользователя и IP клиента.
+
+Хранилище - шардированные token bucket в памяти процесса с LRU-вытеснением.
+Интерфейс RateLimitBackend асинхронный, чтобы позже подключить общее
+хранилище для нескольких воркеров без изменения кода входа.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
+
+
+def _env_rate(name: str, default: str) -> float:
+    """
+    Скорость пополнения (попыток в минуту) из окружения
+
+    Raises:
+        ValueError: Скорость не положительна (корзина не пополнялась бы никогда)
+    """
+    rate = float(os.getenv(name, default))
+    if not 0 < rate < float("inf"):
+        raise ValueError(f"{name} должно быть положительным числом, получено '{rate}'")
+    return rate
+
+
+# Настройки (можно переопределить через переменные окружения)
+LOGIN_USER_BURST = float(os.getenv("LOGIN_USER_BURST", "5"))
+LOGIN_USER_PER_MINUTE = _env_rate("LOGIN_USER_PER_MINUTE", "5")
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_IP_PER_MINUTE = _env_rate("LOGIN_IP_PER_MINUTE", "30")
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+LOGIN_THROTTLE_SHARDS = int(os.getenv("LOGIN_THROTTLE_SHARDS", "16"))
+
+
+
+class RateLimitBackend(ABC):
+    """Хранилище счетчиков для ограничителя частоты"""
+
+    @abstractmethod
+    async def consume(self, key: str, cost: float = 1.0) -> float:
+        """
+        Списать cost токенов с ключа
+
+        Returns:
+            float: 0, если запрос разрешен, иначе сколько секунд ждать
+        """
+
+    async def reset(self, key: str):
+        """Сбросить счетчик ключа"""
+
+
+class TokenBucket:
+    """Корзина токенов: capacity - запас, refill_rate - токенов в секунду"""
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class _Shard:
+    """Часть ключей со своей блокировкой и LRU-порядком"""
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Token bucket в памяти процесса
+
+    Ключи разбиты по шардам, у каждого шарда своя блокировка и свой лимит
+    ключей, поэтому память ограничена max_keys, а вытеснение - O(1).
+    Полные корзины вытесняются первыми естественным образом: их ключи давно
+    не использовались и стоят в начале LRU.
+    """
+
+    def __init__(self, capacity: float, refill_rate: float, max_keys: int = 100000, shards: int = 16):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._shards: List[_Shard] = [_Shard() for _ in range(max(1, shards))]
+        self._max_per_shard = max(1, max_keys // len(self._shards))
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def consume_now(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Синхронная версия consume (now можно передать для тестов)"""
+        now = time.monotonic() if now is None else now
+        shard = self._shard(key)
+
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.capacity, now)
+                shard.buckets[key] = bucket
+                if len(shard.buckets) > self._max_per_shard:
+                    shard.buckets.popitem(last=False)
+            else:
+                shard.buckets.move_to_end(key)
+                elapsed = now - bucket.updated_at
+                bucket.tokens = min(self.capacity, bucket.tokens + elapsed * self.refill_rate)
+                bucket.updated_at = now
+
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return 0.0
+
+            if self.refill_rate <= 0:
+                return float("inf")
+            return (cost - bucket.tokens) / self.refill_rate
+
+    async def consume(self, key: str, cost: float = 1.0) -> float:
+        return self.consume_now(key, cost)
+
+    async def reset(self, key: str):
+        shard = self._shard(key)
+        with shard.lock:
+            shard.buckets.pop(key, None)
+
+    def __len__(self):
+        return sum(len(shard.buckets) for shard in self._shards)
+
+
+class LoginThrottle:
+    """Ограничение попыток входа по имени пользователя и по IP"""
+
+    def __init__(self, user_backend: RateLimitBackend, ip_backend: RateLimitBackend):
+        self.user_backend = user_backend
+        self.ip_backend = ip_backend
+        self.rejected = 0
+
+    async def check(self, username: str, client_ip: Optional[str]) -> float:
+        """
+        Учесть попытку входа
+
+        Returns:
+            float: 0, если попытка разрешена, иначе через сколько секунд повторить
+        """
+        retry_after = 0.0
+        if client_ip:
+            retry_after = await self.ip_backend.consume(f"ip:{client_ip}")
+        if not retry_after:
+            retry_after = await self.user_backend.consume(f"user:{username.strip().lower()}")
+        if retry_after:
+            self.rejected += 1
+        return retry_after
+
+
+# Общий ограничитель приложения
+login_throttle = LoginThrottle(
+    user_backend=InMemoryRateLimitBackend(
+        LOGIN_USER_BURST, LOGIN_USER_PER_MINUTE / 60, LOGIN_THROTTLE_MAX_KEYS, LOGIN_THROTTLE_SHARDS
+    ),
+    ip_backend=InMemoryRateLimitBackend(
+        LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE / 60, LOGIN_THROTTLE_MAX_KEYS, LOGIN_THROTTLE_SHARDS
+    ),
+)
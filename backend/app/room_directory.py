@@ -0,0 +1,345 @@
+"""
+Каталог игровых комнат
+
+Комната каталога создается мастером и получает код из 6 символов
+(A-Z, 0-9), по которому к ней присоединяются игроки. Код либо
+предлагает клиент (его генерирует role-select.js), либо выделяет
+сервер; занятый код другому владельцу не выдается.
+
+Для списка комнат поддерживаются индексы, поэтому страница списка
+не требует перебора всех комнат:
+    (название в нижнем регистре, код) - отсортированный список:
+        постраничный вывод по курсору и поиск по началу названия
+    владелец -> коды его комнат
+
+Число игроков берется из RoomRegistry (с учетом других воркеров).
+Комната, в которой никого нет ROOM_EMPTY_TTL секунд, удаляется.
+
+С несколькими воркерами каталог меняется только командами, которые все
+воркеры применяют в одном порядке: создание с точным кодом (exact=True -
+занятый код дает RoomCodeTaken, и создающий воркер пробует другой код)
+и удаление пустой комнаты (on_expired получает коды, а удаляет их
+remove_expired по команде).
+"""
+import base64
+import bisect
+import os
+import re
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from app.room_registry import RoomRegistry
+
+ROOM_CODE_LENGTH = 6
+ROOM_CODE_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+ROOM_NAME_MIN_LENGTH = 3
+ROOM_NAME_MAX_LENGTH = 50
+ROOMS_PAGE_SIZE = int(os.getenv("ROOMS_PAGE_SIZE", "50"))
+ROOMS_MAX_PAGE_SIZE = 200
+ROOMS_PER_OWNER = int(os.getenv("ROOMS_PER_OWNER", "20"))
+ROOM_EMPTY_TTL = float(os.getenv("ROOM_EMPTY_TTL", "600"))
+# Как часто проверять пустые комнаты (проверка идет при запросах к каталогу)
+ROOM_SWEEP_INTERVAL = 60.0
+
+_CODE_RE = re.compile(f"[{ROOM_CODE_ALPHABET}]{{{ROOM_CODE_LENGTH}}}")
+
+
+class RoomDirectoryError(ValueError):
+    """Некорректный запрос к каталогу комнат"""
+
+
+class RoomCodeTaken(RoomDirectoryError):
+    """Код комнаты уже занят другим владельцем"""
+
+
+@dataclass
+class Room:
+    """Комната каталога"""
+    code: str
+    name: str
+    owner_id: int
+    owner_name: str
+    created_at: float
+    # Когда в комнате не осталось игроков (None - в комнате кто-то есть)
+    empty_since: Optional[float] = None
+
+    @property
+    def sort_key(self) -> Tuple[str, str]:
+        return self.name.lower(), self.code
+
+    def to_dict(self) -> dict:
+        """Поля для синхронизации между воркерами"""
+        return {
+            "code": self.code,
+            "name": self.name,
+            "owner_id": self.owner_id,
+            "owner_name": self.owner_name,
+            "created_at": self.created_at,
+        }
+
+
+def normalize_code(code) -> Optional[str]:
+    """Код комнаты в верхнем регистре или None, если строка не похожа на код"""
+    if not isinstance(code, str):
+        return None
+    code = code.strip().upper()
+    return code if _CODE_RE.fullmatch(code) else None
+
+
+def encode_cursor(room: Room) -> str:
+    """Непрозрачный курсор страницы из последней комнаты"""
+    name_key, code = room.sort_key
+    return base64.urlsafe_b64encode(f"{code}:{name_key}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Ключ сортировки последней комнаты из курсора"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        code, name_key = base64.urlsafe_b64decode(padded).decode().split(":", 1)
+    except (TypeError, ValueError):
+        raise RoomDirectoryError("Некорректный курсор")
+    if normalize_code(code) != code:
+        raise RoomDirectoryError("Некорректный курсор")
+    return name_key, code
+
+
+class RoomDirectory:
+    """
+    Комнаты, их владельцы и индексы для списка
+
+    Args:
+        registry: Реестр подключений (число игроков в комнате)
+        empty_ttl: Через сколько секунд удалять пустую комнату
+        on_expired: Кому передать коды пустых комнат вместо удаления на месте
+    """
+
+    def __init__(self, registry: RoomRegistry, empty_ttl: float = ROOM_EMPTY_TTL,
+                 on_expired: Optional[Callable[[List[str]], None]] = None):
+        self.registry = registry
+        self.empty_ttl = empty_ttl
+        self.on_expired = on_expired
+        self._rooms: Dict[str, Room] = {}
+        self._by_name: List[Tuple[str, str]] = []
+        self._by_owner: Dict[int, Set[str]] = {}
+        self._last_sweep = time.monotonic()
+        self.created = 0
+        self.expired = 0
+
+    # --- Комнаты ---
+
+    def allocate_code(self) -> str:
+        """Случайный код, свободный в этом каталоге"""
+        while True:
+            code = "".join(secrets.choice(ROOM_CODE_ALPHABET) for _ in range(ROOM_CODE_LENGTH))
+            if code not in self._rooms:
+                return code
+
+    def create(
+        self,
+        name: str,
+        owner: dict,
+        code: Optional[str] = None,
+        created_at: Optional[float] = None,
+        exact: bool = False,
+    ) -> Tuple[Room, bool]:
+        """
+        Создание комнаты
+
+        Args:
+            name: Название комнаты
+            owner: Информация о пользователе-владельце
+            code: Желаемый код (если он свободен)
+            created_at: Время создания (по умолчанию - сейчас)
+            exact: Не выделять другой код, если code занят
+
+        Returns:
+            Tuple: комната и True, если она создана (False - у владельца
+                   уже есть комната с этим кодом)
+
+        Raises:
+            RoomCodeTaken: exact и код занят другим владельцем
+            RoomDirectoryError: Некорректное название или слишком много комнат
+        """
+        name = name.strip() if isinstance(name, str) else ""
+        if not ROOM_NAME_MIN_LENGTH <= len(name) <= ROOM_NAME_MAX_LENGTH:
+            raise RoomDirectoryError(
+                f"Название комнаты должно быть от {ROOM_NAME_MIN_LENGTH} до {ROOM_NAME_MAX_LENGTH} символов"
+            )
+
+        code = normalize_code(code)
+        existing = self._rooms.get(code) if code else None
+        if existing is not None and existing.owner_id == owner["id"]:
+            return existing, False
+        if exact and (code is None or existing is not None):
+            raise RoomCodeTaken("Код комнаты занят")
+        if code is None or existing is not None:
+            code = self.allocate_code()
+
+        if len(self._by_owner.get(owner["id"], ())) >= ROOMS_PER_OWNER:
+            raise RoomDirectoryError(f"Нельзя создать больше {ROOMS_PER_OWNER} комнат")
+
+        created_at = time.time() if created_at is None else created_at
+        room = Room(code, name, owner["id"], owner["username"], created_at, empty_since=time.monotonic())
+        self.add(room)
+        self.created += 1
+        return room, True
+
+    def add(self, room: Room):
+        """Добавление комнаты в каталог и индексы (в том числе с другого воркера)"""
+        if room.code in self._rooms:
+            return
+        self._rooms[room.code] = room
+        bisect.insort(self._by_name, room.sort_key)
+        self._by_owner.setdefault(room.owner_id, set()).add(room.code)
+
+    def remove(self, code: str) -> Optional[Room]:
+        room = self._rooms.pop(code, None)
+        if room is None:
+            return None
+        index = bisect.bisect_left(self._by_name, room.sort_key)
+        del self._by_name[index]
+        owned = self._by_owner[room.owner_id]
+        owned.discard(code)
+        if not owned:
+            del self._by_owner[room.owner_id]
+        return room
+
+    def get(self, code) -> Optional[Room]:
+        code = normalize_code(code)
+        return self._rooms.get(code) if code else None
+
+    def owner(self, code: str) -> Optional[int]:
+        """ID владельца комнаты (None - комнаты нет в каталоге)"""
+        room = self._rooms.get(code)
+        return room.owner_id if room else None
+
+    def players(self, code: str) -> int:
+        """Число игроков в комнате (каждый пользователь один раз)"""
+        return self.registry.user_count(code)
+
+    def describe(self, room: Room) -> dict:
+        """Комната для клиента"""
+        return {
+            "code": room.code,
+            "name": room.name,
+            "owner": {"id": room.owner_id, "username": room.owner_name},
+            "users": self.players(room.code),
+        }
+
+    # --- Список ---
+
+    def list_rooms(
+        self,
+        query: Optional[str] = None,
+        owner_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = ROOMS_PAGE_SIZE,
+    ) -> dict:
+        """
+        Страница списка комнат, отсортированного по названию
+
+        Args:
+            query: Код комнаты или начало названия
+            owner_id: Только комнаты этого владельца
+            cursor: next_cursor из предыдущей страницы
+            limit: Размер страницы
+
+        Returns:
+            dict: rooms и next_cursor (None - страниц больше нет)
+
+        Raises:
+            RoomDirectoryError: Некорректный курсор
+        """
+        self.expire()
+        limit = max(1, min(limit, ROOMS_MAX_PAGE_SIZE))
+        if not isinstance(query, str):
+            query = None
+
+        room = self.get(query) if query else None
+        if room is not None:
+            # Поиск по коду комнаты: ровно одна комната
+            if owner_id is not None and room.owner_id != owner_id:
+                return {"rooms": [], "next_cursor": None}
+            return {"rooms": [self.describe(room)], "next_cursor": None}
+
+        prefix = query.strip().lower() if query else ""
+        after = decode_cursor(cursor) if cursor else None
+
+        if owner_id is not None:
+            # Комнат у владельца немного: сортируем их на месте
+            keys = sorted(self._rooms[code].sort_key for code in self._by_owner.get(owner_id, ()))
+        else:
+            keys = self._by_name
+
+        start = bisect.bisect_left(keys, (prefix,))
+        if after is not None:
+            start = max(start, bisect.bisect_right(keys, after))
+
+        # Названия с нужным началом идут в индексе подряд
+        page: List[Room] = []
+        for name_key, code in keys[start:start + limit + 1]:
+            if not name_key.startswith(prefix):
+                break
+            page.append(self._rooms[code])
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1])
+        return {"rooms": [self.describe(room) for room in page], "next_cursor": next_cursor}
+
+    # --- Пустые комнаты ---
+
+    def expire(self, now: Optional[float] = None, force: bool = False) -> int:
+        """
+        Удаление комнат, пустых дольше empty_ttl (не чаще ROOM_SWEEP_INTERVAL)
+
+        Если задан on_expired, комнаты не удаляются, а их коды передаются ему.
+
+        Returns:
+            int: Число найденных пустых комнат
+        """
+        now = time.monotonic() if now is None else now
+        if not force and now - self._last_sweep < ROOM_SWEEP_INTERVAL:
+            return 0
+        self._last_sweep = now
+
+        expired = []
+        for room in self._rooms.values():
+            if self.players(room.code):
+                room.empty_since = None
+            elif room.empty_since is None:
+                room.empty_since = now
+            elif now - room.empty_since >= self.empty_ttl:
+                expired.append(room.code)
+
+        if expired and self.on_expired is not None:
+            self.on_expired(expired)
+        else:
+            for code in expired:
+                self.remove_expired(code)
+        return len(expired)
+
+    def remove_expired(self, code: str) -> Optional[Room]:
+        """Удаление пустой комнаты (None - ее уже нет)"""
+        room = self.remove(code)
+        if room is not None:
+            self.expired += 1
+        return room
+
+    def metrics(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "owners": len(self._by_owner),
+            "created": self.created,
+            "expired": self.expired,
+        }
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __iter__(self):
+        return iter(self._rooms.values())
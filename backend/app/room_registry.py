@@ -0,0 +1,315 @@
+"""
+Реестр подключений и игровых комнат Socket.IO
+
+Хранит прямые и обратные индексы, чтобы ни одна операция не перебирала
+все комнаты или всех пользователей:
+    room_id -> sid участников
+    sid -> room_id комнат подключения
+    sid -> информация о пользователе
+    user_id -> sid подключений пользователя (несколько вкладок)
+    room_id -> user_id -> число подключений пользователя в комнате
+
+Присутствие версионируется: каждое появление или уход пользователя
+(в комнате или на сервере) получает номер версии из общего монотонного
+счетчика и попадает в ограниченный журнал изменений. Клиент, который
+знает версию, получает только изменения после нее, а если отстал
+дальше журнала - полный список.
+
+Списки онлайн-пользователей кешируются и сбрасываются только
+при изменении состава комнаты (или всех подключений).
+"""
+import os
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+# Сколько последних изменений присутствия хранить на комнату
+PRESENCE_LOG_SIZE = int(os.getenv("PRESENCE_LOG_SIZE", "256"))
+
+# Операции журнала присутствия
+PRESENCE_ADD = "add"
+PRESENCE_REMOVE = "remove"
+
+
+class _PresenceLog:
+    """Журнал изменений присутствия одной комнаты (или всего сервера)"""
+    __slots__ = ("base", "version", "entries")
+
+    def __init__(self, version: int, size: int):
+        # Изменения с версией <= base в журнале уже не хранятся
+        self.base = version
+        self.version = version
+        self.entries: Deque[Tuple[int, str, dict]] = deque(maxlen=size)
+
+    def append(self, version: int, op: str, user_info: dict):
+        if len(self.entries) == self.entries.maxlen:
+            self.base = self.entries[0][0]
+        self.entries.append((version, op, user_info))
+        self.version = version
+
+
+class RoomRegistry:
+    """Подключения, комнаты и пользователи с индексами в обе стороны"""
+
+    def __init__(self, presence_log_size: int = PRESENCE_LOG_SIZE):
+        self._rooms: Dict[str, Set[str]] = {}
+        self._sid_rooms: Dict[str, Set[str]] = {}
+        self._users: Dict[str, dict] = {}
+        self._user_sids: Dict[int, Set[str]] = {}
+        self._room_users: Dict[str, Dict[int, int]] = {}
+        self._user_info: Dict[int, dict] = {}
+        # Кеш списков для get_online_users: room_id (None - все) -> список user_info
+        self._online_cache: Dict[Optional[str], List[dict]] = {}
+
+        # Версии присутствия: epoch меняется при перезапуске, version только растет
+        self.epoch = uuid.uuid4().hex[:12]
+        self._version = 0
+        self._presence_log_size = presence_log_size
+        self._presence: Dict[Optional[str], _PresenceLog] = {None: _PresenceLog(0, presence_log_size)}
+        # Обработчик изменений присутствия: (room_id или None, операция, user_info)
+        self.on_presence_change: Optional[Callable[[Optional[str], str, dict], None]] = None
+
+    def _record(self, room_id: Optional[str], op: str, user_info: dict):
+        """Изменение присутствия: новая версия и сброс кеша списка"""
+        self._version += 1
+        # Журнал комнаты заводится при первом запросе присутствия: пока версию
+        # комнаты никто не получал, хранить изменения для нее незачем
+        log = self._presence.get(room_id)
+        if log is not None:
+            log.append(self._version, op, user_info)
+        self._online_cache.pop(room_id, None)
+        if self.on_presence_change is not None:
+            self.on_presence_change(room_id, op, user_info)
+
+    def _presence_log(self, room_id: Optional[str]) -> _PresenceLog:
+        """Журнал присутствия комнаты (для несуществующей комнаты - пустой и не сохраняется)"""
+        log = self._presence.get(room_id)
+        if log is None:
+            log = _PresenceLog(self._version, self._presence_log_size)
+            if room_id is None or room_id in self._rooms:
+                self._presence[room_id] = log
+        return log
+
+    # --- Подключения ---
+
+    def connect(self, sid: str, user_info: dict):
+        """Регистрация подключения пользователя"""
+        if sid in self._users:
+            self.disconnect(sid)
+        user_id = user_info["id"]
+        self._users[sid] = user_info
+        self._sid_rooms[sid] = set()
+        self._user_info[user_id] = user_info
+
+        sids = self._user_sids.setdefault(user_id, set())
+        sids.add(sid)
+        if len(sids) == 1:
+            self._record(None, PRESENCE_ADD, user_info)
+
+    def disconnect(self, sid: str) -> Tuple[Optional[dict], List[str]]:
+        """
+        Удаление подключения из реестра и из всех его комнат
+
+        Returns:
+            Tuple: информация о пользователе (None, если sid неизвестен)
+                   и список комнат, из которых он вышел
+        """
+        user_info = self._users.pop(sid, None)
+        if user_info is None:
+            return None, []
+
+        rooms = self._sid_rooms.pop(sid, set())
+        for room_id in rooms:
+            self._remove_member(room_id, sid, user_info)
+
+        user_id = user_info["id"]
+        sids = self._user_sids.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._user_sids[user_id]
+                del self._user_info[user_id]
+                self._record(None, PRESENCE_REMOVE, user_info)
+
+        return user_info, list(rooms)
+
+    def drop(self, sids: Iterable[str]):
+        """Удаление нескольких подключений (например, всех с упавшего воркера)"""
+        for sid in list(sids):
+            self.disconnect(sid)
+
+    def is_connected(self, sid: str) -> bool:
+        return sid in self._users
+
+    def user(self, sid: str) -> Optional[dict]:
+        """Информация о пользователе подключения"""
+        return self._users.get(sid)
+
+    def user_sids(self, user_id: int) -> Set[str]:
+        """Все подключения пользователя"""
+        return self._user_sids.get(user_id, set())
+
+    # --- Комнаты ---
+
+    def join(self, sid: str, room_id: str) -> bool:
+        """
+        Добавление подключения в комнату
+
+        Returns:
+            bool: False, если sid неизвестен или уже в комнате
+        """
+        rooms = self._sid_rooms.get(sid)
+        if rooms is None or room_id in rooms:
+            return False
+        rooms.add(room_id)
+        self._rooms.setdefault(room_id, set()).add(sid)
+
+        user_info = self._users[sid]
+        room_users = self._room_users.setdefault(room_id, {})
+        room_users[user_info["id"]] = room_users.get(user_info["id"], 0) + 1
+        if room_users[user_info["id"]] == 1:
+            self._record(room_id, PRESENCE_ADD, user_info)
+        return True
+
+    def leave(self, sid: str, room_id: str) -> bool:
+        """
+        Удаление подключения из комнаты (пустая комната удаляется)
+
+        Returns:
+            bool: False, если подключения не было в комнате
+        """
+        rooms = self._sid_rooms.get(sid)
+        if rooms is None or room_id not in rooms:
+            return False
+        rooms.discard(room_id)
+        self._remove_member(room_id, sid, self._users[sid])
+        return True
+
+    def _remove_member(self, room_id: str, sid: str, user_info: dict):
+        members = self._rooms.get(room_id)
+        if members is not None:
+            members.discard(sid)
+
+        room_users = self._room_users.get(room_id, {})
+        user_id = user_info["id"]
+        if user_id in room_users:
+            room_users[user_id] -= 1
+            if not room_users[user_id]:
+                del room_users[user_id]
+                self._record(room_id, PRESENCE_REMOVE, user_info)
+
+        if not members:
+            # Пустая комната удаляется вместе с журналом: новая комната
+            # с тем же ID начнет журнал с большей версии
+            self._rooms.pop(room_id, None)
+            self._room_users.pop(room_id, None)
+            self._presence.pop(room_id, None)
+            self._online_cache.pop(room_id, None)
+
+    def in_room(self, sid: str, room_id: str) -> bool:
+        return room_id in self._sid_rooms.get(sid, ())
+
+    def members(self, room_id: str) -> Set[str]:
+        """sid участников комнаты (не изменять)"""
+        return self._rooms.get(room_id, set())
+
+    def member_count(self, room_id: str) -> int:
+        return len(self._rooms.get(room_id, ()))
+
+    def user_count(self, room_id: str) -> int:
+        """Число пользователей в комнате (несколько вкладок - один пользователь)"""
+        return len(self._room_users.get(room_id, ()))
+
+    def rooms_of(self, sid: str) -> Set[str]:
+        """Комнаты подключения (не изменять)"""
+        return self._sid_rooms.get(sid, set())
+
+    def has_room(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    # --- Списки пользователей ---
+
+    def online_users(self, room_id: Optional[str] = None) -> List[dict]:
+        """
+        Пользователи комнаты или все онлайн-пользователи (каждый один раз,
+        сколько бы вкладок у него ни было открыто)
+
+        Список собирается один раз и переиспользуется, пока состав
+        не изменится. Возвращаемый список изменять нельзя.
+        """
+        cached = self._online_cache.get(room_id)
+        if cached is not None:
+            return cached
+
+        user_ids = self._user_sids if room_id is None else self._room_users.get(room_id, {})
+        users = [self._user_info[user_id] for user_id in user_ids]
+        self._online_cache[room_id] = users
+        return users
+
+    def presence_version(self, room_id: Optional[str] = None) -> int:
+        """Версия последнего изменения присутствия в комнате (None - на сервере)"""
+        return self._presence_log(room_id).version
+
+    def presence_since(self, room_id: Optional[str], since: Optional[int], epoch: Optional[str] = None) -> dict:
+        """
+        Изменения присутствия после версии since
+
+        Если клиент не передал версию, версия из другой эпохи (сервер
+        перезапускался) или журнал уже не содержит нужных изменений,
+        возвращается полный список пользователей.
+
+        Returns:
+            dict: snapshot=False, added, removed (ID пользователей) - изменения;
+                  snapshot=True, users - полный список.
+                  Всегда: version, epoch, count.
+        """
+        log = self._presence_log(room_id)
+        result = {"epoch": self.epoch, "version": log.version}
+
+        if since is None or epoch != self.epoch or since > self._version or since < log.base:
+            users = self.online_users(room_id)
+            result.update(snapshot=True, users=users, count=len(users))
+            return result
+
+        # Последняя операция по каждому пользователю после версии клиента
+        latest: Dict[int, Tuple[str, dict]] = {}
+        for entry_version, op, user_info in reversed(log.entries):
+            if entry_version <= since:
+                break
+            latest.setdefault(user_info["id"], (op, user_info))
+
+        result.update(
+            snapshot=False,
+            added=[user_info for op, user_info in latest.values() if op == PRESENCE_ADD],
+            removed=[user_id for user_id, (op, _) in latest.items() if op == PRESENCE_REMOVE],
+            count=len(self._user_sids if room_id is None else self._room_users.get(room_id, ())),
+        )
+        return result
+
+    def snapshot(self, sids: Iterable[str]) -> Tuple[Dict[str, dict], Dict[str, List[str]]]:
+        """
+        Состояние выбранных подключений для синхронизации воркеров
+
+        Returns:
+            Tuple: sid -> user_info и room_id -> список sid
+        """
+        users: Dict[str, dict] = {}
+        rooms: Dict[str, List[str]] = {}
+        for sid in sids:
+            if sid not in self._users:
+                continue
+            users[sid] = self._users[sid]
+            for room_id in self._sid_rooms[sid]:
+                rooms.setdefault(room_id, []).append(sid)
+        return users, rooms
+
+    def metrics(self) -> dict:
+        return {
+            "connections": len(self._users),
+            "users": len(self._user_sids),
+            "rooms": len(self._rooms),
+            "presence_version": self._version,
+        }
+
+    def __len__(self):
+        return len(self._users)
@@ -1,34 +1,83 @@
 """
 Роуты для работы с пользователями
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from app.bd import get_db, User
-from app.crud import (
+from app.bd import get_async_db, AsyncSessionLocal, User
+from app.crud_async import (
     create_user,
     get_user_by_username,
     get_user_by_email,
     authenticate_user,
-    get_all_users
+    get_all_users,
+    get_users_page,
+    stream_users
 )
+from app.hashing import hash_password_async
 from app.schemas import (
     UserRegistrationRequest,
     UserLoginRequest,
     UserResponse,
-    TokenResponse
+    UserPageResponse,
+    TokenResponse,
+    user_to_dict
 )
+from app.responses import FastJSONResponse
+from app.rate_limit import login_throttle
 from app.auth import create_access_token, get_current_active_user
 from datetime import timedelta
+from typing import Optional
+import base64
+import math
+import orjson
 
 router = APIRouter(prefix="/api/users", tags=["Пользователи"])
 
 
+def encode_cursor(last_id: int) -> str:
+    """Непрозрачный курсор страницы из последнего id"""
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Последний id из курсора страницы"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, value = base64.urlsafe_b64decode(padded).decode().split(":", 1)
+        if prefix != "id":
+            raise ValueError(prefix)
+        return int(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
+
+
+def token_response(user, status_code: int = status.HTTP_200_OK) -> FastJSONResponse:
+    """Ответ с новым токеном доступа и данными пользователя"""
+    access_token = create_access_token(
+        data={"sub": str(user.id)},
+        expires_delta=timedelta(days=1)
+    )
+    
+    return FastJSONResponse(
+        status_code=status_code,
+        content={
+            "access_token": access_token,
+            "token_type": "bearer",
+            "user": user_to_dict(user)
+        }
+    )
+
+
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
 async def register_user(
     user_data: UserRegistrationRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Регистрация нового пользователя
@@ -40,7 +89,7 @@ async def register_user(
     - **character_name**: Имя персонажа (опционально)
     """
     # Проверка существования пользователя с таким username
-    existing_user = get_user_by_username(db, user_data.username)
+    existing_user = await get_user_by_username(db, user_data.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -48,56 +97,42 @@ async def register_user(
         )
     
     # Проверка существования пользователя с таким email
-    existing_email = get_user_by_email(db, user_data.email)
+    existing_email = await get_user_by_email(db, user_data.email)
     if existing_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Пользователь с таким email уже существует"
         )
     
+    # Хеширование пароля в пуле процессов (не блокирует event loop)
+    hashed_password = await hash_password_async(user_data.password)
+    
     try:
         # Создание пользователя
-        new_user = create_user(
+        new_user = await create_user(
             db=db,
             username=user_data.username,
             email=user_data.email,
-            password=user_data.password,
-            character_name=user_data.character_name
-        )
-        
-        # Создание токена доступа
-        access_token = create_access_token(
-            data={"sub": str(new_user.id)},
-            expires_delta=timedelta(days=1)
-        )
-        
-        # Формирование ответа
-        user_response = UserResponse(
-            id=new_user.id,
-            username=new_user.username,
-            email=new_user.email,
-            character_name=new_user.character_name,
-            is_active=new_user.is_active
-        )
-        
-        return TokenResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user=user_response
+            character_name=user_data.character_name,
+            hashed_password=hashed_password
         )
         
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Ошибка при создании пользователя"
         )
+    
+    # Создание токена доступа и формирование ответа
+    return token_response(new_user, status_code=status.HTTP_201_CREATED)
 
 
 @router.post("/login", response_model=TokenResponse)
 async def login_user(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Вход пользователя в систему (OAuth2 совместимый)
@@ -105,8 +140,18 @@ async def login_user(
     - **username**: Имя пользователя или email
     - **password**: Пароль
     """
+    # Ограничение частоты попыток (до дорогой проверки bcrypt)
+    client_ip = request.client.host if request.client else None
+    retry_after = await login_throttle.check(form_data.username, client_ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много попыток входа, повторите позже",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    
     # Аутентификация пользователя
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     
     if not user:
         raise HTTPException(
@@ -121,26 +166,8 @@ async def login_user(
             detail="Пользователь неактивен"
         )
     
-    # Создание токена доступа
-    access_token = create_access_token(
-        data={"sub": str(user.id)},
-        expires_delta=timedelta(days=1)
-    )
-    
-    # Формирование ответа
-    user_response = UserResponse(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        character_name=user.character_name,
-        is_active=user.is_active
-    )
-    
-    return TokenResponse(
-        access_token=access_token,
-        token_type="bearer",
-        user=user_response
-    )
+    # Создание токена доступа и формирование ответа
+    return token_response(user)
 
 
 @router.get("/me", response_model=UserResponse)
@@ -152,20 +179,14 @@ async def get_current_user_info(
     
     Требуется авторизация (Bearer токен)
     """
-    return UserResponse(
-        id=current_user.id,
-        username=current_user.username,
-        email=current_user.email,
-        character_name=current_user.character_name,
-        is_active=current_user.is_active
-    )
+    return FastJSONResponse(user_to_dict(current_user))
 
 
 @router.get("/", response_model=list[UserResponse])
 async def get_users_list(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -176,15 +197,53 @@ async def get_users_list(
     - **skip**: Количество пропускаемых записей (для пагинации)
     - **limit**: Максимальное количество возвращаемых записей
     """
-    users = get_all_users(db, skip=skip, limit=limit)
-    
-    return [
-        UserResponse(
-            id=user.id,
-            username=user.username,
-            email=user.email,
-            character_name=user.character_name,
-            is_active=user.is_active
-        )
-        for user in users
-    ]
\ No newline at end of file
+    users = await get_all_users(db, skip=skip, limit=limit)
+    
+    return FastJSONResponse([user_to_dict(user) for user in users])
+
+
+@router.get("/page", response_model=UserPageResponse)
+async def get_users_page_list(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Получение списка пользователей с курсорной пагинацией
+    
+    Требуется авторизация (Bearer токен)
+    
+    - **cursor**: Значение next_cursor из предыдущего ответа (пусто - первая страница)
+    - **limit**: Максимальное количество возвращаемых записей
+    """
+    after_id = decode_cursor(cursor) if cursor else 0
+    rows = await get_users_page(db, after_id=after_id, limit=limit)
+    
+    next_cursor = encode_cursor(rows[-1].id) if len(rows) == limit else None
+    
+    return FastJSONResponse({
+        "items": [user_to_dict(row) for row in rows],
+        "next_cursor": next_cursor
+    })
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_users(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Экспорт всех пользователей в формате NDJSON (одна JSON-строка на пользователя)
+    
+    Строки читаются серверным курсором и сразу отправляются клиенту,
+    поэтому память не зависит от размера таблицы.
+    
+    Требуется авторизация (Bearer токен)
+    """
+    async def generate():
+        # Собственная сессия: она должна жить, пока идет отправка ответа
+        async with AsyncSessionLocal() as db:
+            async for row in stream_users(db):
+                yield orjson.dumps(user_to_dict(row)) + b"\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
\ No newline at end of file
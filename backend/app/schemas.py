@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional
+from typing import Optional, List
 
 
 class UserRegistrationRequest(BaseModel):
@@ -82,6 +82,22 @@ class UserResponse(BaseModel):
         }
 
 
+def user_to_dict(user) -> dict:
+    """
+    Публичные данные пользователя (ORM-объект или строка запроса) в виде словаря
+    
+    Данные из БД уже проверены, поэтому горячие endpoints отдают этот словарь
+    напрямую, без повторной валидации через UserResponse.
+    """
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "character_name": user.character_name,
+        "is_active": user.is_active
+    }
+
+
 class TokenResponse(BaseModel):
     """Модель ответа с токеном доступа"""
     access_token: str
@@ -101,4 +117,26 @@ class TokenResponse(BaseModel):
                     "is_active": True
                 }
             }
+        }
+
+
+class UserPageResponse(BaseModel):
+    """Модель ответа со страницей пользователей (keyset-пагинация)"""
+    items: List[UserResponse]
+    next_cursor: Optional[str] = None
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {
+                        "id": 1,
+                        "username": "dungeon_master",
+                        "email": "dm@example.com",
+                        "character_name": "Арагорн",
+                        "is_active": True
+                    }
+                ],
+                "next_cursor": "aWQ6MQ"
+            }
         }
\ No newline at end of file
@@ -1,23 +1,403 @@
 """
 Socket.IO сервер для real-time коммуникации в D&D приложении
 """
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
 import socketio
-from typing import Dict, Set
-from app.auth import decode_access_token
-from app.bd import SessionLocal
-from app.crud import get_user_by_id
+from app.auth import get_user_from_token
+from app.bd import AsyncSessionLocal
+from app.cluster import ClusterPresence, create_client_manager
+from app.room_registry import RoomRegistry
+from app.event_batcher import EventBatcher, SOCKETIO_BATCH_INTERVAL_MS, SOCKETIO_BATCH_MAX_EVENTS
+from app.history import RoomHistory, HISTORY_LOG_DIR
+from app.dice import DiceError, roll_dice
+from app.presence import PresenceNotifier, PRESENCE_EVENT
+from app.game_state import GameStateStore, StatePatchError, touches_only
+from app.initiative import InitiativeError, InitiativeStore
+from app.battle_map import BattleMaps, MapError
+from app.movement import MovementChannel
+from app.visibility import VisibilityTracker
+from app.background import BackgroundTasks
+from app.room_directory import Room, RoomCodeTaken, RoomDirectory, RoomDirectoryError, ROOMS_PAGE_SIZE, normalize_code
+
+logger = logging.getLogger(__name__)
+
+# Подробные логи socketio/engineio (каждый пакет) - только для отладки
+SOCKETIO_DEBUG_LOG = os.getenv("SOCKETIO_DEBUG_LOG", "").lower() in ("1", "true", "yes", "on")
+
+# Кодирование пакетов: json (текстовые кадры) или msgpack (бинарные кадры,
+# клиенту нужна сборка socket.io.msgpack.min.js)
+SOCKETIO_SERIALIZER = os.getenv("SOCKETIO_SERIALIZER", "json").lower()
+if SOCKETIO_SERIALIZER not in ("json", "msgpack"):
+    raise ValueError(f"SOCKETIO_SERIALIZER должен быть json или msgpack, получено '{SOCKETIO_SERIALIZER}'")
+
+# Менеджер клиентов: общий для воркеров, если задан SOCKETIO_BROKER_URL
+client_manager = create_client_manager()
 
 # Создание Socket.IO сервера
 sio = socketio.AsyncServer(
     async_mode='asgi',
     cors_allowed_origins='*',  # В продакшене указать конкретные домены
-    logger=True,
-    engineio_logger=True
+    logger=logging.getLogger('socketio.server') if SOCKETIO_DEBUG_LOG else False,
+    engineio_logger=logging.getLogger('engineio.server') if SOCKETIO_DEBUG_LOG else False,
+    client_manager=client_manager,
+    serializer='msgpack' if SOCKETIO_SERIALIZER == 'msgpack' else 'default'
+)
+
+# Активные пользователи и комнаты (с учетом других воркеров)
+registry = RoomRegistry()
+
+# Синхронизация реестра между воркерами
+presence = ClusterPresence(client_manager, registry) if client_manager else None
+
+async def _notify_presence(room_id: str, payload: dict):
+    # Каждый воркер сам рассылает изменения своим клиентам (его реестр уже
+    # знает об изменениях на других воркерах), поэтому мимо шины
+    await sio.emit(PRESENCE_EVENT, payload, room=room_id, ignore_queue=True)
+
+
+# Уведомления участников комнат о входе и выходе пользователей
+presence_notifier = PresenceNotifier(registry, _notify_presence)
+
+# Последние сообщения и броски в комнатах (для вошедших позже)
+history = RoomHistory(log_dir=HISTORY_LOG_DIR or None)
+
+
+async def _history_from_cluster(message: dict):
+    # Журнал на диске уже дописал воркер, получивший событие
+    await history.append(message["room"], message["event"], message["data"], persist=False, event_id=message.get("id"))
+
+
+# Комнаты, созданные мастерами (коды, владельцы, список для клиентов)
+directory = RoomDirectory(registry)
+# Сколько кодов пробовать, если выбранный код успел занять другой воркер
+ROOM_CREATE_ATTEMPTS = 5
+
+
+async def _rooms_from_cluster(message: dict):
+    op = message.get("op")
+    if op == "sync_request":
+        await client_manager.publish({"method": "rooms", "op": "sync", "rooms": [room.to_dict() for room in directory]})
+    elif op == "sync":
+        for room in message.get("rooms", []):
+            directory.add(Room(**room))
+
+
+# Команды, которые все воркеры применяют в одном порядке: вид -> применение
+_ordered_handlers: Dict[str, Callable[[str, Any], Awaitable[dict]]] = {}
+# Сколько ждать, пока команда пройдет через шину воркеров
+ORDERED_COMMAND_TIMEOUT = 5.0
+# ID команды -> ожидание ее применения (команды, отправленные этим воркером)
+_pending_commands: Dict[str, asyncio.Future] = {}
+
+
+async def run_ordered(kind: str, room_id: str, args) -> dict:
+    """
+    Выполнение команды над состоянием комнаты на всех воркерах
+
+    С несколькими воркерами команда сначала проходит через брокер
+    и применяется всеми воркерами в порядке брокера, поэтому
+    результат (номера изменений, очередность) у всех совпадает.
+    Каждый воркер сам рассылает результат своим клиентам.
+
+    Returns:
+        dict: Результат применения команды
+
+    Raises:
+        ValueError: Если команда некорректна (ошибка применения)
+        asyncio.TimeoutError: Если брокер не вернул команду вовремя
+    """
+    if client_manager is None:
+        return await _ordered_handlers[kind](room_id, args)
+
+    command_id = uuid.uuid4().hex
+    future = asyncio.get_running_loop().create_future()
+    _pending_commands[command_id] = future
+    try:
+        await client_manager.publish(
+            {"method": "ordered", "kind": kind, "id": command_id, "room": room_id, "args": args}, echo=True
+        )
+        return await asyncio.wait_for(future, ORDERED_COMMAND_TIMEOUT)
+    finally:
+        _pending_commands.pop(command_id, None)
+
+
+async def _ordered_from_cluster(message: dict):
+    future = _pending_commands.pop(message.get("id"), None)
+    try:
+        result = await _ordered_handlers[message["kind"]](message["room"], message["args"])
+    except Exception as e:
+        # Ошибка одной команды не должна останавливать прием сообщений кластера
+        if not isinstance(e, ValueError):
+            logger.exception("Ошибка применения команды %s", message.get("kind"))
+        if future is not None and not future.done():
+            future.set_exception(e)
+        return
+    if future is not None and not future.done():
+        future.set_result(result)
+
+
+# Общее состояние комнат: снимок при входе, дальше изменения с номерами
+game_state = GameStateStore(pinned=lambda room_id: registry.member_count(room_id) > 0)
+
+
+async def _apply_state_patch(room_id: str, ops: list) -> dict:
+    delta = game_state.apply(room_id, ops)
+    await sio.emit('state_patch', delta, room=room_id, ignore_queue=True)
+    return delta
+
+
+_ordered_handlers["state"] = _apply_state_patch
+
+
+async def _state_from_cluster(message: dict):
+    op = message.get("op")
+    if op == "sync_request":
+        states = [{"room": room_id, "state": document, "seq": seq} for room_id, document, seq in game_state.states() if seq]
+        await client_manager.publish({"method": "state", "op": "sync", "rooms": states})
+    elif op == "sync":
+        for room in message.get("rooms", []):
+            game_state.load(room["room"], room["state"], room["seq"])
+
+
+# Трекеры инициативы комнат мастеров
+initiative = InitiativeStore()
+MAX_INITIATIVE_MODIFIER = 100
+
+
+async def _apply_initiative(room_id: str, args: dict) -> dict:
+    update = initiative.execute(room_id, args.get("action"), args)
+    await sio.emit('initiative_update', update, room=room_id, ignore_queue=True)
+    return update
+
+
+_ordered_handlers["initiative"] = _apply_initiative
+
+
+async def _initiative_from_cluster(message: dict):
+    op = message.get("op")
+    if op == "sync_request":
+        await client_manager.publish({"method": "initiative", "op": "sync", "rooms": initiative.states()})
+    elif op == "sync":
+        for room_id, state in message.get("rooms", {}).items():
+            initiative.load(room_id, state)
+
+
+# Боевые карты комнат мастеров
+battle_maps = BattleMaps()
+# Туман войны: каждый воркер считает видимость для своих подключений
+visibility = VisibilityTracker()
+
+
+def _purge_room(room_id: str):
+    """Состояние удаленной комнаты: код может достаться новой комнате"""
+    game_state.drop(room_id)
+    initiative.drop(room_id)
+    battle_maps.drop(room_id)
+    visibility.drop(room_id)
+
+
+async def _apply_room_command(room_id: str, args: dict) -> dict:
+    # Каталог меняется в общем порядке, чтобы один код не получили два владельца
+    action = args.get("action")
+    if action == "create":
+        room, created = directory.create(args["name"], args["owner"], room_id, created_at=args["created_at"], exact=True)
+        return {"room": room.to_dict(), "created": created}
+    if action == "expire":
+        if directory.remove_expired(room_id) is not None:
+            _purge_room(room_id)
+        return {}
+    raise RoomDirectoryError(f"Неизвестная команда: {action}")
+
+
+_ordered_handlers["room"] = _apply_room_command
+
+# Удаление пустых комнат (expire вызывается из синхронного list_rooms)
+_room_tasks = BackgroundTasks("удаление пустой комнаты")
+
+
+def _rooms_expired(codes: list):
+    for code in codes:
+        _room_tasks.spawn(run_ordered("room", code, {"action": "expire"}))
+
+
+directory.on_expired = _rooms_expired
+
+
+def _fog_viewers(room_id: str) -> Dict[str, int]:
+    """
+    Игроки под туманом войны
+    
+    Returns:
+        Dict: sid -> ID игроков (не мастера) комнаты на этом воркере, если туман
+              включен, иначе пустой - им события карты фильтруются по видимости
+    """
+    battle_map = battle_maps.get(room_id)
+    viewers = {}
+    if battle_map is not None and battle_map.fog:
+        owner_id = directory.owner(room_id)
+        for sid, _ in sio.manager.get_participants('/', room_id):
+            user_info = registry.user(sid)
+            if user_info is not None and user_info['id'] != owner_id:
+                viewers[sid] = user_info['id']
+    return viewers
+
+
+async def send_visibility(room_id: str, full=()) -> Dict[str, int]:
+    """
+    Видимость игрокам комнаты на этом воркере (изменившимся и тем, кому нужна целиком)
+    
+    Returns:
+        Dict: Игроки под туманом (см. _fog_viewers)
+    """
+    viewers = _fog_viewers(room_id)
+    for sid, payload in visibility.update(room_id, battle_maps.get(room_id), viewers, full).items():
+        await sio.emit('visibility', payload, to=sid, ignore_queue=True)
+    return viewers
+
+
+async def send_fog_tokens(room_id: str, viewers: Dict[str, int], event: str, payload: dict):
+    """
+    Событие карты игрокам под туманом: только видимые им фишки
+    
+    map_state приходит без невидимых фишек. После остальных событий фишки,
+    которые стали видны, приходят как 'token_placed', скрывшиеся - как
+    'token_removed'; token_moved и token_updated - только о видимых фишках.
+    """
+    battle_map = battle_maps.get(room_id)
+    reset = viewers if event == 'map_state' else ()
+    for sid, (shown, visible) in visibility.tokens(room_id, viewers, reset).items():
+        if event == 'map_state':
+            tokens = [token for token in payload['tokens'] if token['id'] in visible]
+            await sio.emit(event, {**payload, 'tokens': tokens}, to=sid, ignore_queue=True)
+            continue
+        for token_id in sorted(shown - visible):
+            await sio.emit('token_removed', {'room_id': room_id, 'id': token_id}, to=sid, ignore_queue=True)
+        for token_id in sorted(visible - shown):
+            await sio.emit('token_placed', {'room_id': room_id, 'token': battle_map.token(token_id).to_dict()}, to=sid, ignore_queue=True)
+        token_id = payload['token']['id'] if 'token' in payload else payload.get('id')
+        if event == 'map_walls' or (event in ('token_moved', 'token_updated') and token_id in shown and token_id in visible):
+            await sio.emit(event, payload, to=sid, ignore_queue=True)
+
+
+async def _apply_map_command(room_id: str, args: dict) -> dict:
+    event, payload = battle_maps.execute(room_id, args.get("action"), args)
+    viewers = await send_visibility(room_id)
+    await sio.emit(event, payload, room=room_id, skip_sid=list(viewers) or None, ignore_queue=True)
+    if viewers:
+        await send_fog_tokens(room_id, viewers, event, payload)
+    return payload
+
+
+_ordered_handlers["map"] = _apply_map_command
+
+
+async def _map_from_cluster(message: dict):
+    op = message.get("op")
+    if op == "sync_request":
+        await client_manager.publish({"method": "map", "op": "sync", "rooms": battle_maps.states()})
+    elif op == "sync":
+        for room_id, state in message.get("rooms", {}).items():
+            battle_maps.load(room_id, state)
+
+
+async def _send_moves(event: str, data: dict):
+    """Промежуточные положения подключениям этого воркера: игрокам под туманом - только видимые"""
+    room_id = data["room_id"]
+    viewers = _fog_viewers(room_id)
+    await sio.emit(event, data, room=room_id, skip_sid=list(viewers) or None, ignore_queue=True)
+    for sid, moves in visibility.moves(room_id, viewers, data["moves"]).items():
+        await sio.emit(event, {"room_id": room_id, "moves": moves}, to=sid, ignore_queue=True)
+
+
+async def _moves_from_cluster(message: dict):
+    await _send_moves(message["event"], message["data"])
+
+
+async def _cluster_connected():
+    await presence.request_sync()
+    for method in ("rooms", "state", "initiative", "map"):
+        await client_manager.publish({"method": method, "op": "sync_request"})
+
+
+if client_manager is not None:
+    client_manager.subscribe("history", _history_from_cluster)
+    client_manager.subscribe("rooms", _rooms_from_cluster)
+    client_manager.subscribe("ordered", _ordered_from_cluster)
+    client_manager.subscribe("state", _state_from_cluster)
+    client_manager.subscribe("initiative", _initiative_from_cluster)
+    client_manager.subscribe("map", _map_from_cluster)
+    client_manager.subscribe("moves", _moves_from_cluster)
+    client_manager.on_connect = _cluster_connected
+
+
+async def _emit_to_room_now(event: str, data, room_id: str):
+    await sio.emit(event, data, room=room_id)
+
+
+# Пакетная отправка событий в комнаты (включается SOCKETIO_BATCH_INTERVAL_MS)
+batcher = (
+    EventBatcher(_emit_to_room_now, SOCKETIO_BATCH_INTERVAL_MS, SOCKETIO_BATCH_MAX_EVENTS)
+    if SOCKETIO_BATCH_INTERVAL_MS > 0 else None
 )
 
-# Хранилище активных пользователей и комнат
-active_users: Dict[str, dict] = {}  # sid -> user_info
-game_rooms: Dict[str, Set[str]] = {}  # room_id -> set of sids
+
+async def _emit_moves(event: str, data: dict, room_id: str):
+    # Каждый воркер фильтрует положения для своих игроков по их видимости
+    await _send_moves(event, data)
+    if client_manager is not None:
+        await client_manager.publish({"method": "moves", "event": event, "data": data})
+
+
+# Промежуточные положения перетаскиваемых фишек (не чаще MOVEMENT_RATE_HZ на комнату)
+movement = MovementChannel(_emit_moves)
+
+
+async def emit_to_room(event: str, data, room_id: str):
+    """
+    Отправка события всем участникам комнаты
+
+    При включенной пакетной отправке событие ставится в очередь комнаты
+    и уходит клиентам в составе пакета 'events'.
+    
+    Args:
+        event: Имя события
+        data: Данные события
+        room_id: ID комнаты
+    """
+    if batcher is not None:
+        await batcher.add(room_id, event, data)
+    else:
+        await sio.emit(event, data, room=room_id)
+
+
+async def record_history(room_id: str, event: str, data: dict):
+    """Сохранение события комнаты в историю (на всех воркерах)"""
+    entry = await history.append(room_id, event, data)
+    if client_manager is not None:
+        await client_manager.publish({"method": "history", "room": room_id, "id": entry["id"], "event": event, "data": data})
+
+
+def start_cluster():
+    """
+    Подключение к шине воркеров при старте приложения
+
+    По умолчанию менеджер клиентов запускается при первом подключении клиента,
+    но воркер должен получать присутствие других воркеров сразу.
+    """
+    if client_manager is not None and not sio.manager_initialized:
+        sio.manager_initialized = True
+        client_manager.initialize()
+
+
+def _requested_room(data: dict):
+    """ID комнаты из запроса: room_id или код комнаты каталога в room"""
+    return data.get('room_id') or normalize_code(data.get('room'))
 
 
 async def authenticate_socket(token: str) -> dict:
@@ -30,25 +410,14 @@ async def authenticate_socket(token: str) -> dict:
     Returns:
         dict: Информация о пользователе или None
     """
-    payload = decode_access_token(token)
-    if not payload:
-        return None
-    
-    user_id = payload.get("sub")
-    if not user_id:
-        return None
-    
-    db = SessionLocal()
-    try:
-        user = get_user_by_id(db, user_id)
+    async with AsyncSessionLocal() as db:
+        user = await get_user_from_token(db, token)
         if user and user.is_active:
             return {
                 "id": user.id,
                 "username": user.username,
                 "character_name": user.character_name
             }
-    finally:
-        db.close()
     
     return None
 
@@ -58,22 +427,22 @@ async def connect(sid, environ, auth):
     """
     Обработка подключения клиента
     """
-    print(f"🔌 Клиент подключается: {sid}")
-    
     # Проверка токена
     if not auth or 'token' not in auth:
-        print(f"❌ Отклонено подключение {sid}: нет токена")
+        logger.info("Отклонено подключение: нет токена", extra={"event": "connect", "sid": sid})
         return False
     
     user_info = await authenticate_socket(auth['token'])
     if not user_info:
-        print(f"❌ Отклонено подключение {sid}: невалидный токен")
+        logger.info("Отклонено подключение: невалидный токен", extra={"event": "connect", "sid": sid})
         return False
     
     # Сохранение информации о пользователе
-    active_users[sid] = user_info
+    registry.connect(sid, user_info)
+    if presence:
+        await presence.connected(sid, user_info)
     
-    print(f"✅ Пользователь подключен: {user_info['username']} (sid: {sid})")
+    logger.info("Пользователь подключен", extra={"event": "connect", "sid": sid, "user": user_info['username']})
     
     # Отправка приветственного сообщения
     await sio.emit('connected', {
@@ -81,12 +450,6 @@ async def connect(sid, environ, auth):
         'user': user_info
     }, to=sid)
     
-    # Уведомление всех о новом пользователе
-    await sio.emit('user_joined', {
-        'username': user_info['username'],
-        'character_name': user_info['character_name']
-    }, skip_sid=sid)
-    
     return True
 
 
@@ -95,27 +458,16 @@ async def disconnect(sid):
     """
     Обработка отключения клиента
     """
-    if sid in active_users:
-        user_info = active_users[sid]
-        print(f"🔌 Пользователь отключился: {user_info['username']} (sid: {sid})")
-        
-        # Удаление из всех комнат
-        for room_id, members in game_rooms.items():
-            if sid in members:
-                members.remove(sid)
-                await sio.emit('user_left_room', {
-                    'username': user_info['username'],
-                    'room_id': room_id
-                }, room=room_id)
+    # Удаление из реестра и из всех комнат пользователя
+    # (участники комнат получат 'presence' через PRESENCE_DEBOUNCE_MS)
+    user_info, rooms = registry.disconnect(sid)
+    if user_info:
+        logger.info("Пользователь отключился", extra={"event": "disconnect", "sid": sid, "user": user_info['username']})
         
-        # Уведомление всех об отключении
-        await sio.emit('user_left', {
-            'username': user_info['username']
-        })
-        
-        del active_users[sid]
+        if presence:
+            await presence.disconnected(sid)
     else:
-        print(f"🔌 Клиент отключился: {sid}")
+        logger.debug("Клиент отключился", extra={"event": "disconnect", "sid": sid})
 
 
 @sio.event
@@ -123,35 +475,57 @@ async def join_room(sid, data):
     """
     Присоединение к игровой комнате
     """
-    if sid not in active_users:
+    if not registry.is_connected(sid):
         return {'error': 'Не авторизован'}
     
+    # room - код комнаты из каталога (протокол веб-клиента), room_id - любая комната
+    room = None
     room_id = data.get('room_id')
+    if not room_id and data.get('room'):
+        room = directory.get(data['room'])
+        if room is None:
+            await sio.emit('system_message', {'message': 'Комната не найдена'}, to=sid)
+            return {'error': 'Комната не найдена'}
+        room_id = room.code
     if not room_id:
         return {'error': 'Не указан ID комнаты'}
     
-    user_info = active_users[sid]
+    # Сколько последних событий вернуть (по умолчанию вся сохраненная история)
+    history_limit = data.get('history_limit')
+    if not isinstance(history_limit, int):
+        history_limit = None
+    
+    user_info = registry.user(sid)
     
     # Добавление в комнату
-    if room_id not in game_rooms:
-        game_rooms[room_id] = set()
+    registry.join(sid, room_id)
+    await sio.enter_room(sid, room_id)
+    if presence:
+        await presence.joined(sid, room_id)
     
-    game_rooms[room_id].add(sid)
-    sio.enter_room(sid, room_id)
+    logger.info("Вход в комнату", extra={"event": "join_room", "room_id": room_id, "user": user_info['username']})
     
-    print(f"🚪 {user_info['username']} присоединился к комнате {room_id}")
+    if room is not None:
+        await sio.emit('room_joined', {'room': room.code, **directory.describe(room)}, to=sid)
     
-    # Уведомление участников комнаты
-    await sio.emit('user_joined_room', {
-        'username': user_info['username'],
-        'character_name': user_info['character_name'],
-        'room_id': room_id
-    }, room=room_id, skip_sid=sid)
+    # Полный снимок состояния комнаты, дальше клиент получает state_patch
+    await sio.emit('state_snapshot', game_state.snapshot(room_id), to=sid)
+    if room_id in initiative:
+        await sio.emit('initiative_state', initiative.snapshot(room_id), to=sid)
+    map_snapshot = battle_maps.snapshot(room_id)
+    if map_snapshot is not None:
+        viewers = await send_visibility(room_id, full=[sid])
+        if sid in viewers:
+            # Под туманом игрок получает только видимые фишки
+            await send_fog_tokens(room_id, {sid: viewers[sid]}, 'map_state', map_snapshot)
+        else:
+            await sio.emit('map_state', map_snapshot, to=sid)
     
     return {
         'success': True,
         'room_id': room_id,
-        'members_count': len(game_rooms[room_id])
+        'members_count': registry.member_count(room_id),
+        'history': await history.recent(room_id, history_limit)
     }
 
 
@@ -160,31 +534,25 @@ async def leave_room(sid, data):
     """
     Выход из игровой комнаты
     """
-    if sid not in active_users:
+    if not registry.is_connected(sid):
         return {'error': 'Не авторизован'}
     
-    room_id = data.get('room_id')
+    room_id = _requested_room(data)
     if not room_id:
         return {'error': 'Не указан ID комнаты'}
     
-    user_info = active_users[sid]
+    user_info = registry.user(sid)
     
-    # Удаление из комнаты
-    if room_id in game_rooms and sid in game_rooms[room_id]:
-        game_rooms[room_id].remove(sid)
-        sio.leave_room(sid, room_id)
+    # Удаление из комнаты (пустая комната удаляется из реестра)
+    if registry.leave(sid, room_id):
+        await sio.leave_room(sid, room_id)
+        if presence:
+            await presence.left(sid, room_id)
         
-        print(f"🚪 {user_info['username']} покинул комнату {room_id}")
+        logger.info("Выход из комнаты", extra={"event": "leave_room", "room_id": room_id, "user": user_info['username']})
         
-        # Уведомление участников комнаты
-        await sio.emit('user_left_room', {
-            'username': user_info['username'],
-            'room_id': room_id
-        }, room=room_id)
-        
-        # Удаление пустой комнаты
-        if len(game_rooms[room_id]) == 0:
-            del game_rooms[room_id]
+        if 'room' in data:
+            await sio.emit('room_left', {'room': room_id}, to=sid)
         
         return {'success': True}
     
@@ -196,11 +564,18 @@ async def send_message(sid, data):
     """
     Отправка сообщения в чат
     """
-    if sid not in active_users:
+    if not registry.is_connected(sid):
         return {'error': 'Не авторизован'}
     
-    user_info = active_users[sid]
+    user_info = registry.user(sid)
+    # Веб-клиент передает код комнаты в room и ждет событие new_message
     room_id = data.get('room_id')
+    event = 'chat_message'
+    if not room_id and data.get('room'):
+        room_id = normalize_code(data['room'])
+        event = 'new_message'
+        if not registry.in_room(sid, room_id):
+            return {'error': 'Вы не в этой комнате'}
     message = data.get('message', '').strip()
     
     if not message:
@@ -215,12 +590,13 @@ async def send_message(sid, data):
     
     if room_id:
         # Отправка в комнату
-        await sio.emit('chat_message', message_data, room=room_id)
-        print(f"💬 [{room_id}] {user_info['username']}: {message}")
+        await emit_to_room(event, message_data, room_id)
+        await record_history(room_id, event, message_data)
+        logger.info("Сообщение в комнате", extra={"event": "chat_message", "room_id": room_id, "user": user_info['username'], "length": len(message)})
     else:
         # Отправка всем
         await sio.emit('chat_message', message_data)
-        print(f"💬 [Общий чат] {user_info['username']}: {message}")
+        logger.info("Сообщение в общем чате", extra={"event": "chat_message", "user": user_info['username'], "length": len(message)})
     
     return {'success': True}
 
@@ -228,59 +604,521 @@ async def send_message(sid, data):
 @sio.event
 async def dice_roll(sid, data):
     """
-    Бросок кубика
+    Бросок кубиков (результат считает сервер)
+    
+    Запись броска передается в expression или dice_type:
+    d20, 4d6kh3+2, 2d20kl1, 8d6!, 3d8+1d4+5
     """
-    if sid not in active_users:
+    if not registry.is_connected(sid):
         return {'error': 'Не авторизован'}
     
-    user_info = active_users[sid]
+    user_info = registry.user(sid)
     room_id = data.get('room_id')
-    dice_type = data.get('dice_type', 'd20')  # d4, d6, d8, d10, d12, d20, d100
-    result = data.get('result')
+    expression = data.get('expression') or data.get('dice_type', 'd20')
+    
+    try:
+        roll = roll_dice(expression)
+    except DiceError as e:
+        return {'error': str(e)}
     
     roll_data = {
         'username': user_info['username'],
         'character_name': user_info['character_name'],
-        'dice_type': dice_type,
-        'result': result,
+        'dice_type': roll['expression'],
+        'result': roll['total'],
+        'rolls': roll['terms'],
         'timestamp': data.get('timestamp')
     }
     
     if room_id:
-        await sio.emit('dice_rolled', roll_data, room=room_id)
-        print(f"🎲 [{room_id}] {user_info['username']} бросил {dice_type}: {result}")
+        await emit_to_room('dice_rolled', roll_data, room_id)
+        await record_history(room_id, 'dice_rolled', roll_data)
+        logger.info("Бросок кубиков", extra={"event": "dice_roll", "room_id": room_id, "user": user_info['username'], "expression": roll['expression'], "total": roll['total']})
     else:
         await sio.emit('dice_rolled', roll_data)
-        print(f"🎲 {user_info['username']} бросил {dice_type}: {result}")
+        logger.info("Бросок кубиков", extra={"event": "dice_roll", "user": user_info['username'], "expression": roll['expression'], "total": roll['total']})
+    
+    return {'success': True, 'result': roll['total'], 'rolls': roll['terms']}
+
+
+@sio.on('roll_dice')
+async def roll_die(sid, data):
+    """
+    Бросок одного кубика в комнате каталога (протокол веб-клиента)
+    
+    Данные: {room: код комнаты, sides: число граней}.
+    Участники комнаты получают 'dice_result'.
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    user_info = registry.user(sid)
+    room_id = normalize_code(data.get('room'))
+    sides = data.get('sides')
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    if not isinstance(sides, int) or isinstance(sides, bool):
+        return {'error': 'Не указано число граней'}
+    
+    try:
+        roll = roll_dice(f"d{sides}")
+    except DiceError as e:
+        return {'error': str(e)}
+    
+    result_data = {
+        'username': user_info['username'],
+        'character_name': user_info['character_name'],
+        'sides': sides,
+        'result': roll['total'],
+        'timestamp': data.get('timestamp')
+    }
+    
+    await emit_to_room('dice_result', result_data, room_id)
+    await record_history(room_id, 'dice_result', result_data)
+    logger.info("Бросок кубиков", extra={"event": "dice_roll", "room_id": room_id, "user": user_info['username'], "expression": roll['expression'], "total": roll['total']})
+    
+    return {'success': True, 'result': roll['total']}
+
+
+@sio.on('initiative')
+async def initiative_command(sid, data):
+    """
+    Команда трекеру инициативы (только владелец комнаты каталога)
+    
+    Данные: {room, action, ...}. Действия:
+        add {name, initiative или modifier, tiebreak, id, user_id} - участник
+            (без initiative сервер бросает d20 + modifier)
+        remove {id}, next, delay {id, initiative}, ready {id, ready},
+        effect_add {id, name, rounds, anchor, at}, effect_remove {effect_id}, end
+    Участники комнаты получают 'initiative_update' только с изменившимися записями.
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    user_info = registry.user(sid)
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    
+    owner_id = directory.owner(room_id)
+    if owner_id is None:
+        return {'error': 'Трекер инициативы доступен только в комнате мастера'}
+    if owner_id != user_info['id']:
+        return {'error': 'Инициативой управляет только мастер'}
+    
+    args = {key: value for key, value in data.items() if key not in ('room', 'room_id')}
+    if args.get('action') == 'add' and 'initiative' not in args:
+        # Бросок инициативы на сервере (до отправки воркерам, чтобы у всех был один результат)
+        modifier = args.get('modifier', 0)
+        if isinstance(modifier, bool) or not isinstance(modifier, int) or abs(modifier) > MAX_INITIATIVE_MODIFIER:
+            return {'error': f'modifier должно быть целым числом от -{MAX_INITIATIVE_MODIFIER} до {MAX_INITIATIVE_MODIFIER}'}
+        try:
+            args['initiative'] = roll_dice(f"d20{modifier:+d}")['total']
+        except DiceError as e:
+            return {'error': str(e)}
+        args.setdefault('tiebreak', modifier)
+    
+    try:
+        update = await run_ordered("initiative", room_id, args)
+    except InitiativeError as e:
+        return {'error': str(e)}
+    except asyncio.TimeoutError:
+        return {'error': 'Команда не выполнена, попробуйте еще раз'}
+    
+    logger.info("Инициатива", extra={"event": "initiative", "room_id": room_id, "user": user_info['username'], "action": args.get('action'), "round": update['round']})
+    
+    return {'success': True, 'version': update['version'], 'round': update['round'], 'current': update['current']}
+
+
+@sio.event
+async def get_initiative(sid, data):
+    """
+    Полное состояние трекера инициативы комнаты (участники в порядке ходов)
+    
+    Нужен после пропуска номера version в 'initiative_update'.
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    return initiative.snapshot(room_id)
+
+
+async def _map_command(sid, data, action: str) -> dict:
+    """
+    Команда боевой карте комнаты каталога
+    
+    Права проверяет сама карта: мастер (владелец комнаты) управляет картой
+    и всеми фишками, игрок - только своими фишками.
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    user_info = registry.user(sid)
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    
+    owner_id = directory.owner(room_id)
+    if owner_id is None:
+        return {'error': 'Боевая карта доступна только в комнате мастера'}
+    
+    args = {key: value for key, value in data.items() if key not in ('room', 'room_id')}
+    args.update(action=action, actor=user_info['id'], dm=owner_id == user_info['id'])
+    if action in ('move', 'remove') and isinstance(args.get('id'), str):
+        # Конечное положение уходит сразу, промежуточное после него уже не нужно
+        await movement.settle(room_id, args['id'])
+    try:
+        payload = await run_ordered("map", room_id, args)
+    except MapError as e:
+        return {'error': str(e)}
+    except asyncio.TimeoutError:
+        return {'error': 'Команда не выполнена, попробуйте еще раз'}
+    
+    logger.debug("Боевая карта", extra={"event": "map_" + action, "room_id": room_id, "user": user_info['username']})
+    
+    if 'token' in payload:
+        return {'success': True, 'token': payload['token']}
+    return {'success': True}
+
+
+@sio.event
+async def create_map(sid, data):
+    """
+    Новая боевая карта комнаты (только мастер): {room, width, height}
+    
+    Участники комнаты получают 'map_state'.
+    """
+    return await _map_command(sid, data, 'create')
+
+
+@sio.event
+async def clear_map(sid, data):
+    """Удаление боевой карты комнаты (только мастер)"""
+    return await _map_command(sid, data, 'clear')
+
+
+@sio.event
+async def place_token(sid, data):
+    """
+    Фишка на карте: {room, name, x, y, size, id, owner_id}
+    
+    Фишка игрока всегда принадлежит ему, мастер может указать owner_id.
+    Участники комнаты получают 'token_placed'.
+    """
+    return await _map_command(sid, data, 'place')
+
+
+@sio.event
+async def move_token(sid, data):
+    """
+    Перемещение фишки: {room, id, x, y}
+    
+    Клетки не должны быть заняты другими фишками. Событие 'token_moved'
+    получают только участники этой комнаты.
+    """
+    return await _map_command(sid, data, 'move')
+
+
+@sio.event
+async def drag_token(sid, data):
+    """
+    Промежуточное положение перетаскиваемой фишки: {room, id, x, y}
+    
+    Можно слать с любой частотой: комната получает 'tokens_moving' с последними
+    положениями не чаще MOVEMENT_RATE_HZ раз в секунду. Карта не меняется,
+    пока фишку не отпустят (move_token с конечной клеткой).
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    user_info = registry.user(sid)
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    battle_map = battle_maps.get(room_id)
+    if battle_map is None:
+        return {'error': 'В комнате нет карты'}
+    
+    try:
+        token = battle_map.token(data.get('id'))
+    except MapError as e:
+        return {'error': str(e)}
+    if directory.owner(room_id) != user_info['id'] and token.owner_id != user_info['id']:
+        return {'error': 'Можно двигать только свои фишки'}
+    
+    x, y = data.get('x'), data.get('y')
+    if not all(isinstance(v, int) and not isinstance(v, bool) for v in (x, y)) \
+            or not (0 <= x < battle_map.width and 0 <= y < battle_map.height):
+        return {'error': 'Клетка вне карты'}
+    
+    movement.update(room_id, token.id, x, y)
+    return {'success': True}
+
+
+@sio.event
+async def set_vision(sid, data):
+    """Дальность зрения фишки в футах: {room, id, vision}. Участники получают 'token_updated'"""
+    return await _map_command(sid, data, 'vision')
+
+
+@sio.event
+async def set_walls(sid, data):
+    """
+    Стены на карте (только мастер): {room, cells: [[x, y], ...], blocked}
+    
+    blocked=false убирает стены. Участники комнаты получают 'map_walls'
+    с клетками, которые действительно изменились.
+    """
+    return await _map_command(sid, data, 'walls')
+
+
+@sio.event
+async def set_fog(sid, data):
+    """
+    Туман войны (только мастер): {room, enabled}
+    
+    Пока он включен, игроки получают 'visibility' - клетки, которые видят их фишки.
+    """
+    return await _map_command(sid, data, 'fog')
+
+
+@sio.event
+async def get_visibility(sid, data):
+    """Маска видимости целиком (после пропуска номера version в 'visibility')"""
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
     
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    battle_map = battle_maps.get(room_id)
+    if battle_map is None or not battle_map.fog:
+        return {'error': 'Туман войны выключен'}
+    await send_visibility(room_id, full=[sid])
     return {'success': True}
 
 
+@sio.event
+async def remove_token(sid, data):
+    """Удаление фишки: {room, id}. Участники комнаты получают 'token_removed'"""
+    return await _map_command(sid, data, 'remove')
+
+
+@sio.event
+async def get_map(sid, data):
+    """Полное состояние боевой карты комнаты (None, если карты нет; под туманом - видимые фишки)"""
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    map_snapshot = battle_maps.snapshot(room_id)
+    viewers = await send_visibility(room_id)
+    if map_snapshot is not None and sid in viewers:
+        _, visible = visibility.tokens(room_id, {sid: viewers[sid]}, reset=[sid])[sid]
+        map_snapshot['tokens'] = [token for token in map_snapshot['tokens'] if token['id'] in visible]
+    return map_snapshot
+
+
+@sio.event
+async def map_query(sid, data):
+    """
+    Какие фишки задевает область (для выбора целей)
+    
+    Данные: {room, shape, x, y, feet, direction}, shape - radius
+    (все в пределах feet футов), sphere, cube, cone или line.
+    
+    Returns:
+        dict: {success, tokens: [id фишек]}
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    battle_map = battle_maps.get(room_id)
+    if battle_map is None:
+        return {'error': 'В комнате нет карты'}
+    
+    shape = data.get('shape', 'radius')
+    try:
+        if shape == 'radius':
+            tokens = battle_map.tokens_within(data.get('x'), data.get('y'), data.get('feet'))
+        else:
+            tokens = battle_map.area(shape, data.get('x'), data.get('y'), data.get('feet'), data.get('direction', 0))
+    except MapError as e:
+        return {'error': str(e)}
+    if sid in _fog_viewers(room_id):
+        # Игрок под туманом узнает только о фишках, которые ему показаны
+        shown = visibility.shown(room_id, sid)
+        tokens = [token_id for token_id in tokens if token_id in shown]
+    return {'success': True, 'tokens': tokens}
+
+
+@sio.event
+async def update_state(sid, data):
+    """
+    Изменение общего состояния комнаты
+    
+    Данные: {room_id или room, ops: [операции JSON Patch]}.
+    В комнате каталога игрок может менять только /players/<свой id>/...,
+    владелец комнаты - весь документ. Участники комнаты получают 'state_patch'.
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    user_info = registry.user(sid)
+    room_id = _requested_room(data)
+    ops = data.get('ops')
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    if not isinstance(ops, list) or not ops:
+        return {'error': 'Нужен непустой список операций'}
+    
+    try:
+        owner_id = directory.owner(room_id)
+        if owner_id is not None and owner_id != user_info['id'] and not touches_only(ops, ['players', str(user_info['id'])]):
+            return {'error': 'Можно менять только состояние своего персонажа'}
+        delta = await run_ordered("state", room_id, ops)
+    except StatePatchError as e:
+        return {'error': str(e)}
+    except asyncio.TimeoutError:
+        return {'error': 'Изменение не применено, попробуйте еще раз'}
+    
+    logger.info("Изменение состояния", extra={"event": "update_state", "room_id": room_id, "user": user_info['username'], "seq": delta['seq'], "ops": len(ops)})
+    
+    return {'success': True, 'seq': delta['seq']}
+
+
+@sio.event
+async def get_state(sid, data):
+    """
+    Состояние комнаты после пропуска изменений или переподключения
+    
+    Данные: {room_id или room, since_seq, epoch}. Если изменения после
+    since_seq еще есть в журнале, возвращаются они (patches), иначе -
+    полный снимок (snapshot=True).
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    room_id = _requested_room(data)
+    if not room_id or not registry.in_room(sid, room_id):
+        return {'error': 'Вы не в этой комнате'}
+    
+    since_seq = data.get('since_seq')
+    if not isinstance(since_seq, int):
+        since_seq = None
+    return game_state.since(room_id, since_seq, data.get('epoch'))
+
+
+@sio.event
+async def create_room(sid, data):
+    """
+    Создание комнаты в каталоге
+    
+    Данные: {room: название или код из 6 символов}. Если передан
+    свободный код (или код своей комнаты), он и используется,
+    иначе сервер выделяет новый. Ответ: {success, room: код, name}.
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    data = data or {}
+    user_info = registry.user(sid)
+    name = data.get('name') or data.get('room')
+    code = data.get('code') or normalize_code(data.get('room'))
+    
+    existing = directory.get(code) if code else None
+    if existing is not None and existing.owner_id != user_info['id']:
+        code = None
+    owner = {'id': user_info['id'], 'username': user_info['username']}
+    
+    # Код выбирает этот воркер, а занятость проверяется в общем порядке команд:
+    # если другой воркер успел отдать код, пробуем новый
+    for _ in range(ROOM_CREATE_ATTEMPTS):
+        args = {'action': 'create', 'name': name, 'owner': owner, 'created_at': time.time()}
+        try:
+            result = await run_ordered("room", code or directory.allocate_code(), args)
+            break
+        except RoomCodeTaken:
+            code = None
+        except RoomDirectoryError as e:
+            return {'error': str(e)}
+        except asyncio.TimeoutError:
+            return {'error': 'Комната не создана, попробуйте еще раз'}
+    else:
+        return {'error': 'Не удалось выделить код комнаты, попробуйте еще раз'}
+    
+    room = result['room']
+    if result['created']:
+        logger.info("Комната создана", extra={"event": "create_room", "room_id": room['code'], "user": user_info['username']})
+    
+    return {'success': True, 'room': room['code'], 'name': room['name']}
+
+
+@sio.event
+async def get_rooms(sid, data=None):
+    """
+    Страница списка комнат каталога (отсортирован по названию)
+    
+    Данные (все поля необязательны): query - код или начало названия,
+    mine - только свои комнаты, cursor - next_cursor прошлой страницы,
+    limit - размер страницы. Список приходит событием 'rooms_list'
+    и в ответе: {rooms: [{code, name, owner, users}], next_cursor}.
+    """
+    if not registry.is_connected(sid):
+        return {'error': 'Не авторизован'}
+    
+    data = data or {}
+    limit = data.get('limit')
+    if not isinstance(limit, int):
+        limit = ROOMS_PAGE_SIZE
+    
+    try:
+        page = directory.list_rooms(
+            query=data.get('query'),
+            owner_id=registry.user(sid)['id'] if data.get('mine') else None,
+            cursor=data.get('cursor'),
+            limit=limit
+        )
+    except RoomDirectoryError as e:
+        return {'error': str(e)}
+    
+    await sio.emit('rooms_list', page, to=sid)
+    return page
+
+
 @sio.event
 async def get_online_users(sid, data):
     """
     Получение списка онлайн пользователей
+    
+    Клиент может передать since_version и epoch из прошлого ответа -
+    тогда вернутся только изменения после этой версии (added, removed),
+    а если изменений в журнале уже нет - полный список (snapshot=True).
     """
-    if sid not in active_users:
+    if not registry.is_connected(sid):
         return {'error': 'Не авторизован'}
     
+    data = data or {}
     room_id = data.get('room_id')
+    since_version = data.get('since_version')
+    if not isinstance(since_version, int):
+        since_version = None
     
-    if room_id and room_id in game_rooms:
-        # Пользователи в конкретной комнате
-        users = [
-            active_users[user_sid]
-            for user_sid in game_rooms[room_id]
-            if user_sid in active_users
-        ]
-    else:
+    if not (room_id and registry.has_room(room_id)):
         # Все онлайн пользователи
-        users = list(active_users.values())
+        room_id = None
     
-    return {
-        'users': users,
-        'count': len(users)
-    }
+    result = registry.presence_since(room_id, since_version, data.get('epoch'))
+    result['room_id'] = room_id
+    return result
 
 
 # Экспорт Socket.IO приложения
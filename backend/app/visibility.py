@@ -0,0 +1,363 @@
+"""
+Туман войны: что видят игроки на боевой карте
+
+Игрок видит клетки, которые видят его фишки: в пределах дальности зрения
+vision (круг от центральной клетки фишки) и не закрытые стенами.
+Мастер видит всю карту, для него видимость не считается.
+
+Линия обзора считается сразу для всех клеток круга одной выборкой numpy:
+для каждого радиуса заранее строится таблица лучей - для каждой клетки круга
+клетки между ней и центром. Клетка видна, если ни одна клетка ее луча
+не стена (сама стена видна, но закрывает то, что за ней).
+
+Пересчет инкрементальный: поле зрения фишки хранится и считается заново,
+только если изменились ее клетка, размер, дальность зрения или стены
+в пределах ее круга.
+
+Фишки игрок тоже получает только видимые: свои и те, что хотя бы одной
+клеткой попадают в его маску. tokens() для каждого подключения сравнивает
+видимые сейчас фишки с уже показанными, чтобы сервер разослал появившиеся
+и убрал скрывшиеся; moves() так же фильтрует промежуточные положения.
+
+Видимость отправляется каждому подключению игрока битовой маской
+(np.packbits, клетки построчно: бит y * width + x, старший бит байта - первый).
+Первый раз - целиком, дальше - только изменившиеся байты XOR к прошлой маске:
+    {"room_id", "version": 1, "width", "height", "full": "<base64>"}
+    {"room_id", "version": 2, "base": 1, "runs": [[смещение байта, "<base64 XOR>"], ...]}
+"""
+import base64
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.battle_map import FEET_PER_CELL, MAX_TOKEN_SIZE, MAX_VISION_FEET, BattleMap, Token
+
+_PAD = MAX_VISION_FEET // FEET_PER_CELL
+# Промежуток нулевых байтов, при котором изменения делятся на отдельные отрезки
+_RUN_GAP = 8
+
+
+@lru_cache(maxsize=None)
+def _rays(radius: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Таблица лучей круга радиуса radius клеток
+
+    Returns:
+        Tuple: dx, dy клеток круга (K,) и sx, sy клеток их лучей (K, radius - 1);
+               лишние места в луче заполнены центром (0, 0)
+    """
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = dx * dx + dy * dy <= radius * radius
+    dx, dy = dx[inside], dy[inside]
+
+    steps = np.maximum(np.abs(dx), np.abs(dy))
+    k = np.arange(1, max(radius, 1))
+    t = k[None, :] / np.maximum(steps, 1)[:, None]
+    between = k[None, :] < steps[:, None]
+    sx = np.where(between, np.floor(dx[:, None] * t + 0.5), 0).astype(np.intp)
+    sy = np.where(between, np.floor(dy[:, None] * t + 0.5), 0).astype(np.intp)
+    return dx, dy, sx, sy
+
+
+def _token_key(token: Token) -> Tuple[int, int, int, int]:
+    return token.x, token.y, token.size, token.vision
+
+
+class _Field:
+    """Поле зрения фишки: номера видимых клеток (y * width + x)"""
+    __slots__ = ("key", "owner_id", "cells", "box")
+
+    def __init__(self, key: tuple, owner_id: int, cells: np.ndarray, box: Tuple[int, int, int, int]):
+        self.key = key
+        self.owner_id = owner_id
+        self.cells = cells
+        # Квадрат круга зрения (x0, y0, x1, y1): стены вне него на поле не влияют
+        self.box = box
+
+
+class RoomVisibility:
+    """
+    Видимость на одной карте
+
+    Args:
+        battle_map: Карта комнаты
+    """
+
+    def __init__(self, battle_map: BattleMap):
+        self.battle_map = battle_map
+        self.width = battle_map.width
+        self.height = battle_map.height
+        # Стены с полями по краям, чтобы лучи у края карты не выходили за массив
+        self._walls = np.zeros((self.height + 2 * _PAD, self.width + 2 * _PAD), dtype=bool)
+        self._walls_version = -1
+        self._fields: Dict[str, _Field] = {}
+        # sid -> (version, упакованная маска последней отправки)
+        self._sent: Dict[str, Tuple[int, np.ndarray]] = {}
+        # Маски игроков после последнего пересчета (сбрасываются, когда видимость меняется)
+        self._masks: Dict[int, np.ndarray] = {}
+        # sid -> фишки, которые подключение уже получило
+        self._shown: Dict[str, Set[str]] = {}
+        # Фишки карты массивами (по версии карты): ID, индекс по ID, x, y, size, владелец
+        self._arrays: Optional[tuple] = None
+        self._arrays_version = -1
+        self.recomputed = 0
+
+    def _sync_walls(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Стены карты -> массив; x и y клеток, которые изменились"""
+        if self.battle_map.walls_version == self._walls_version:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        walls = np.zeros_like(self._walls)
+        if self.battle_map.walls:
+            xs, ys = np.array(sorted(self.battle_map.walls)).T
+            walls[ys + _PAD, xs + _PAD] = True
+        ys, xs = np.nonzero(walls ^ self._walls)
+        self._walls = walls
+        self._walls_version = self.battle_map.walls_version
+        return xs - _PAD, ys - _PAD
+
+    def _compute(self, token: Token) -> _Field:
+        radius = token.vision // FEET_PER_CELL
+        ox, oy = token.x + (token.size - 1) // 2, token.y + (token.size - 1) // 2
+        dx, dy, sx, sy = _rays(radius)
+        blocked = self._walls[oy + _PAD + sy, ox + _PAD + sx].any(axis=1)
+        tx, ty = ox + dx, oy + dy
+        visible = ~blocked & (tx >= 0) & (tx < self.width) & (ty >= 0) & (ty < self.height)
+        self.recomputed += 1
+        return _Field(_token_key(token), token.owner_id, ty[visible] * self.width + tx[visible],
+                      (ox - radius, oy - radius, ox + radius, oy + radius))
+
+    def refresh(self) -> Set[int]:
+        """
+        Пересчет полей зрения изменившихся фишек
+
+        Returns:
+            Set: Игроки, чья видимость могла измениться
+        """
+        wall_xs, wall_ys = self._sync_walls()
+        affected: Set[int] = set()
+        seen = set()
+        for token in self.battle_map.tokens():
+            if token.owner_id is None or token.vision <= 0:
+                continue
+            seen.add(token.id)
+            field = self._fields.get(token.id)
+            if field is not None and field.key == _token_key(token) and field.owner_id == token.owner_id:
+                x0, y0, x1, y1 = field.box
+                if not ((wall_xs >= x0) & (wall_xs <= x1) & (wall_ys >= y0) & (wall_ys <= y1)).any():
+                    continue
+            if field is not None:
+                affected.add(field.owner_id)
+            self._fields[token.id] = self._compute(token)
+            affected.add(token.owner_id)
+
+        for token_id in [token_id for token_id in self._fields if token_id not in seen]:
+            affected.add(self._fields.pop(token_id).owner_id)
+        return affected
+
+    def mask(self, user_id: int) -> np.ndarray:
+        """Видимые игроку клетки (height, width)"""
+        mask = np.zeros(self.width * self.height, dtype=bool)
+        for field in self._fields.values():
+            if field.owner_id == user_id:
+                mask[field.cells] = True
+        return mask.reshape(self.height, self.width)
+
+    def _user_mask(self, user_id: int) -> np.ndarray:
+        mask = self._masks.get(user_id)
+        if mask is None:
+            mask = self._masks[user_id] = self.mask(user_id)
+        return mask
+
+    def _token_arrays(self) -> tuple:
+        if self._arrays is None or self._arrays_version != self.battle_map.version:
+            tokens = list(self.battle_map.tokens())
+            ids = [token.id for token in tokens]
+            self._arrays = (
+                ids,
+                {token_id: i for i, token_id in enumerate(ids)},
+                np.array([token.x for token in tokens], dtype=np.intp),
+                np.array([token.y for token in tokens], dtype=np.intp),
+                np.array([token.size for token in tokens], dtype=np.intp),
+                np.array([-1 if token.owner_id is None else token.owner_id for token in tokens], dtype=np.int64),
+            )
+            self._arrays_version = self.battle_map.version
+        return self._arrays
+
+    def _seen(self, user_id: int, xs: np.ndarray, ys: np.ndarray, sizes: np.ndarray, owners: np.ndarray) -> np.ndarray:
+        """Какие из фишек (в клетках xs, ys) игрок видит: свои или хотя бы одна клетка в маске"""
+        mask = self._user_mask(user_id)
+        seen = owners == user_id
+        for dx in range(MAX_TOKEN_SIZE):
+            for dy in range(MAX_TOKEN_SIZE):
+                inside = (dx < sizes) & (dy < sizes)
+                if not inside.any():
+                    continue
+                cx = np.minimum(xs + dx, self.width - 1)
+                cy = np.minimum(ys + dy, self.height - 1)
+                seen |= inside & mask[cy, cx]
+        return seen
+
+    def visible_tokens(self, user_id: int) -> Set[str]:
+        """ID фишек, которые видит игрок"""
+        ids, _, xs, ys, sizes, owners = self._token_arrays()
+        return {ids[i] for i in np.flatnonzero(self._seen(user_id, xs, ys, sizes, owners))}
+
+    def tokens(self, viewers: Dict[str, int], reset: Iterable[str] = ()) -> Dict[str, Tuple[Set[str], Set[str]]]:
+        """
+        Фишки, показанные подключениям игроков, после изменения карты
+
+        Args:
+            viewers: sid -> ID пользователя
+            reset: sid, которым карта показывается заново (им ничего не показано)
+
+        Returns:
+            Dict: sid -> (фишки, показанные до этого, фишки, видимые сейчас);
+                  видимые запоминаются как показанные
+        """
+        reset = set(reset)
+        visible: Dict[int, Set[str]] = {}
+        result = {}
+        for sid, user_id in viewers.items():
+            if user_id not in visible:
+                visible[user_id] = self.visible_tokens(user_id)
+            shown = set() if sid in reset else self._shown.get(sid, set())
+            result[sid] = (shown, visible[user_id])
+            self._shown[sid] = visible[user_id]
+        return result
+
+    def shown(self, sid: str) -> Set[str]:
+        """Фишки, которые подключение уже получило"""
+        return self._shown.get(sid, set())
+
+    def moves(self, viewers: Dict[str, int], moves: List[dict]) -> Dict[str, List[dict]]:
+        """
+        Промежуточные положения фишек, которые видит каждый игрок
+
+        Положение уходит игроку, если фишка ему уже показана и в новой клетке
+        он ее видит (или это его фишка).
+
+        Returns:
+            Dict: sid -> положения (только непустые)
+        """
+        _, index, _, _, sizes, owners = self._token_arrays()
+        known = [(move, index[move["id"]]) for move in moves if move["id"] in index]
+        if not known:
+            return {}
+        rows = np.array([i for _, i in known], dtype=np.intp)
+        xs = np.array([move["x"] for move, _ in known], dtype=np.intp)
+        ys = np.array([move["y"] for move, _ in known], dtype=np.intp)
+
+        result = {}
+        for sid, user_id in viewers.items():
+            shown = self.shown(sid)
+            seen = self._seen(user_id, xs, ys, sizes[rows], owners[rows])
+            visible = [move for (move, _), ok in zip(known, seen) if ok and move["id"] in shown]
+            if visible:
+                result[sid] = visible
+        return result
+
+    def _full(self, sid: str, packed: np.ndarray) -> dict:
+        version = self._sent[sid][0] + 1 if sid in self._sent else 1
+        self._sent[sid] = (version, packed)
+        return {"version": version, "width": self.width, "height": self.height,
+                "full": base64.b64encode(packed.tobytes()).decode()}
+
+    def _delta(self, sid: str, packed: np.ndarray) -> Optional[dict]:
+        version, previous = self._sent[sid]
+        xor = previous ^ packed
+        changed = np.flatnonzero(xor)
+        if not len(changed):
+            return None
+        # Соседние изменившиеся байты (с промежутком до _RUN_GAP) - один отрезок
+        breaks = np.flatnonzero(np.diff(changed) > _RUN_GAP)
+        starts = np.concatenate(([changed[0]], changed[breaks + 1]))
+        ends = np.concatenate((changed[breaks], [changed[-1]])) + 1
+        runs = [[int(start), base64.b64encode(xor[start:end].tobytes()).decode()] for start, end in zip(starts, ends)]
+        self._sent[sid] = (version + 1, packed)
+        return {"version": version + 1, "base": version, "runs": runs}
+
+    def update(self, viewers: Dict[str, int], full: Iterable[str] = ()) -> Dict[str, dict]:
+        """
+        Видимость для подключений игроков
+
+        Args:
+            viewers: sid -> ID пользователя (подключения игроков в комнате, без мастера)
+            full: sid, которым нужна маска целиком (только что вошли или пропустили version)
+
+        Returns:
+            Dict: sid -> данные события 'visibility' (только подключениям, у которых она изменилась)
+        """
+        affected = self.refresh()
+        for user_id in affected:
+            self._masks.pop(user_id, None)
+        full = set(full)
+        for sent in (self._sent, self._shown):
+            for sid in [sid for sid in sent if sid not in viewers]:
+                del sent[sid]
+
+        masks: Dict[int, np.ndarray] = {}
+        result = {}
+        for sid, user_id in viewers.items():
+            if sid in self._sent and sid not in full and user_id not in affected:
+                continue
+            if user_id not in masks:
+                masks[user_id] = np.packbits(self._user_mask(user_id))
+            if sid in self._sent and sid not in full:
+                payload = self._delta(sid, masks[user_id])
+            else:
+                payload = self._full(sid, masks[user_id])
+            if payload is not None:
+                result[sid] = payload
+        return result
+
+
+class VisibilityTracker:
+    """Видимость по комнатам (для подключений этого воркера)"""
+
+    def __init__(self):
+        self._rooms: Dict[str, RoomVisibility] = {}
+        self.updates = 0
+
+    def update(self, room_id: str, battle_map: Optional[BattleMap], viewers: Dict[str, int], full: Iterable[str] = ()) -> Dict[str, dict]:
+        """
+        Видимость после изменения карты комнаты
+
+        Returns:
+            Dict: sid -> данные события 'visibility' с room_id
+        """
+        if battle_map is None or not battle_map.fog:
+            self._rooms.pop(room_id, None)
+            return {}
+        room = self._rooms.get(room_id)
+        if room is None or room.battle_map is not battle_map:
+            # Новая карта (или полученная с другого воркера) - считаем заново
+            room = self._rooms[room_id] = RoomVisibility(battle_map)
+        self.updates += 1
+        return {sid: {"room_id": room_id, **payload} for sid, payload in room.update(viewers, full).items()}
+
+    def tokens(self, room_id: str, viewers: Dict[str, int], reset: Iterable[str] = ()) -> Dict[str, Tuple[Set[str], Set[str]]]:
+        """Показанные и видимые фишки подключений (после update), см. RoomVisibility.tokens"""
+        room = self._rooms.get(room_id)
+        return room.tokens(viewers, reset) if room is not None else {}
+
+    def shown(self, room_id: str, sid: str) -> Set[str]:
+        """Фишки, которые подключение уже получило"""
+        room = self._rooms.get(room_id)
+        return room.shown(sid) if room is not None else set()
+
+    def moves(self, room_id: str, viewers: Dict[str, int], moves: List[dict]) -> Dict[str, List[dict]]:
+        """Промежуточные положения, которые видят игроки (без видимости - никаких)"""
+        room = self._rooms.get(room_id)
+        return room.moves(viewers, moves) if room is not None else {}
+
+    def drop(self, room_id: str):
+        """Забыть видимость удаленной комнаты"""
+        self._rooms.pop(room_id, None)
+
+    def metrics(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "updates": self.updates,
+            "fields_recomputed": sum(room.recomputed for room in self._rooms.values()),
+        }
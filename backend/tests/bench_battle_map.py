@@ -0,0 +1,79 @@
+"""
+Бенчмарк: боевая карта 200x200 клеток с 1000 фишек
+
+Сравнивает запросы через пространственный индекс BattleMap с перебором
+всех фишек (как было бы при хранении фишек простым списком).
+
+Запуск из папки backend:
+    python -m tests.bench_battle_map
+"""
+import random
+import time
+
+from app.battle_map import BattleMap
+
+SIZE = 200
+TOKENS = 1000
+QUERIES = 10_000
+MOVES = 50_000
+
+
+def _report(name: str, operations: int, seconds: float):
+    print(f"{name:<44} {operations / seconds:>12,.0f} оп/с  ({seconds * 1000:.1f} мс)")
+
+
+def _fill(rng: random.Random) -> BattleMap:
+    battle_map = BattleMap(SIZE, SIZE)
+    while len(battle_map) < TOKENS:
+        size = rng.choice((1, 1, 1, 1, 2, 3))
+        x, y = rng.randrange(SIZE - size + 1), rng.randrange(SIZE - size + 1)
+        if battle_map.is_free(x, y, size):
+            battle_map.place(f"Фишка {len(battle_map)}", x, y, size)
+    return battle_map
+
+
+def main():
+    rng = random.Random(42)
+    battle_map = _fill(rng)
+    tokens = list(battle_map.tokens())
+    points = [(rng.randrange(SIZE), rng.randrange(SIZE)) for _ in range(QUERIES)]
+    print(f"Карта {SIZE}x{SIZE}, {TOKENS} фишек, {QUERIES} запросов\n")
+
+    started = time.perf_counter()
+    linear = [[token.id for token in tokens if token.distance(x, y) <= 6] for x, y in points]
+    _report("в пределах 30 футов, перебор", QUERIES, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    indexed = [battle_map.tokens_within(x, y, 30) for x, y in points]
+    _report("в пределах 30 футов, индекс", QUERIES, time.perf_counter() - started)
+    assert [sorted(ids) for ids in linear] == [sorted(ids) for ids in indexed]
+
+    started = time.perf_counter()
+    for x, y in points:
+        [token for token in tokens if token.x <= x < token.x + token.size and token.y <= y < token.y + token.size]
+    _report("столкновение (клетка занята), перебор", QUERIES, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for x, y in points:
+        battle_map.is_free(x, y)
+    _report("столкновение (клетка занята), индекс", QUERIES, time.perf_counter() - started)
+
+    for shape, feet in (("sphere", 20), ("cube", 15), ("cone", 60), ("line", 120)):
+        started = time.perf_counter()
+        for x, y in points:
+            battle_map.area(shape, x, y, feet, direction=rng.randrange(360))
+        _report(f"область {shape} {feet} футов", QUERIES, time.perf_counter() - started)
+
+    moved = 0
+    started = time.perf_counter()
+    for _ in range(MOVES):
+        token = rng.choice(tokens)
+        x, y = token.x + rng.randint(-1, 1), token.y + rng.randint(-1, 1)
+        if battle_map.is_free(x, y, token.size, ignore=token.id):
+            battle_map.move(token.id, x, y)
+            moved += 1
+    _report(f"перемещение на клетку ({moved} успешных)", MOVES, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
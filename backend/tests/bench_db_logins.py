@@ -0,0 +1,115 @@
+"""
+Бенчмарк: пропускная способность входов при разных настройках SQLite
+
+Сравнивает настройки по умолчанию (journal_mode=DELETE, synchronous=FULL)
+с профилем из app/config.py (WAL, synchronous=NORMAL, mmap, cache, busy_timeout).
+Потоки выполняют запрос входа (login_lookup_query: username или email
+за одно обращение к БД), параллельно один поток регистрирует новых пользователей.
+bcrypt в замер не входит - он выполняется в пуле процессов (app/hashing.py).
+
+Запуск из папки backend:
+    python -m tests.bench_db_logins
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import OperationalError
+
+from app.bd import Base, User, build_engine
+from app.config import load_database_settings
+from app.crud import login_lookup_query
+
+USERS = 2000
+THREADS = 8
+DURATION = 3.0
+DUMMY_HASH = "$2b$12$" + "x" * 53
+
+
+def _prepare(settings):
+    """Создание базы и тестовых пользователей"""
+    engine = build_engine(settings)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all([
+            User(username=f"user{i}", email=f"user{i}@example.com", hashed_password=DUMMY_HASH)
+            for i in range(USERS)
+        ])
+        db.commit()
+    return engine, Session
+
+
+def _run(name, settings):
+    """Замер входов в секунду для одного профиля"""
+    engine, Session = _prepare(settings)
+    stop = threading.Event()
+    errors = [0]
+    writes = [0]
+
+    def writer():
+        i = USERS
+        while not stop.is_set():
+            try:
+                with Session() as db:
+                    db.add(User(username=f"user{i}", email=f"user{i}@example.com", hashed_password=DUMMY_HASH))
+                    db.commit()
+                writes[0] += 1
+            except OperationalError:
+                errors[0] += 1
+            i += 1
+
+    def login_worker():
+        done = 0
+        while not stop.is_set():
+            login = f"user{random.randrange(USERS)}@example.com"
+            try:
+                with Session() as db:
+                    user = db.execute(login_lookup_query(login)).first()
+                    assert user is not None
+            except OperationalError:
+                errors[0] += 1
+                continue
+            done += 1
+        return done
+
+    with ThreadPoolExecutor(max_workers=THREADS + 1) as pool:
+        pool.submit(writer)
+        futures = [pool.submit(login_worker) for _ in range(THREADS)]
+        time.sleep(DURATION)
+        stop.set()
+        total = sum(f.result() for f in futures)
+
+    engine.dispose()
+    print(
+        f"{name:<10} {total / DURATION:>8.0f} входов/с "
+        f"{writes[0] / DURATION:>8.0f} регистраций/с   ошибок блокировки: {errors[0]}"
+    )
+
+
+def main():
+    tuned = replace(load_database_settings(), echo=False)
+    baseline = replace(
+        tuned,
+        sqlite_journal_mode="DELETE",
+        sqlite_synchronous="FULL",
+        sqlite_mmap_size=0,
+        sqlite_cache_size=0,
+        sqlite_busy_timeout=0,
+    )
+
+    print(f"🧪 {THREADS} потоков входа + 1 поток регистрации, {DURATION:.0f} с на профиль")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, settings in (("default", baseline), ("tuned", tuned)):
+            path = os.path.join(tmp, f"{name}.db")
+            url = f"sqlite:///{path}"
+            _run(name, replace(settings, url=url, async_url=url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Бенчмарк: реестр комнат Socket.IO на 10k комнат и 50k подключений
+
+Сравнивает RoomRegistry с прежней схемой (словари active_users
+и game_rooms, где отключение перебирает все комнаты).
+
+Запуск из папки backend:
+    python -m tests.bench_room_registry
+"""
+import random
+import time
+from typing import Dict, Set
+
+from app.room_registry import RoomRegistry
+
+ROOMS = 10_000
+CONNECTIONS = 50_000
+ROOMS_PER_CONNECTION = 3
+# Прежнее отключение стоит O(всех комнат), поэтому меряем его на выборке
+LEGACY_DISCONNECT_SAMPLE = 500
+
+
+def _plan(seed: int = 42):
+    """Одинаковый набор подключений и комнат для обеих схем"""
+    rng = random.Random(seed)
+    sids = [f"sid{i}" for i in range(CONNECTIONS)]
+    users = {sid: {"id": i % (CONNECTIONS // 2), "username": f"user{i}", "character_name": None} for i, sid in enumerate(sids)}
+    rooms = {sid: rng.sample(range(ROOMS), ROOMS_PER_CONNECTION) for sid in sids}
+    return sids, users, {sid: [f"room{r}" for r in room_ids] for sid, room_ids in rooms.items()}
+
+
+def _report(name: str, operations: int, seconds: float):
+    print(f"{name:<44} {operations / seconds:>12,.0f} оп/с  ({seconds * 1000:.1f} мс)")
+
+
+def bench_legacy(sids, users, rooms):
+    print("Прежняя схема (dict + перебор комнат):")
+    active_users: Dict[str, dict] = {}
+    game_rooms: Dict[str, Set[str]] = {}
+
+    started = time.perf_counter()
+    for sid in sids:
+        active_users[sid] = users[sid]
+        for room_id in rooms[sid]:
+            if room_id not in game_rooms:
+                game_rooms[room_id] = set()
+            game_rooms[room_id].add(sid)
+    _report("  подключение + вход в 3 комнаты", len(sids), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(ROOMS):
+        room_id = f"room{i}"
+        [active_users[s] for s in game_rooms.get(room_id, ()) if s in active_users]
+    _report("  get_online_users(room)", ROOMS, time.perf_counter() - started)
+
+    sample = sids[:LEGACY_DISCONNECT_SAMPLE]
+    started = time.perf_counter()
+    for sid in sample:
+        for room_id, members in game_rooms.items():
+            if sid in members:
+                members.remove(sid)
+        del active_users[sid]
+    _report("  отключение", len(sample), time.perf_counter() - started)
+
+
+def bench_registry(sids, users, rooms):
+    print("RoomRegistry:")
+    registry = RoomRegistry()
+
+    started = time.perf_counter()
+    for sid in sids:
+        registry.connect(sid, users[sid])
+        for room_id in rooms[sid]:
+            registry.join(sid, room_id)
+    _report("  подключение + вход в 3 комнаты", len(sids), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(ROOMS):
+        registry.online_users(f"room{i}")
+    _report("  get_online_users(room), первый вызов", ROOMS, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(ROOMS):
+        registry.online_users(f"room{i}")
+    _report("  get_online_users(room), из кеша", ROOMS, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(ROOMS):
+        registry.member_count(f"room{i}")
+    _report("  member_count", ROOMS, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for sid in sids:
+        registry.disconnect(sid)
+    _report("  отключение", len(sids), time.perf_counter() - started)
+    assert len(registry) == 0 and registry.metrics()["rooms"] == 0
+
+
+def main():
+    print(f"{ROOMS} комнат, {CONNECTIONS} подключений, по {ROOMS_PER_CONNECTION} комнаты на подключение\n")
+    sids, users, rooms = _plan()
+    bench_legacy(sids, users, rooms)
+    print()
+    bench_registry(sids, users, rooms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Бенчмарк: кодирование пакетов Socket.IO в JSON и MessagePack
+
+Для каждого типа события сравнивает время кодирования и разбора пакета
+и размер кадра WebSocket (для JSON к пакету добавляется префикс
+Engine.IO '4', бинарный кадр MessagePack уходит как есть).
+
+Запуск из папки backend:
+    python -m tests.bench_socketio_serializer
+"""
+import time
+from datetime import datetime
+
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+from app.dice import roll_dice
+
+ITERATIONS = 20_000
+
+
+def _user(i: int) -> dict:
+    return {"id": i, "username": f"player{i}", "character_name": f"Персонаж {i}"}
+
+
+def _chat(i: int) -> dict:
+    return {
+        "username": f"player{i}",
+        "character_name": f"Персонаж {i}",
+        "message": "Открываю дверь и осматриваю комнату",
+        "timestamp": datetime(2025, 1, 1, 12, 0, i % 60).isoformat(),
+    }
+
+
+def _dice() -> dict:
+    result = roll_dice("4d6kh3+1d8+2")
+    return {
+        "username": "player1",
+        "character_name": "Персонаж 1",
+        "dice_type": result["expression"],
+        "result": result["total"],
+        "rolls": result["terms"],
+        "timestamp": datetime(2025, 1, 1, 12, 0, 0).isoformat(),
+    }
+
+
+# Типичные события приложения: (имя события, данные)
+EVENTS = {
+    "chat_message": ("chat_message", _chat(1)),
+    "dice_rolled": ("dice_rolled", _dice()),
+    "presence (20 игроков)": ("presence", {
+        "room_id": "room1",
+        "added": [_user(i) for i in range(20)],
+        "removed": [100, 101],
+        "count": 20,
+        "version": 12345,
+        "epoch": "3f2a9c1b7d4e",
+    }),
+    "events (пакет из 20)": ("events", [{"event": "chat_message", "data": _chat(i)} for i in range(20)]),
+    "join_room ack (история 100)": (None, {
+        "success": True,
+        "room_id": "room1",
+        "members_count": 5,
+        "history": [{"event": "chat_message", "data": _chat(i)} for i in range(100)],
+    }),
+}
+
+
+def _packet(packet_class, event, data):
+    if event is None:
+        return packet_class(packet.ACK, data=[data], namespace="/", id=1)
+    return packet_class(packet.EVENT, data=[event, data], namespace="/")
+
+
+def _frame_size(encoded) -> int:
+    if isinstance(encoded, bytes):
+        return len(encoded)
+    return 1 + len(encoded.encode())
+
+
+def _measure(packet_class, event, data):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        encoded = _packet(packet_class, event, data).encode()
+    encode_us = (time.perf_counter() - started) / ITERATIONS * 1e6
+
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        packet_class(encoded_packet=encoded)
+    decode_us = (time.perf_counter() - started) / ITERATIONS * 1e6
+    return encode_us, decode_us, _frame_size(encoded)
+
+
+def main():
+    print(f"{'событие':<30} {'формат':<8} {'кодир., мкс':>12} {'разбор, мкс':>12} {'байт':>8}")
+    for name, (event, data) in EVENTS.items():
+        json_size = None
+        for label, packet_class in (("json", packet.Packet), ("msgpack", MsgPackPacket)):
+            encode_us, decode_us, size = _measure(packet_class, event, data)
+            line = f"{name:<30} {label:<8} {encode_us:>12.1f} {decode_us:>12.1f} {size:>8}"
+            if json_size is None:
+                json_size = size
+            else:
+                line += f"  ({size / json_size:.0%} от json)"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Бенчмарк: запросов в секунду для GET /api/users/me и GET /api/users/
+
+Запросы идут через ASGI-транспорт httpx прямо в приложение (без сети),
+поэтому замер показывает стоимость обработки и сериализации на стороне сервера.
+
+Запуск из папки backend (нужна отдельная база):
+    DATABASE_URL=sqlite:////tmp/bench.db DB_ECHO=0 python -m tests.bench_users_me
+"""
+import asyncio
+import random
+import time
+
+import httpx
+
+from app.main import app
+from app.bd import init_db
+
+REQUESTS = 3000
+CONCURRENCY = 16
+
+
+async def _measure(client: httpx.AsyncClient, url: str, headers: dict) -> float:
+    """Запросов в секунду для одного URL"""
+    queue = iter(range(REQUESTS))
+
+    async def worker():
+        for _ in queue:
+            response = await client.get(url, headers=headers)
+            assert response.status_code == 200, response.text
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return REQUESTS / (time.perf_counter() - started)
+
+
+async def main():
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        n = random.randint(1, 10 ** 9)
+        response = await client.post("/api/users/register", json={
+            "username": f"bench{n}",
+            "email": f"bench{n}@example.com",
+            "password": "BenchPass123",
+            "confirm_password": "BenchPass123",
+            "character_name": "Бенчмарк"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        # Прогрев
+        for _ in range(100):
+            await client.get("/api/users/me", headers=headers)
+
+        for url in ("/api/users/me", "/api/users/?limit=100"):
+            rps = await _measure(client, url, headers)
+            print(f"{url:<24} {rps:>8.0f} запросов/с")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Бенчмарк: туман войны на карте 100x100 с 20 источниками зрения
+
+Меряет пересчет видимости на каждый такт движения (одна фишка сдвинулась
+и все 20 сдвинулись) и размер отправляемых изменений маски по сравнению
+с маской целиком. Для сравнения - поле зрения одной фишки без numpy
+(луч к каждой клетке круга по клеткам).
+
+Запуск из папки backend:
+    python -m tests.bench_visibility
+"""
+import json
+import math
+import random
+import time
+
+from app.battle_map import BattleMap
+from app.visibility import RoomVisibility
+
+SIZE = 100
+TOKENS = 20
+PLAYERS = 5
+VISION = 60
+TICKS = 1000
+
+
+def _report(name: str, operations: int, seconds: float):
+    print(f"{name:<44} {seconds / operations * 1000:>8.3f} мс  ({operations / seconds:>9,.0f} оп/с)")
+
+
+def _build(rng: random.Random) -> BattleMap:
+    battle_map = BattleMap(SIZE, SIZE)
+    walls = []
+    # Стены комнат: вертикальные и горизонтальные отрезки с проходами
+    for _ in range(60):
+        x, y, length = rng.randrange(SIZE), rng.randrange(SIZE), rng.randint(5, 20)
+        horizontal = rng.random() < 0.5
+        for i in range(length):
+            if i % 7 != 3:
+                walls.append([min(x + i, SIZE - 1), y] if horizontal else [x, min(y + i, SIZE - 1)])
+    battle_map.set_walls(walls)
+    while len(battle_map) < TOKENS:
+        x, y = rng.randrange(SIZE), rng.randrange(SIZE)
+        if battle_map.is_free(x, y):
+            battle_map.place(f"Фишка {len(battle_map)}", x, y, owner_id=len(battle_map) % PLAYERS, vision=VISION)
+    return battle_map
+
+
+def _step(battle_map: BattleMap, token, rng: random.Random):
+    x, y = token.x + rng.randint(-1, 1), token.y + rng.randint(-1, 1)
+    if battle_map.is_free(x, y, ignore=token.id):
+        battle_map.move(token.id, x, y)
+
+
+def _naive_field(battle_map: BattleMap, token) -> int:
+    radius = token.vision // 5
+    visible = 0
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            tx, ty = token.x + dx, token.y + dy
+            if dx * dx + dy * dy > radius * radius or not (0 <= tx < SIZE and 0 <= ty < SIZE):
+                continue
+            steps = max(abs(dx), abs(dy))
+            if all((token.x + math.floor(dx * k / steps + 0.5), token.y + math.floor(dy * k / steps + 0.5)) not in battle_map.walls
+                   for k in range(1, steps)):
+                visible += 1
+    return visible
+
+
+def main():
+    rng = random.Random(42)
+    battle_map = _build(rng)
+    tokens = list(battle_map.tokens())
+    viewers = {f"sid{user}": user for user in range(PLAYERS)}
+    print(f"Карта {SIZE}x{SIZE}, {len(battle_map.walls)} клеток стен, {TOKENS} фишек с зрением {VISION} футов, {PLAYERS} игроков\n")
+
+    started = time.perf_counter()
+    for token in tokens:
+        _naive_field(battle_map, token)
+    _report("поле зрения фишки, без numpy", TOKENS, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(10):
+        RoomVisibility(battle_map).update(viewers)
+    _report("все 20 полей + маски целиком", 10, time.perf_counter() - started)
+
+    room = RoomVisibility(battle_map)
+    full_size = len(json.dumps(room.update(viewers)["sid0"]))
+
+    sent = 0
+    started = time.perf_counter()
+    for _ in range(TICKS):
+        _step(battle_map, rng.choice(tokens), rng)
+        sent += sum(len(json.dumps(payload)) for payload in room.update(viewers).values())
+    _report("такт: сдвинулась 1 фишка", TICKS, time.perf_counter() - started)
+    print(f"{'  в среднем отправлено за такт':<44} {sent / TICKS:>8.0f} байт (маска целиком - {full_size} байт на игрока)")
+
+    sent = 0
+    started = time.perf_counter()
+    for _ in range(TICKS // 10):
+        for token in tokens:
+            _step(battle_map, token, rng)
+        sent += sum(len(json.dumps(payload)) for payload in room.update(viewers).values())
+    _report("такт: сдвинулись все 20 фишек", TICKS // 10, time.perf_counter() - started)
+    print(f"{'  в среднем отправлено за такт':<44} {sent / (TICKS // 10):>8.0f} байт")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Общие фикстуры тестов
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.auth import get_current_active_user
+from app.bd import Base, get_async_db
+from app.crud import bulk_insert_users
+from app.routes_users import router
+
+
+@pytest.fixture
+def make_db(tmp_path):
+    """Фабрика отдельных баз SQLite во временной папке: имя файла -> фабрика сессий"""
+    engines = []
+
+    def make(name: str):
+        engine = create_engine(f"sqlite:///{tmp_path / name}")
+        Base.metadata.create_all(engine)
+        engines.append(engine)
+        return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def users(make_db, tmp_path):
+    """Клиент API пользователей над временной базой (user0..user6) и фабрика ее сессий"""
+    session_factory = make_db("users.db")
+    db = session_factory()
+    bulk_insert_users(db, [
+        {"username": f"user{i}", "email": f"user{i}@ex.com", "hashed_password": "x"} for i in range(7)
+    ])
+    db.close()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}", poolclass=NullPool)
+    async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def get_db():
+        async with async_session() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_async_db] = get_db
+    app.dependency_overrides[get_current_active_user] = lambda: None
+    with TestClient(app) as client:
+        yield client, session_factory
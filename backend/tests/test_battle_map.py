@@ -0,0 +1,74 @@
+"""
+Тесты боевой карты
+"""
+import pytest
+
+from app.battle_map import BattleMap, BattleMaps, MapError
+
+
+def test_collisions_distance_and_areas():
+    """Фишки не накладываются, расстояние по правилам 5e, области задевают большие фишки краем"""
+    battle_map = BattleMap(40, 40)
+    ogre = battle_map.place("Огр", 10, 10, size=2)
+    battle_map.place("Воин", 16, 10)
+    battle_map.place("Лучник", 10, 30)
+
+    with pytest.raises(MapError):
+        battle_map.place("Гоблин", 11, 11)
+    with pytest.raises(MapError):
+        battle_map.move(ogre.id, 39, 0)  # 2x2 не помещается у края
+    assert battle_map.is_free(11, 11, ignore=ogre.id)
+
+    # От (17, 16) до Огра (10..11, 10..11): по диагонали 6 клеток = 30 футов
+    assert sorted(battle_map.tokens_within(17, 16, 30)) == ["t1", "t2"]
+    assert battle_map.tokens_within(17, 17, 30) == ["t1"]
+    assert battle_map.tokens_within(18, 18, 30) == []
+
+    assert battle_map.area("cube", 11, 11, 5) == ["t1"]
+    assert battle_map.area("line", 10, 25, 30, direction=90) == ["t3"]
+    assert battle_map.area("cone", 13, 10, 15, direction=0) == ["t2"]
+    assert sorted(battle_map.area("sphere", 13, 10, 15)) == ["t1", "t2"]
+
+    battle_map.move(ogre.id, 12, 12)
+    battle_map.place("Гоблин", 10, 10)
+    assert battle_map.tokens_within(0, 0, 5) == []
+
+
+def test_commands_check_permissions_and_restore():
+    """Игрок двигает только свои фишки, состояние переносится на другой воркер"""
+    maps = BattleMaps()
+    with pytest.raises(MapError):
+        maps.execute("r1", "create", {"actor": 2, "width": 20, "height": 20})
+    event, payload = maps.execute("r1", "create", {"actor": 1, "dm": True, "width": 20, "height": 20})
+    assert event == "map_state" and payload["tokens"] == []
+
+    _, placed = maps.execute("r1", "place", {"actor": 2, "name": "Паладин", "x": 3, "y": 3, "owner_id": 1})
+    assert placed["token"]["owner_id"] == 2
+    maps.execute("r1", "place", {"actor": 1, "dm": True, "name": "Дракон", "x": 8, "y": 8, "size": 4})
+
+    event, moved = maps.execute("r1", "move", {"actor": 2, "id": "t1", "x": 4, "y": 3})
+    assert event == "token_moved" and (moved["x"], moved["y"]) == (4, 3)
+    with pytest.raises(MapError):
+        maps.execute("r1", "move", {"actor": 2, "id": "t2", "x": 0, "y": 0})
+    with pytest.raises(MapError):
+        maps.execute("r1", "move", {"actor": 1, "dm": True, "id": ["t1"], "x": 0, "y": 0})
+
+    other = BattleMaps()
+    assert other.load("r1", maps.states()["r1"])
+    assert not other.load("r1", maps.states()["r1"])
+    assert other.snapshot("r1") == maps.snapshot("r1")
+    assert other.execute("r1", "place", {"actor": 3, "name": "Вор", "x": 0, "y": 0})[1]["token"]["id"] == "t3"
+
+
+def test_huge_queries_are_clipped_to_the_map():
+    """Огромный радиус или точка далеко за картой не перебирают корзины за ее краем"""
+    battle_map = BattleMap(50, 50)
+    battle_map.place("Воин", 10, 10)
+    battle_map.place("Огр", 48, 48, size=2)
+
+    assert sorted(battle_map.tokens_within(1, 1, 1e9)) == ["t1", "t2"]
+    assert sorted(battle_map.area("sphere", 1, 1, 10 ** 12)) == ["t1", "t2"]
+    assert battle_map.area("line", 0, 10, 1e9, direction=0) == ["t1"]
+    assert battle_map.tokens_within(10 ** 9, 10 ** 9, 30) == []
+    with pytest.raises(MapError):
+        battle_map.tokens_within(1, 1, float("inf"))
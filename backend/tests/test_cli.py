@@ -0,0 +1,79 @@
+"""
+Тесты импорта и экспорта пользователей (app.cli)
+"""
+import io
+
+import orjson
+from sqlalchemy import select
+
+from app import cli
+from app.bd import User
+from app.crud import bulk_insert_users
+from app.hashing import BCRYPT_MIN_ROUNDS, check_password, hash_password
+
+
+def _users(session_factory) -> list:
+    db = session_factory()
+    try:
+        return [tuple(row) for row in db.execute(select(User.username, User.email, User.character_name, User.is_active, User.hashed_password).order_by(User.id))]
+    finally:
+        db.close()
+
+
+def test_csv_round_trip_with_hashes(make_db, monkeypatch):
+    """Экспорт с хешами в CSV и импорт в другую базу дают тех же пользователей"""
+    source, target = make_db("source.db"), make_db("target.db")
+    hashed = hash_password("Passw0rdX", rounds=BCRYPT_MIN_ROUNDS)
+    db = source()
+    bulk_insert_users(db, [
+        {"username": f"user{i}", "email": f"user{i}@ex.com", "hashed_password": hashed,
+         "character_name": "Эльф, лучник" if i % 2 else None, "is_active": i != 3}
+        for i in range(7)
+    ])
+    db.close()
+
+    output = io.StringIO()
+    monkeypatch.setattr(cli, "SessionLocal", source)
+    assert cli.export_users(output, "csv", batch_size=3, with_hashes=True) == 7
+
+    monkeypatch.setattr(cli, "SessionLocal", target)
+    output.seek(0)
+    assert cli.import_users(output, "csv", batch_size=3, workers=1, rounds=BCRYPT_MIN_ROUNDS, skip_existing=False) == 7
+    assert _users(target) == _users(source)
+
+
+def test_skip_existing_across_batch_boundary(make_db, monkeypatch):
+    """Логин из предыдущей, еще не вставленной пачки считается занятым"""
+    target = make_db("target.db")
+    monkeypatch.setattr(cli, "SessionLocal", target)
+    hashed = hash_password("Passw0rdX", rounds=BCRYPT_MIN_ROUNDS)
+    records = [
+        {"username": "a", "email": "a@ex.com", "hashed_password": hashed},
+        {"username": "b", "email": "b@ex.com", "hashed_password": hashed},
+        # Следующая пачка: повтор username из первой и новый пользователь с паролем
+        {"username": "a", "email": "other@ex.com", "password": "Другой1пароль"},
+        {"username": "c", "email": "c@ex.com", "password": "Passw0rdC"},
+        # Третья пачка: повтор email из второй
+        {"username": "d", "email": "c@ex.com", "hashed_password": hashed},
+        {"username": "e", "email": "e@ex.com", "hashed_password": hashed},
+        # Четвертая: повтор внутри пачки
+        {"username": "f", "email": "f@ex.com", "hashed_password": hashed},
+        {"username": "f", "email": "f2@ex.com", "hashed_password": hashed},
+    ]
+    stream = io.StringIO("".join(orjson.dumps(record).decode() + "\n" for record in records))
+    # Повторы отбрасываются до хеширования и вставки, а не оставляются на OR IGNORE
+    sent = []
+
+    def insert(db, rows, skip_existing=False):
+        sent.extend(rows)
+        return bulk_insert_users(db, rows, skip_existing=skip_existing)
+
+    monkeypatch.setattr(cli, "bulk_insert_users", insert)
+
+    assert cli.import_users(stream, "ndjson", batch_size=2, workers=1, rounds=BCRYPT_MIN_ROUNDS, skip_existing=True) == 5
+    assert len(sent) == 5
+    users = _users(target)
+    assert [(username, email) for username, email, *_ in users] == [
+        ("a", "a@ex.com"), ("b", "b@ex.com"), ("c", "c@ex.com"), ("e", "e@ex.com"), ("f", "f@ex.com"),
+    ]
+    assert check_password("Passw0rdC", users[2][4])
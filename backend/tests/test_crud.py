@@ -0,0 +1,43 @@
+"""
+Тесты входа по username или email (app.crud)
+"""
+import pytest
+
+from app import crud
+from app.hashing import BCRYPT_MIN_ROUNDS, dummy_hash, get_rounds, hash_password, set_rounds
+
+
+@pytest.fixture
+def db(make_db):
+    """База с двумя пользователями; username второго совпадает с email первого"""
+    previous = get_rounds()
+    set_rounds(BCRYPT_MIN_ROUNDS)
+    session = make_db("users.db")()
+    crud.bulk_insert_users(session, [
+        {"username": "wizard", "email": "wizard@dnd.com", "hashed_password": hash_password("MagicPass123")},
+        {"username": "wizard@dnd.com", "email": "other@dnd.com", "hashed_password": hash_password("OtherPass123")},
+    ])
+    yield session
+    session.close()
+    set_rounds(previous)
+
+
+def test_login_by_username_or_email(db):
+    """Вход по email работает, совпадение по username важнее совпадения по email"""
+    assert crud.authenticate_user(db, "wizard", "MagicPass123").username == "wizard"
+    assert crud.authenticate_user(db, "other@dnd.com", "OtherPass123").username == "wizard@dnd.com"
+    # "wizard@dnd.com" - username второго пользователя и email первого
+    assert crud.authenticate_user(db, "wizard@dnd.com", "OtherPass123").username == "wizard@dnd.com"
+    assert crud.authenticate_user(db, "wizard@dnd.com", "MagicPass123") is None
+
+
+def test_unknown_user_checks_dummy_hash(db, monkeypatch):
+    """Для неизвестного логина пароль все равно проверяется (по хешу-заглушке)"""
+    checked = []
+    verify = crud.verify_password
+    monkeypatch.setattr(crud, "verify_password", lambda password, hashed: checked.append(hashed) or verify(password, hashed))
+
+    assert crud.authenticate_user(db, "nobody", "MagicPass123") is None
+    assert checked == [dummy_hash()]
+    assert crud.authenticate_user(db, "wizard", "wrong-password") is None
+    assert len(checked) == 2 and checked[1] != dummy_hash()
@@ -0,0 +1,47 @@
+"""
+Тесты разбора и бросков кубиков
+"""
+import numpy as np
+import pytest
+
+from app.dice import ConstTerm, DiceError, DiceTerm, parse_dice
+
+
+def test_parse_notation():
+    """Запись разбирается в группы кубиков и константы"""
+    expression = parse_dice("4d6kh3 + 1d4 - 2")
+    assert expression.terms == (
+        DiceTerm(1, 4, 6, ("h", 3)),
+        DiceTerm(1, 1, 4),
+        ConstTerm(-1, 2),
+    )
+    assert parse_dice("2d20kl1").terms == (DiceTerm(1, 2, 20, ("l", 1)),)
+    assert parse_dice("4d6dl1").terms == (DiceTerm(1, 4, 6, ("h", 3)),)
+    assert parse_dice("8d6!").terms == (DiceTerm(1, 8, 6, None, True),)
+    assert parse_dice("D%").terms == (DiceTerm(1, 1, 100),)
+    assert parse_dice("4d6kh3+2") is parse_dice("4D6KH3+2")
+
+
+@pytest.mark.parametrize("expression", ["", "2d6+", "abc", "d0", "1001d6", "4d6kh5", "d1!", "3 4"])
+def test_invalid_notation(expression):
+    with pytest.raises(DiceError):
+        parse_dice(expression)
+
+
+def test_roll_keeps_and_totals():
+    """Итог считается только по оставленным кубикам"""
+    rng = np.random.default_rng(1)
+    roll = parse_dice("4d6kh3+2").roll(rng)
+    dice = roll["terms"][0]
+    assert sum(dice["kept"]) == 3
+    kept = [value for value, keep in zip(dice["rolls"], dice["kept"]) if keep]
+    assert sorted(kept) == sorted(dice["rolls"])[1:]
+    assert roll["total"] == sum(kept) + 2
+
+    totals = parse_dice("2d20kl1").roll_totals(10_000, rng)
+    assert totals.min() >= 1 and totals.max() <= 20
+    # Помеха: среднее заметно ниже 10.5
+    assert totals.mean() < 9
+
+    exploded = parse_dice("8d6!").roll_totals(10_000, rng)
+    assert exploded.min() >= 8 and exploded.max() > 48
@@ -0,0 +1,67 @@
+"""
+Тесты пакетной отправки событий Socket.IO
+"""
+import asyncio
+
+from app.event_batcher import EventBatcher, BATCH_EVENT
+
+
+def test_flush_by_interval():
+    """События комнаты уходят одним пакетом в порядке отправки"""
+    sent = []
+
+    async def emit(event, data, room_id):
+        sent.append((event, data, room_id))
+
+    async def scenario():
+        batcher = EventBatcher(emit, interval_ms=10, max_events=100)
+        await batcher.add("r1", "chat_message", {"message": "1"})
+        await batcher.add("r1", "user_joined_room", {"username": "a"})
+        await batcher.add("r1", "chat_message", {"message": "2"})
+        await batcher.add("r2", "chat_message", {"message": "3"})
+        assert sent == []
+        await asyncio.sleep(0.05)
+        return batcher
+
+    batcher = asyncio.run(scenario())
+
+    by_room = {room_id: data for event, data, room_id in sent if event == BATCH_EVENT}
+    assert [entry["event"] for entry in by_room["r1"]] == ["chat_message", "user_joined_room", "chat_message"]
+    assert len(by_room["r2"]) == 1
+    assert batcher.metrics()["events_in"] == 4
+    assert batcher.metrics()["packets_out"] == 2
+
+
+def test_flush_when_queue_is_full():
+    """Полная очередь отправляется сразу, не дожидаясь таймера"""
+    sent = []
+
+    async def emit(event, data, room_id):
+        sent.append(data)
+
+    async def scenario():
+        batcher = EventBatcher(emit, interval_ms=10_000, max_events=3)
+        for i in range(7):
+            await batcher.add("r1", "chat_message", {"message": str(i)})
+        await batcher.flush_all()
+
+    asyncio.run(scenario())
+    assert [len(batch) for batch in sent] == [3, 3, 1]
+
+
+def test_failed_timer_flush_is_logged(caplog):
+    """Ошибка отправки по таймеру не теряется: она в логе и в метриках"""
+    async def emit(event, data, room_id):
+        raise ConnectionError("сокет закрыт")
+
+    async def scenario():
+        batcher = EventBatcher(emit, interval_ms=5)
+        await batcher.add("r1", "chat_message", {"message": "1"})
+        assert len(batcher._tasks) == 0
+        await asyncio.sleep(0.05)
+        assert len(batcher._tasks) == 0
+        return batcher
+
+    batcher = asyncio.run(scenario())
+    assert batcher.metrics()["flush_errors"] == 1
+    assert "отправка пакета событий" in caplog.text
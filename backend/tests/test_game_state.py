@@ -0,0 +1,96 @@
+"""
+Тесты общего состояния игровой комнаты
+"""
+import pytest
+
+from app.game_state import GameStateStore, StatePatchError, touches_only
+
+
+def test_patch_is_applied_atomically():
+    """Изменение с ошибкой не оставляет следов, seq растет только при успехе"""
+    store = GameStateStore()
+    delta = store.apply("r1", [
+        {"op": "add", "path": "/players/5", "value": {"hp": 20, "conditions": []}},
+        {"op": "add", "path": "/players/5/conditions/-", "value": "отравлен"},
+    ])
+    assert delta["seq"] == 1
+
+    before = store.snapshot("r1")["state"]
+    with pytest.raises(StatePatchError):
+        store.apply("r1", [
+            {"op": "replace", "path": "/players/5/hp", "value": 3},
+            {"op": "remove", "path": "/players/5/conditions/0"},
+            {"op": "add", "path": "/players/5/conditions/-", "value": "ослеплен"},
+            {"op": "remove", "path": "/players/7"},
+        ])
+
+    snapshot = store.snapshot("r1")
+    assert snapshot["seq"] == 1
+    assert snapshot["state"] == before == {"players": {"5": {"hp": 20, "conditions": ["отравлен"]}}}
+
+    assert touches_only([{"op": "add", "path": "/players/5", "value": {}}], ["players", "5"])
+    assert not touches_only([{"op": "add", "path": "/players/50", "value": {}}], ["players", "5"])
+
+
+def test_since_returns_patches_or_snapshot():
+    """После seq из журнала - только изменения, после вытесненного или чужого seq - снимок"""
+    store = GameStateStore(log_size=3)
+    for hp in range(5):
+        store.apply("r1", [{"op": "add", "path": "/hp", "value": hp}])
+
+    result = store.since("r1", 3, store.epoch)
+    assert not result["snapshot"]
+    assert [patch["seq"] for patch in result["patches"]] == [4, 5]
+
+    assert store.since("r1", 1, store.epoch)["snapshot"]
+    assert store.since("r1", 4, "другая эпоха")["snapshot"]
+    assert store.since("r1", 5, store.epoch)["patches"] == []
+    assert store.snapshot("r1")["state"]["hp"] == 4
+
+
+def test_reads_do_not_create_and_occupied_rooms_are_kept():
+    """Снимки чужих комнат не вытесняют состояние, комнаты с участниками не вытесняются"""
+    occupied = {"r1"}
+    store = GameStateStore(max_rooms=2, pinned=lambda room_id: room_id in occupied)
+    store.apply("r1", [{"op": "add", "path": "/hp", "value": 7}])
+    for i in range(100):
+        assert store.snapshot(f"мусор{i}")["state"] == {"players": {}}
+        assert store.since(f"мусор{i}", 3, store.epoch)["snapshot"]
+    assert store.metrics()["rooms"] == 1
+
+    store.apply("r2", [{"op": "add", "path": "/hp", "value": 1}])
+    store.apply("r3", [{"op": "add", "path": "/hp", "value": 2}])
+    assert store.snapshot("r1")["state"]["hp"] == 7
+    assert store.snapshot("r2")["seq"] == 0
+
+
+def test_touches_only_rejects_non_list():
+    """Не список операций - ошибка патча, а не TypeError"""
+    with pytest.raises(StatePatchError):
+        touches_only(5, ["players", "1"])
+    assert touches_only([{"op": "add", "path": "/players/1/hp", "value": 3}], ["players", "1"])
+    assert not touches_only([{"op": "add", "path": "/players/2/hp", "value": 3}], ["players", "1"])
+
+
+def test_bad_index_or_value_rolls_back_whole_patch():
+    """Цифры Unicode в индексе и слишком глубокое значение - ошибка патча и полный откат"""
+    store = GameStateStore()
+    store.apply("r1", [{"op": "add", "path": "/list", "value": [1, 2]}])
+
+    with pytest.raises(StatePatchError):
+        store.apply("r1", [
+            {"op": "add", "path": "/players/x", "value": 1},
+            {"op": "replace", "path": "/list/²", "value": 9},
+        ])
+    deep = []
+    for _ in range(100_000):
+        deep = [deep]
+    with pytest.raises(StatePatchError):
+        store.apply("r1", [
+            {"op": "add", "path": "/players/x", "value": 1},
+            {"op": "add", "path": "/deep", "value": deep},
+        ])
+
+    snapshot = store.snapshot("r1")
+    assert snapshot["seq"] == 1
+    assert snapshot["state"] == {"players": {}, "list": [1, 2]}
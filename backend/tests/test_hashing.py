@@ -0,0 +1,73 @@
+"""
+Тесты пула хеширования паролей
+"""
+import asyncio
+
+import pytest
+
+from app.hashing import (
+    HashingExecutor,
+    HashingQueueFull,
+    BCRYPT_MIN_ROUNDS,
+    calibrate_rounds,
+    check_password,
+    get_rounds,
+    hash_password,
+    hash_rounds,
+    needs_rehash,
+)
+
+
+def test_hash_and_verify_in_pool():
+    """Хеш из пула проверяется как синхронно, так и в пуле"""
+    executor = HashingExecutor(workers=1, max_queue=4)
+
+    async def scenario():
+        hashed = await executor.run(hash_password, "Secret123")
+        assert check_password("Secret123", hashed)
+        assert await executor.run(check_password, "Secret123", hashed)
+        assert not await executor.run(check_password, "Wrong123", hashed)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    metrics = executor.metrics()
+    assert metrics["completed"] == 3
+    assert metrics["in_flight"] == 0
+
+
+def test_queue_full_is_rejected():
+    """Задачи сверх лимита очереди отклоняются сразу"""
+    executor = HashingExecutor(workers=1, max_queue=1)
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(executor.run(hash_password, "Secret123")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HashingQueueFull):
+            await executor.run(hash_password, "Secret123")
+        await asyncio.gather(*tasks)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert executor.metrics()["rejected"] == 1
+
+
+def test_rounds_and_rehash():
+    """Перехеширования требует только хеш дешевле текущей стоимости"""
+    current = get_rounds()
+    assert hash_rounds(hash_password("Secret123", rounds=BCRYPT_MIN_ROUNDS)) == BCRYPT_MIN_ROUNDS
+    assert not needs_rehash(f"$2b${current:02d}$" + "x" * 53)
+    assert needs_rehash(f"$2b${current - 1:02d}$" + "x" * 53)
+    assert not needs_rehash(f"$2b${current + 1:02d}$" + "x" * 53)
+    assert needs_rehash("not-a-bcrypt-hash")
+
+
+def test_calibrate_rounds_respects_minimum():
+    """Калибровка не опускается ниже минимальной стоимости"""
+    assert calibrate_rounds(target_ms=0.001) == BCRYPT_MIN_ROUNDS
+    assert calibrate_rounds(target_ms=10_000) > BCRYPT_MIN_ROUNDS
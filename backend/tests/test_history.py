@@ -0,0 +1,70 @@
+"""
+Тесты истории событий комнат
+"""
+import asyncio
+
+from app.history import RoomHistory
+
+
+def _messages(entries):
+    return [entry["data"]["message"] for entry in entries]
+
+
+def test_ring_buffer_and_room_eviction():
+    """Буфер хранит последние события, лишние комнаты вытесняются"""
+    async def scenario():
+        history = RoomHistory(size=3, max_rooms=2)
+        for i in range(5):
+            await history.append("r1", "chat_message", {"message": str(i)})
+        assert _messages(await history.recent("r1")) == ["2", "3", "4"]
+        assert _messages(await history.recent("r1", limit=1)) == ["4"]
+
+        await history.append("r2", "dice_rolled", {"result": 1})
+        await history.append("r3", "dice_rolled", {"result": 2})
+        assert await history.recent("r1") == []
+        # Запрос истории чужой комнаты не создает и не вытесняет буферы
+        assert await history.recent("нет такой") == []
+        assert history.metrics()["rooms"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_restore_from_log(tmp_path):
+    """Вытесненная комната читается из журнала на диске"""
+    async def scenario():
+        history = RoomHistory(size=2, max_rooms=1, log_dir=str(tmp_path))
+        for i in range(4):
+            await history.append("r1", "chat_message", {"message": str(i)})
+        await history.append("r2", "chat_message", {"message": "other"})
+        # r1 уже вытеснена, но журнал поставлен в очередь раньше чтения
+        assert _messages(await history.recent("r1")) == ["2", "3"]
+        history.close()
+
+        restored = RoomHistory(size=2, max_rooms=1, log_dir=str(tmp_path))
+        assert _messages(await restored.recent("r1")) == ["2", "3"]
+        assert _messages(await restored.recent("r2")) == ["other"]
+        assert restored.metrics()["rooms"] == 0
+        restored.close()
+
+    asyncio.run(scenario())
+
+
+def test_event_from_other_worker_is_not_duplicated(tmp_path):
+    """Воркер без комнаты в памяти загружает ее из журнала, где событие уже есть"""
+    async def scenario():
+        origin = RoomHistory(size=5, log_dir=str(tmp_path))
+        other = RoomHistory(size=5, log_dir=str(tmp_path))
+        await origin.append("r1", "chat_message", {"message": "раньше"})
+
+        entry = await origin.append("r1", "chat_message", {"message": "привет"})
+        await origin.log.tail("r1", 1)  # дождаться записи, как будто сообщение кластера пришло позже
+        await other.append("r1", entry["event"], entry["data"], persist=False, event_id=entry["id"])
+        assert _messages(await other.recent("r1")) == ["раньше", "привет"]
+
+        entry = await origin.append("r1", "dice_rolled", {"result": 4})
+        await other.append("r1", entry["event"], entry["data"], persist=False, event_id=entry["id"])
+        assert await other.recent("r1") == await origin.recent("r1")
+        origin.close()
+        other.close()
+
+    asyncio.run(scenario())
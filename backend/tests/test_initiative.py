@@ -0,0 +1,98 @@
+"""
+Тесты трекера инициативы
+"""
+import pytest
+
+from app.initiative import InitiativeError, InitiativeStore, InitiativeTracker
+
+
+def _names(tracker: InitiativeTracker, turns: int):
+    return [tracker.next_turn().name for _ in range(turns)]
+
+
+def test_turn_order_rounds_insert_and_delay():
+    """Порядок по инициативе, новый раунд, вставка посреди раунда и задержка хода"""
+    tracker = InitiativeTracker()
+    tracker.add("Воин", 18)
+    tracker.add("Маг", 15, tiebreak=3)
+    tracker.add("Гоблин", 15, tiebreak=1)
+
+    assert _names(tracker, 2) == ["Воин", "Маг"]
+    assert tracker.round == 1
+
+    # Инициатива 16 уже прошла - новый участник походит в следующем раунде,
+    # 10 еще не прошла - в этом
+    tracker.add("Волк", 16)
+    tracker.add("Орк", 10)
+    assert _names(tracker, 3) == ["Гоблин", "Орк", "Воин"]
+    assert tracker.round == 2
+
+    # Воин задерживает ход до 12: в этом раунде он походит после Гоблина
+    tracker.delay(tracker.current, 12)
+    assert _names(tracker, 4) == ["Волк", "Маг", "Гоблин", "Воин"]
+
+    tracker.remove("c5")  # Орк
+    assert _names(tracker, 2) == ["Волк", "Маг"]
+    assert tracker.round == 3
+
+    with pytest.raises(InitiativeError):
+        tracker.remove("нет такого")
+    for action, args in (("remove", {"id": ["c1"]}), ("effect_remove", {"effect_id": {"e": 1}})):
+        with pytest.raises(InitiativeError):
+            tracker.execute(action, args)
+
+
+def test_effects_expire_and_only_changes_are_reported():
+    """Эффект истекает в ход anchor, в изменениях только затронутые участники"""
+    tracker = InitiativeTracker()
+    for i in range(60):
+        tracker.add(f"Гоблин {i}", 10, combatant_id=f"g{i}")
+    tracker.add("Жрец", 20, combatant_id="cleric")
+    tracker.flush()
+
+    tracker.next_turn()  # ход Жреца
+    tracker.add_effect("g5", "Оглушение", rounds=1, anchor_id="cleric")
+    tracker.add_effect("g7", "Благословение", rounds=2, anchor_id="cleric", at="start")
+    update = tracker.flush()
+    assert sorted(entry["id"] for entry in update["changed"]) == ["g5", "g7"]
+
+    tracker.next_turn()  # конец хода Жреца: оглушение снимается
+    update = tracker.flush()
+    assert [effect["name"] for effect in update["expired"]] == ["Оглушение"]
+    assert [entry["id"] for entry in update["changed"]] == ["g5"]
+    assert update["current"] == "g0"
+
+    _names(tracker, 60)  # начало хода Жреца во втором раунде: благословение 2 -> 1
+    update = tracker.flush()
+    assert update["round"] == 2 and update["current"] == "cleric"
+    assert [entry["effects"][0]["remaining"] for entry in update["changed"]] == [1]
+
+    restored = InitiativeTracker.from_state(tracker.to_state())
+    assert _names(restored, 3) == _names(tracker, 3)
+
+
+def test_version_keeps_growing_after_fight_ends():
+    """Новый бой в комнате продолжает нумерацию version, старое состояние не принимается"""
+    store = InitiativeStore()
+    store.execute("r1", "add", {"name": "Гоблин", "initiative": 10})
+    old_state = store.states()["r1"]
+    ended = store.execute("r1", "end", {})
+    assert "r1" not in store and store.snapshot("r1")["version"] == ended["version"]
+
+    assert not store.load("r1", old_state)
+    assert store.execute("r1", "add", {"name": "Орк", "initiative": 12})["version"] == ended["version"] + 1
+
+    store.execute("r1", "end", {})
+    store.drop("r1")
+    assert store._ended == {} and store.snapshot("r1")["version"] == 0
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf")])
+def test_non_finite_initiative_is_rejected(value):
+    """NaN и бесконечность сломали бы порядок ходов в куче"""
+    store = InitiativeStore()
+    with pytest.raises(InitiativeError):
+        store.execute("r1", "add", {"name": "Гоблин", "initiative": value})
+    with pytest.raises(InitiativeError):
+        store.execute("r1", "add", {"name": "Гоблин", "initiative": 10, "tiebreak": value})
+    assert "r1" not in store
@@ -0,0 +1,46 @@
+"""
+Тесты настройки логирования
+"""
+import logging
+import queue
+
+import orjson
+import pytest
+
+from app.logging_setup import EventFilter, JsonFormatter, NonBlockingQueueHandler, _event_levels
+
+
+def _record(event=None, level=logging.INFO) -> logging.LogRecord:
+    logger = logging.getLogger("test")
+    extra = {"event": event, "room_id": "r1"} if event else None
+    return logger.makeRecord("test", level, __file__, 1, "Сообщение %s", ("1",), None, extra=extra)
+
+
+def test_event_filter_sampling_and_levels():
+    """Записи события прореживаются и отсекаются по уровню, ошибки проходят всегда"""
+    log_filter = EventFilter(sampling={"chat_message": 0.0}, levels={"connect": logging.WARNING})
+    assert not log_filter.filter(_record("chat_message"))
+    assert log_filter.filter(_record("chat_message", logging.ERROR))
+    assert not log_filter.filter(_record("connect"))
+    assert log_filter.filter(_record("connect", logging.WARNING))
+    assert log_filter.filter(_record("dice_roll"))
+    assert log_filter.filter(_record())
+
+
+def test_json_format_and_full_queue():
+    """JSON содержит поля extra, переполненная очередь отбрасывает записи без ошибок"""
+    entry = orjson.loads(JsonFormatter().format(_record("chat_message")))
+    assert entry["message"] == "Сообщение 1"
+    assert entry["event"] == "chat_message" and entry["room_id"] == "r1"
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(_record())
+    handler.handle(_record())
+    assert handler.dropped == 1
+
+
+def test_event_levels_reject_unknown_name():
+    """Неизвестный уровень в LOG_EVENT_LEVELS - ошибка настройки, а не TypeError в фильтре"""
+    assert _event_levels("connect=warning, dice_roll=DEBUG") == {"connect": logging.WARNING, "dice_roll": logging.DEBUG}
+    with pytest.raises(ValueError, match="LOG_EVENT_LEVELS"):
+        _event_levels("connect=LOUD")
@@ -0,0 +1,71 @@
+"""
+Тесты канала перемещения фишек
+"""
+import asyncio
+
+from app.movement import MovementChannel
+
+
+def test_latest_position_per_tick():
+    """Первое положение уходит сразу, дальше - одно событие за такт с последними положениями"""
+    sent = []
+
+    async def emit(event, data, room_id):
+        sent.append((asyncio.get_running_loop().time(), data))
+
+    async def scenario():
+        channel = MovementChannel(emit, rate_hz=20)
+        channel.update("r1", "t1", 0, 0)
+        await asyncio.sleep(0.01)
+        for x in range(1, 30):
+            channel.update("r1", "t1", x, 0)
+            channel.update("r1", "t2", 0, x)
+            await asyncio.sleep(0.002)
+        await asyncio.sleep(0.2)
+        return channel
+
+    channel = asyncio.run(scenario())
+
+    assert sent[0][1] == {"room_id": "r1", "moves": [{"id": "t1", "x": 0, "y": 0}]}
+    assert sent[-1][1]["moves"] == [{"id": "t1", "x": 29, "y": 0}, {"id": "t2", "x": 0, "y": 29}]
+    gaps = [later[0] - earlier[0] for earlier, later in zip(sent, sent[1:])]
+    assert min(gaps) >= 0.045
+    assert channel.metrics()["active_rooms"] == 0
+
+
+def test_settle_drops_pending_position():
+    """Отпущенная фишка не получает устаревшее промежуточное положение"""
+    sent = []
+
+    async def emit(event, data, room_id):
+        sent.append(data["moves"])
+
+    async def scenario():
+        channel = MovementChannel(emit, rate_hz=10)
+        channel.update("r1", "t1", 1, 1)
+        await asyncio.sleep(0.01)
+        channel.update("r1", "t1", 2, 2)
+        channel.update("r1", "t2", 5, 5)
+        await channel.settle("r1", "t1")
+        await asyncio.sleep(0.25)
+
+    asyncio.run(scenario())
+    assert sent == [[{"id": "t1", "x": 1, "y": 1}], [{"id": "t2", "x": 5, "y": 5}]]
+
+
+def test_failed_tick_is_logged(caplog):
+    """Ошибка отправки такта попадает в лог и метрики, канал продолжает работать"""
+    async def emit(event, data, room_id):
+        raise ConnectionError("сокет закрыт")
+
+    async def scenario():
+        channel = MovementChannel(emit, rate_hz=100)
+        channel.update("r1", "t1", 1, 1)
+        await asyncio.sleep(0.05)
+        assert len(channel._tasks) == 0
+        return channel
+
+    channel = asyncio.run(scenario())
+    assert channel.metrics()["tick_errors"] == 1
+    assert channel.metrics()["active_rooms"] == 0
+    assert "отправка положений фишек" in caplog.text
@@ -0,0 +1,72 @@
+"""
+Тесты уведомлений о присутствии в комнатах
+"""
+import asyncio
+
+from app.presence import PresenceNotifier
+from app.room_registry import RoomRegistry
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "username": f"user{user_id}", "character_name": None}
+
+
+def test_burst_is_aggregated_per_room():
+    """Массовый вход дает одно уведомление на комнату, вход+выход сокращаются"""
+    registry = RoomRegistry()
+    sent = []
+
+    async def notify(room_id, payload):
+        sent.append(payload)
+
+    async def scenario():
+        notifier = PresenceNotifier(registry, notify, interval_ms=10)
+        registry.connect("host", _user(0))
+        registry.join("host", "r1")
+        registry.join("host", "r2")
+        await asyncio.sleep(0.03)
+        sent.clear()
+
+        for i in range(1, 1001):
+            registry.connect(f"s{i}", _user(i))
+            registry.join(f"s{i}", "r1")
+        registry.disconnect("s1000")
+        registry.join("s1", "r2")
+        registry.leave("host", "r2")
+        await asyncio.sleep(0.03)
+        return notifier
+
+    notifier = asyncio.run(scenario())
+
+    by_room = {payload["room_id"]: payload for payload in sent}
+    assert len(sent) == 2
+    assert len(by_room["r1"]["added"]) == 999
+    assert by_room["r1"]["removed"] == []
+    assert by_room["r1"]["count"] == 1000
+    assert [user["id"] for user in by_room["r2"]["added"]] == [1]
+    assert by_room["r2"]["removed"] == [0]
+    assert notifier.metrics()["changes_cancelled"] == 1
+
+    # Версия из уведомления подходит для запроса изменений
+    delta = registry.presence_since("r1", by_room["r1"]["version"], by_room["r1"]["epoch"])
+    assert not delta["snapshot"] and delta["added"] == [] and delta["removed"] == []
+
+
+def test_failed_notification_is_logged(caplog):
+    """Ошибка рассылки по таймеру попадает в лог и метрики"""
+    registry = RoomRegistry()
+
+    async def notify(room_id, payload):
+        raise ConnectionError("брокер недоступен")
+
+    async def scenario():
+        notifier = PresenceNotifier(registry, notify, interval_ms=5)
+        registry.connect("s1", _user(1))
+        registry.join("s1", "r1")
+        await asyncio.sleep(0.05)
+        assert len(notifier._tasks) == 0
+        return notifier
+
+    notifier = asyncio.run(scenario())
+    assert notifier.metrics()["notify_errors"] == 1
+    assert "рассылка изменений присутствия" in caplog.text
@@ -0,0 +1,58 @@
+"""
+Тесты ограничителя частоты попыток входа
+"""
+import asyncio
+
+import pytest
+
+from app.rate_limit import InMemoryRateLimitBackend, LoginThrottle, _env_rate
+
+
+def test_bucket_allows_burst_then_refills():
+    """Сначала разрешается запас попыток, затем они восстанавливаются со временем"""
+    backend = InMemoryRateLimitBackend(capacity=3, refill_rate=1.0)
+
+    assert [backend.consume_now("k", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert backend.consume_now("k", now=0.0) == 1.0
+    assert backend.consume_now("k", now=0.5) == 0.5
+    assert backend.consume_now("k", now=1.5) == 0.0
+
+
+def test_memory_is_bounded_by_lru():
+    """Количество ключей не превышает лимит, старые ключи вытесняются"""
+    backend = InMemoryRateLimitBackend(capacity=1, refill_rate=0.0, max_keys=8, shards=2)
+
+    for i in range(100):
+        backend.consume_now(f"user:{i}", now=0.0)
+
+    assert len(backend) <= 8
+
+
+def test_login_throttle_by_username_and_ip():
+    """Попытки ограничиваются и по имени пользователя, и по IP"""
+    throttle = LoginThrottle(
+        user_backend=InMemoryRateLimitBackend(capacity=2, refill_rate=0.0),
+        ip_backend=InMemoryRateLimitBackend(capacity=3, refill_rate=0.0),
+    )
+
+    async def scenario():
+        assert await throttle.check("Bob", "10.0.0.1") == 0
+        assert await throttle.check("bob ", "10.0.0.2") == 0
+        assert await throttle.check("BOB", "10.0.0.3") > 0
+        assert await throttle.check("alice", "10.0.0.9") == 0
+        assert await throttle.check("carol", "10.0.0.9") == 0
+        assert await throttle.check("dave", "10.0.0.9") == 0
+        assert await throttle.check("erin", "10.0.0.9") > 0
+
+    asyncio.run(scenario())
+    assert throttle.rejected == 2
+
+
+@pytest.mark.parametrize("value", ["0", "-5", "inf", "nan"])
+def test_non_positive_login_rate_is_rejected(monkeypatch, value):
+    """Без пополнения Retry-After был бы бесконечным (OverflowError в math.ceil)"""
+    monkeypatch.setenv("LOGIN_IP_PER_MINUTE", value)
+    with pytest.raises(ValueError, match="LOGIN_IP_PER_MINUTE"):
+        _env_rate("LOGIN_IP_PER_MINUTE", "30")
+    monkeypatch.setenv("LOGIN_IP_PER_MINUTE", "0.5")
+    assert _env_rate("LOGIN_IP_PER_MINUTE", "30") == 0.5
@@ -0,0 +1,93 @@
+"""
+Тесты JSON-ответов через orjson (FastJSONResponse) и формы ответов API пользователей
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import hashing
+from app.auth import get_current_active_user
+from app.bd import User
+from app.main import hashing_queue_full_handler
+from app.responses import FastJSONResponse
+from app.schemas import TokenResponse, UserPageResponse, UserResponse
+
+USER_FIELDS = set(UserResponse.model_fields)
+
+
+@pytest.fixture
+def fast_hashing():
+    """Дешевый bcrypt для регистрации и входа, пул процессов закрывается после теста"""
+    rounds = hashing.get_rounds()
+    hashing.set_rounds(hashing.BCRYPT_MIN_ROUNDS)
+    yield
+    hashing.set_rounds(rounds)
+    hashing.hashing_executor.shutdown()
+
+
+def test_render_matches_standard_json_response():
+    """Дата, None, модель pydantic и нестроковые ключи - как у стандартного JSONResponse"""
+    content = {
+        "created_at": datetime(2024, 5, 1, 12, 30, 15, 250000),
+        "updated_at": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+        "character_name": None,
+        "user": UserResponse(id=1, username="dm", email="dm@ex.com"),
+        "rolls": {20: 1},
+    }
+    fast = orjson.loads(FastJSONResponse(content).body)
+    assert fast == orjson.loads(JSONResponse(jsonable_encoder(content)).body)
+    assert fast["created_at"] == "2024-05-01T12:30:15.250000"
+    assert fast["updated_at"] == "2024-05-01T12:30:00+00:00"
+    assert fast["user"]["character_name"] is None
+
+    with pytest.raises(TypeError):
+        FastJSONResponse({"value": object()})
+
+
+def test_hashing_queue_full_keeps_status_and_retry_after():
+    response = asyncio.run(hashing_queue_full_handler(None, hashing.HashingQueueFull()))
+    assert isinstance(response, FastJSONResponse)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert orjson.loads(response.body) == {"detail": "Сервер перегружен, повторите попытку позже"}
+
+
+def test_user_endpoints_match_response_models(users):
+    """/me, список и страница отдают ровно поля UserResponse, пустое имя персонажа - null"""
+    client, session_factory = users
+    db = session_factory()
+    user = db.query(User).filter(User.username == "user0").one()
+    db.close()
+    client.app.dependency_overrides[get_current_active_user] = lambda: user
+
+    me = client.get("/api/users/me").json()
+    assert me == {"id": user.id, "username": "user0", "email": "user0@ex.com", "character_name": None, "is_active": True}
+
+    listing = client.get("/api/users/", params={"limit": 3}).json()
+    assert [set(item) for item in listing] == [USER_FIELDS] * 3
+    assert [UserResponse(**item).username for item in listing] == ["user0", "user1", "user2"]
+
+    page = client.get("/api/users/page", params={"limit": 3}).json()
+    assert set(page) == {"items", "next_cursor"}
+    assert UserPageResponse(**page).items[0].model_dump() == me
+
+
+def test_register_and_login_return_token_response(users, fast_hashing):
+    client, _ = users
+    registered = client.post("/api/users/register", json={
+        "username": "new_hero", "email": "hero@ex.com", "password": "Passw0rdX",
+        "confirm_password": "Passw0rdX", "character_name": "Арагорн",
+    })
+    assert registered.status_code == 201
+    assert set(registered.json()) == {"access_token", "token_type", "user"}
+    assert set(registered.json()["user"]) == USER_FIELDS
+
+    logged_in = client.post("/api/users/login", data={"username": "hero@ex.com", "password": "Passw0rdX"})
+    assert logged_in.status_code == 200
+    token = TokenResponse(**logged_in.json())
+    assert token.token_type == "bearer"
+    assert token.user.model_dump() == registered.json()["user"]
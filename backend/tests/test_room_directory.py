@@ -0,0 +1,102 @@
+"""
+Тесты каталога игровых комнат
+"""
+import pytest
+
+from app.room_directory import RoomCodeTaken, RoomDirectory, RoomDirectoryError
+from app.room_registry import RoomRegistry
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "username": f"user{user_id}", "character_name": None}
+
+
+def test_codes_are_unique_and_requested_code_is_kept():
+    """Свободный код клиента сохраняется, занятый другим владельцем - заменяется"""
+    directory = RoomDirectory(RoomRegistry())
+
+    room, created = directory.create("ABC123", _user(1), code="abc123")
+    assert created and room.code == "ABC123"
+
+    # Повторное создание своей комнаты возвращает ее же
+    again, created = directory.create("ABC123", _user(1), code="ABC123")
+    assert again is room and not created
+
+    other, created = directory.create("ABC123", _user(2), code="ABC123")
+    assert created and other.code != "ABC123" and len(other.code) == 6
+
+    codes = {directory.create(f"Комната {i}", _user(3 + i))[0].code for i in range(500)}
+    assert len(codes) == 500
+
+    with pytest.raises(RoomDirectoryError):
+        directory.create("ab", _user(1))
+
+    # Команда кластера: занятый код не заменяется, а отклоняется
+    with pytest.raises(RoomCodeTaken):
+        directory.create("Чужая", _user(2), code="ABC123", exact=True)
+    mine, created = directory.create("Своя", _user(2), code="ZZZ999", created_at=1.5, exact=True)
+    assert created and mine.code == "ZZZ999" and mine.created_at == 1.5
+
+
+def test_list_pages_filters_and_player_counts():
+    """Постраничный список по названию, поиск по началу названия и коду, свои комнаты"""
+    registry = RoomRegistry()
+    directory = RoomDirectory(registry)
+    for i in range(25):
+        directory.create(f"Таверна {i:02d}", _user(i % 2))
+    dungeon, _ = directory.create("Подземелье", _user(5))
+
+    registry.connect("a", _user(7))
+    registry.connect("b", _user(7))
+    registry.join("a", dungeon.code)
+    registry.join("b", dungeon.code)
+
+    names = []
+    cursor = None
+    while True:
+        page = directory.list_rooms(query="тав", cursor=cursor, limit=10)
+        names += [room["name"] for room in page["rooms"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert names == [f"Таверна {i:02d}" for i in range(25)]
+
+    found = directory.list_rooms(query=dungeon.code.lower())["rooms"]
+    assert [(room["name"], room["users"]) for room in found] == [("Подземелье", 1)]
+
+    mine = directory.list_rooms(owner_id=1)["rooms"]
+    assert len(mine) == 12 and all(room["owner"]["id"] == 1 for room in mine)
+
+    with pytest.raises(RoomDirectoryError):
+        directory.list_rooms(cursor="не курсор")
+
+
+def test_empty_rooms_expire():
+    """Комната без игроков удаляется через empty_ttl, комната с игроками остается"""
+    registry = RoomRegistry()
+    directory = RoomDirectory(registry, empty_ttl=10)
+    empty, _ = directory.create("Пустая", _user(1))
+    busy, _ = directory.create("Занятая", _user(1))
+    registry.connect("a", _user(2))
+    registry.join("a", busy.code)
+
+    now = empty.empty_since
+    assert directory.expire(now + 5, force=True) == 0
+    assert directory.expire(now + 11, force=True) == 1
+    assert directory.get(empty.code) is None
+    assert directory.get(busy.code) is busy
+    assert [room["code"] for room in directory.list_rooms()["rooms"]] == [busy.code]
+
+
+def test_expired_codes_go_to_hook():
+    """С on_expired комнаты не удаляются на месте: коды уходят обработчику"""
+    handed = []
+    directory = RoomDirectory(RoomRegistry(), empty_ttl=10, on_expired=handed.extend)
+    room, _ = directory.create("Пустая", _user(1))
+
+    now = room.empty_since
+    assert directory.expire(now + 11, force=True) == 1
+    assert handed == [room.code] and directory.get(room.code) is room
+    assert directory.remove_expired(room.code) is room
+    assert directory.remove_expired(room.code) is None
+    assert directory.metrics()["expired"] == 1
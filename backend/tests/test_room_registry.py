@@ -0,0 +1,88 @@
+"""
+Тесты реестра подключений и комнат Socket.IO
+"""
+from app.room_registry import RoomRegistry
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "username": f"user{user_id}", "character_name": None}
+
+
+def test_join_leave_and_disconnect():
+    """Обратные индексы обновляются при входе, выходе и отключении"""
+    registry = RoomRegistry()
+    registry.connect("a", _user(1))
+    registry.connect("b", _user(1))
+    registry.connect("c", _user(2))
+
+    assert registry.join("a", "r1")
+    assert not registry.join("a", "r1")
+    assert registry.join("a", "r2")
+    assert registry.join("c", "r1")
+    assert registry.member_count("r1") == 2
+    assert registry.user_sids(1) == {"a", "b"}
+
+    user_info, rooms = registry.disconnect("a")
+    assert user_info["id"] == 1
+    assert sorted(rooms) == ["r1", "r2"]
+    assert registry.members("r1") == {"c"}
+    assert not registry.has_room("r2")
+    assert registry.user_sids(1) == {"b"}
+
+    assert registry.leave("c", "r1")
+    assert not registry.leave("c", "r1")
+    assert not registry.has_room("r1")
+    assert registry.disconnect("missing") == (None, [])
+
+
+def test_online_users_cache_is_invalidated():
+    """Кешированный список пользователей обновляется при изменении состава"""
+    registry = RoomRegistry()
+    registry.connect("a", _user(1))
+    registry.join("a", "r1")
+    first = registry.online_users("r1")
+    assert registry.online_users("r1") is first
+
+    registry.connect("b", _user(2))
+    registry.join("b", "r1")
+    assert sorted(user["id"] for user in registry.online_users("r1")) == [1, 2]
+    assert len(registry.online_users()) == 2
+
+    registry.disconnect("b")
+    assert [user["id"] for user in registry.online_users("r1")] == [1]
+    assert len(registry.online_users()) == 1
+
+
+def test_presence_deltas_since_version():
+    """Клиент с версией получает только изменения, отставший - полный список"""
+    registry = RoomRegistry(presence_log_size=4)
+    registry.connect("a", _user(1))
+    registry.join("a", "r1")
+    first = registry.presence_since("r1", None)
+    assert first["snapshot"] and first["count"] == 1
+
+    registry.connect("b", _user(2))
+    registry.join("b", "r1")
+    registry.connect("c", _user(3))
+    registry.join("c", "r1")
+    registry.leave("c", "r1")
+    # Вторая вкладка того же пользователя не меняет присутствие
+    registry.connect("a2", _user(1))
+    registry.join("a2", "r1")
+
+    delta = registry.presence_since("r1", first["version"], first["epoch"])
+    assert not delta["snapshot"]
+    assert [user["id"] for user in delta["added"]] == [2]
+    assert delta["removed"] == [3]
+    assert delta["count"] == 2
+
+    unchanged = registry.presence_since("r1", delta["version"], delta["epoch"])
+    assert unchanged["added"] == [] and unchanged["removed"] == []
+    assert registry.presence_since("r1", delta["version"], "other-epoch")["snapshot"]
+
+    # Журнал на 4 изменения: старая версия уже вытеснена
+    for i in range(4, 9):
+        registry.connect(f"s{i}", _user(i))
+        registry.join(f"s{i}", "r1")
+    stale = registry.presence_since("r1", first["version"], first["epoch"])
+    assert stale["snapshot"] and stale["count"] == 7
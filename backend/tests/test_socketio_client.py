@@ -32,14 +32,6 @@ async def test_socketio():
     async def disconnect():
         print("❌ Отключено от сервера")
     
-    @sio.event
-    async def user_joined(data):
-        print(f"👤 Пользователь присоединился: {data}")
-    
-    @sio.event
-    async def user_left(data):
-        print(f"👤 Пользователь вышел: {data}")
-    
     @sio.event
     async def chat_message(data):
         print(f"💬 Сообщение от {data['username']}: {data['message']}")
@@ -48,13 +40,16 @@ async def test_socketio():
     async def dice_rolled(data):
         print(f"🎲 {data['username']} бросил {data['dice_type']}: {data['result']}")
     
-    @sio.event
-    async def user_joined_room(data):
-        print(f"🚪 {data['username']} присоединился к комнате {data['room_id']}")
+    # Изменения состава комнаты (приходят пачкой раз в несколько сотен мс)
+    known_users = {}
     
     @sio.event
-    async def user_left_room(data):
-        print(f"🚪 {data['username']} покинул комнату {data['room_id']}")
+    async def presence(data):
+        for user in data['added']:
+            known_users[user['id']] = user['username']
+            print(f"🚪 {user['username']} присоединился к комнате {data['room_id']}")
+        for user_id in data['removed']:
+            print(f"🚪 {known_users.get(user_id, f'ID {user_id}')} покинул комнату {data['room_id']}")
     
     try:
         # Подключение к серверу с токеном
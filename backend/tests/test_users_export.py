@@ -0,0 +1,44 @@
+"""
+Тесты потокового экспорта пользователей (/api/users/export)
+"""
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import routes_users
+from app.crud import bulk_insert_users
+from app.crud_async import stream_users
+
+
+def test_export_streams_every_user_as_ndjson(users, tmp_path, monkeypatch):
+    """Каждая строка - один пользователь по порядку id, пачки курсора не теряют и не повторяют строк"""
+    client, session_factory = users
+    db = session_factory()
+    bulk_insert_users(db, [{"username": "bard", "email": "bard@ex.com", "hashed_password": "x", "character_name": "Лютик"}])
+    db.close()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}", poolclass=NullPool)
+    sessions = []
+
+    class TrackedSession(AsyncSession):
+        async def close(self):
+            sessions.append("closed")
+            await super().close()
+
+    monkeypatch.setattr(routes_users, "AsyncSessionLocal", async_sessionmaker(engine, class_=TrackedSession))
+    # Маленькие пачки: курсор дочитывает таблицу за несколько выборок
+    monkeypatch.setattr(routes_users, "stream_users", lambda db: stream_users(db, batch_size=3))
+
+    response = client.get("/api/users/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.text.endswith("\n")
+
+    lines = response.text.splitlines()
+    rows = [orjson.loads(line) for line in lines]
+    assert [row["username"] for row in rows] == [f"user{i}" for i in range(7)] + ["bard"]
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+    assert rows[0]["character_name"] is None and rows[-1]["character_name"] == "Лютик"
+    assert all(set(row) == {"id", "username", "email", "character_name", "is_active"} for row in rows)
+    # Сессия экспорта закрывается после отправки последней строки
+    assert sessions == ["closed"]
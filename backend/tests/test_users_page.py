@@ -0,0 +1,53 @@
+"""
+Тесты курсорной пагинации списка пользователей (/api/users/page)
+"""
+import base64
+
+import pytest
+from sqlalchemy import delete
+
+from app.bd import User
+from app.crud import bulk_insert_users
+from app.routes_users import encode_cursor
+
+
+def _rows(start: int, stop: int) -> list:
+    return [{"username": f"user{i}", "email": f"user{i}@ex.com", "hashed_password": "x"} for i in range(start, stop)]
+
+
+def test_pages_are_stable_under_inserts_and_deletes(users):
+    """Изменения таблицы между страницами не дают повторов и пропусков"""
+    client, session_factory = users
+    first = client.get("/api/users/page", params={"limit": 3}).json()
+    assert [item["username"] for item in first["items"]] == ["user0", "user1", "user2"]
+
+    # Удаление уже показанной строки и новые строки не сдвигают следующую страницу
+    db = session_factory()
+    db.execute(delete(User).where(User.username == "user1"))
+    db.commit()
+    bulk_insert_users(db, _rows(7, 9))
+    db.close()
+
+    seen = [item["username"] for item in first["items"]]
+    cursor = first["next_cursor"]
+    while cursor:
+        page = client.get("/api/users/page", params={"limit": 3, "cursor": cursor}).json()
+        seen += [item["username"] for item in page["items"]]
+        cursor = page["next_cursor"]
+    assert seen == [f"user{i}" for i in range(9)]
+
+
+@pytest.mark.parametrize("cursor", [
+    "!!!",
+    base64.urlsafe_b64encode(b"no-colon").decode(),
+    base64.urlsafe_b64encode(b"user:5").decode(),
+    base64.urlsafe_b64encode(b"id:abc").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe:1").decode(),
+    "курсор",
+])
+def test_bad_cursor_is_rejected(users, cursor):
+    """Поврежденный курсор - 400, а не 500"""
+    client, _ = users
+    response = client.get("/api/users/page", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert client.get("/api/users/page", params={"cursor": encode_cursor(3)}).json()["items"][0]["username"] == "user3"
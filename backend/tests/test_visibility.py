@@ -0,0 +1,86 @@
+"""
+Тесты тумана войны
+"""
+import base64
+
+import numpy as np
+
+from app.battle_map import BattleMap, BattleMaps
+from app.visibility import RoomVisibility
+
+
+def _bits(payload: dict, width: int, height: int, previous: np.ndarray = None) -> np.ndarray:
+    """Маска из события 'visibility', как ее собирает клиент"""
+    if "full" in payload:
+        packed = np.frombuffer(base64.b64decode(payload["full"]), dtype=np.uint8).copy()
+    else:
+        packed = np.packbits(previous)
+        for offset, xor in payload["runs"]:
+            chunk = np.frombuffer(base64.b64decode(xor), dtype=np.uint8)
+            packed[offset:offset + len(chunk)] ^= chunk
+    return np.unpackbits(packed)[:width * height].astype(bool).reshape(height, width)
+
+
+def test_walls_block_line_of_sight():
+    """Стена видна, клетки за ней - нет; дальность зрения - круг"""
+    battle_map = BattleMap(20, 16)
+    battle_map.set_walls([[6, y] for y in range(16)])
+    battle_map.place("Разведчик", 2, 8, owner_id=1, vision=30)
+
+    room = RoomVisibility(battle_map)
+    mask = _bits(room.update({"sid1": 1})["sid1"], 20, 16)
+    assert mask[8, 2] and mask[8, 5] and mask[8, 6]
+    assert not mask[8, 7]
+    # 6 клеток вверх видно, а (5, 2) уже за кругом, хотя по 5e до нее тоже 30 футов
+    assert mask[2, 2] and not mask[2, 5]
+    assert (mask == room.mask(1)).all()
+
+
+def test_only_changed_fields_and_players_are_updated():
+    """Движение фишки пересчитывает только ее поле и шлет XOR только ее игроку"""
+    battle_map = BattleMap(40, 40)
+    scout = battle_map.place("Разведчик", 5, 5, owner_id=1, vision=30)
+    battle_map.place("Жрец", 30, 30, owner_id=2, vision=30)
+    viewers = {"a": 1, "b": 2, "a2": 1}
+
+    room = RoomVisibility(battle_map)
+    first = room.update(viewers)
+    assert set(first) == {"a", "b", "a2"} and room.recomputed == 2
+
+    battle_map.move(scout.id, 6, 5)
+    delta = room.update(viewers)
+    assert set(delta) == {"a", "a2"} and room.recomputed == 3
+    assert delta["a"]["base"] == 1 and delta["a"]["version"] == 2
+    previous = _bits(first["a"], 40, 40)
+    assert (_bits(delta["a"], 40, 40, previous) == room.mask(1)).all()
+
+    battle_map.set_walls([[39, 0]])  # вне обоих кругов
+    assert room.update(viewers) == {} and room.recomputed == 3
+    battle_map.set_walls([[8, 5]])
+    assert set(room.update(viewers)) == {"a", "a2"} and room.recomputed == 4
+
+
+def test_players_get_only_visible_tokens():
+    """Игрок получает свои фишки и те, что видит; чужие за стеной - нет"""
+    maps = BattleMaps()
+    dm = {"actor": 9, "dm": True}
+    maps.execute("r", "create", {**dm, "width": 30, "height": 16})
+    maps.execute("r", "walls", {**dm, "cells": [[10, y] for y in range(16)]})
+    scout = maps.execute("r", "place", {**dm, "name": "Разведчик", "x": 2, "y": 8, "owner_id": 1, "vision": 30})[1]["token"]
+    orc = maps.execute("r", "place", {**dm, "name": "Орк", "x": 4, "y": 8})[1]["token"]
+    ogre = maps.execute("r", "place", {**dm, "name": "Огр", "x": 15, "y": 7, "size": 2})[1]["token"]
+    viewers = {"a": 1}
+
+    room = RoomVisibility(maps.get("r"))
+    room.update(viewers)
+    assert room.tokens(viewers)["a"] == (set(), {scout["id"], orc["id"]})
+
+    # Огр подходит: в поле зрения только нижняя левая клетка фишки 2x2 - она видна
+    maps.execute("r", "move", {**dm, "id": ogre["id"], "x": 7, "y": 4})
+    room.update(viewers)
+    assert room.tokens(viewers)["a"] == ({scout["id"], orc["id"]}, {scout["id"], orc["id"], ogre["id"]})
+
+    # Промежуточные положения: за стеной фишку не видно, свою - всегда
+    moves = [{"id": ogre["id"], "x": 15, "y": 2}, {"id": orc["id"], "x": 5, "y": 8}, {"id": scout["id"], "x": 20, "y": 8}]
+    assert room.moves(viewers, moves) == {"a": moves[1:]}
+    assert room.moves({"b": 2}, moves) == {}
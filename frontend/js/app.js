@@ -41,7 +41,14 @@ document.addEventListener('DOMContentLoaded', async () => {
     // Отображаем имя пользователя
     document.getElementById('username').textContent = currentUser.username;
     
-    // Инициализируем Socket.IO
+    // Инициализируем Socket.IO (сборка клиента зависит от SOCKET_SERIALIZER)
+    try {
+        await loadSocketClient();
+    } catch (error) {
+        console.error(error);
+        addSystemMessage('Не удалось загрузить клиент Socket.IO');
+        return;
+    }
     initSocket();
     
     // Привязываем обработчики
@@ -83,14 +90,17 @@ function initSocket() {
     // Присоединение к комнате
     socket.on('room_joined', (data) => {
         currentRoom = data.room;
-        document.getElementById('currentRoom').textContent = `Комната: ${data.room}`;
+        document.getElementById('currentRoom').textContent = `Комната: ${data.name} (${data.room})`;
         document.getElementById('messageInput').disabled = false;
         document.querySelector('#messageForm button').disabled = false;
         
         // Очищаем чат
         document.getElementById('messagesArea').innerHTML = '';
         
-        addSystemMessage(`Вы присоединились к комнате "${data.room}"`);
+        addSystemMessage(`Вы присоединились к комнате "${data.name}"`);
+        
+        // Обновляем число игроков в списке
+        socket.emit('get_rooms');
     });
     
     // Выход из комнаты
@@ -123,6 +133,13 @@ function initSocket() {
         updateOnlineUsers(data.users);
     });
     
+    // Пакет событий комнаты: каждое событие передается своему обработчику
+    socket.on('events', (batch) => {
+        batch.forEach(({ event, data }) => {
+            socket.listeners(event).forEach((handler) => handler(data));
+        });
+    });
+    
     // Запрашиваем список комнат
     setTimeout(() => {
         socket.emit('get_rooms');
@@ -166,8 +183,8 @@ function updateRoomsList(rooms) {
     }
     
     roomsList.innerHTML = rooms.map(room => `
-        <div class="room-item ${currentRoom === room.name ? 'active' : ''}" onclick="joinRoom('${room.name}')">
-            <div class="room-name">${room.name}</div>
+        <div class="room-item ${currentRoom === room.code ? 'active' : ''}" onclick="joinRoom('${room.code}')">
+            <div class="room-name">${escapeHtml(room.name)} <span class="text-xs">${room.code}</span></div>
             <div class="room-users">👥 ${room.users} ${getUsersWord(room.users)}</div>
         </div>
     `).join('');
@@ -204,13 +221,20 @@ function createRoom() {
         return;
     }
     
-    socket.emit('create_room', { room: roomName });
     document.getElementById('roomNameInput').value = '';
-    
-    // Автоматически присоединяемся к созданной комнате
-    setTimeout(() => {
-        joinRoom(roomName);
-    }, 500);
+    openRoom(roomName);
+}
+
+// Создание комнаты (или получение своей по коду) и вход в нее
+function openRoom(room) {
+    socket.emit('create_room', { room: room }, (response) => {
+        if (response.error) {
+            addSystemMessage(response.error);
+            return;
+        }
+        // Сервер может выдать другой код, если предложенный занят
+        joinRoom(response.room);
+    });
 }
 
 // Присоединение к комнате
@@ -358,6 +382,15 @@ function setupRoleBasedUI() {
             Вы можете присоединяться к существующим комнатам
         `;
         roomsPanel.insertBefore(infoDiv, roomsPanel.firstChild);
+        
+        // Если введен код комнаты, присоединяемся к ней
+        if (roomCode) {
+            setTimeout(() => {
+                if (socket && socket.connected) {
+                    joinRoom(roomCode);
+                }
+            }, 1000);
+        }
     } else if (role === 'master') {
         // Для мастера: добавляем информационное сообщение
         const roomsPanel = document.querySelector('#roomsList').parentElement;
@@ -375,10 +408,7 @@ function setupRoleBasedUI() {
             // Ждем инициализации socket
             setTimeout(() => {
                 if (socket && socket.connected) {
-                    socket.emit('create_room', { room: roomCode });
-                    setTimeout(() => {
-                        joinRoom(roomCode);
-                    }, 500);
+                    openRoom(roomCode);
                 }
             }, 1000);
         }
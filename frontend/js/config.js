@@ -11,9 +11,32 @@ const API_CONFIG = {
         USERS: '/api/users/',
         HEALTH: '/health'
     },
-    SOCKET_URL: 'http://127.0.0.1:8000'
+    SOCKET_URL: 'http://127.0.0.1:8000',
+    // Должно совпадать с SOCKETIO_SERIALIZER на сервере: 'json' или 'msgpack'
+    SOCKET_SERIALIZER: 'json'
 };
 
+// Сборки клиента Socket.IO для каждого способа кодирования пакетов
+const SOCKET_CLIENT_BUNDLES = {
+    json: 'https://cdn.socket.io/4.5.4/socket.io.min.js',
+    msgpack: 'https://cdn.socket.io/4.5.4/socket.io.msgpack.min.js'
+};
+
+// Загрузка клиента Socket.IO, подходящего под SOCKET_SERIALIZER
+function loadSocketClient() {
+    if (window.io) {
+        return Promise.resolve(window.io);
+    }
+    const src = SOCKET_CLIENT_BUNDLES[API_CONFIG.SOCKET_SERIALIZER] || SOCKET_CLIENT_BUNDLES.json;
+    return new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = src;
+        script.onload = () => resolve(window.io);
+        script.onerror = () => reject(new Error(`Не удалось загрузить клиент Socket.IO: ${src}`));
+        document.head.appendChild(script);
+    });
+}
+
 // Ключи для localStorage
 const STORAGE_KEYS = {
     TOKEN: 'dnd_auth_token',